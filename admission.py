@@ -0,0 +1,124 @@
+# admission.py
+import math
+import threading
+
+from config import STATUS_POLL_INTERVAL, MAX_QUEUE_WAIT
+from commands import STS2_MAP
+
+# Valor de STS2 que indica que la impresora puede operar.
+# Referencia: Manual, Página 19, Tabla 8.
+STS2_NO_ERROR = b"\x40"
+
+
+class AdmissionController:
+    """
+    Decide si la API puede aceptar un nuevo documento fiscal.
+
+    Rechaza peticiones cuando la impresora reporta un error (sin papel, gaveta
+    abierta, etc.) o cuando el trabajo pendiente en cola, estimado con el
+    tiempo de servicio medido, no se puede atender dentro de MAX_QUEUE_WAIT.
+    """
+
+    def __init__(
+        self,
+        max_queue_wait=MAX_QUEUE_WAIT,
+        retry_interval=STATUS_POLL_INTERVAL,
+    ):
+        self.max_queue_wait = max_queue_wait
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._printer_error = None  # Descripción del error actual, None si no hay
+        self.last_status = (None, None)  # Último (STS1, STS2) leído con ENQ
+        self._pauses = {}  # Pausas de la admisión por dueño (ej: Reporte Z)
+        self._rejected = 0
+
+    # --- Estado de la impresora (alimentado por el monitor de status) ---
+
+    def update_status(self, sts1_byte, sts2_byte):
+        """Actualiza el estado de salud a partir de una respuesta ENQ."""
+        with self._lock:
+            self.last_status = (sts1_byte, sts2_byte)
+            if sts1_byte is None:
+                self._printer_error = "La impresora no respondió al ENQ."
+            elif sts2_byte == STS2_NO_ERROR:
+                if self._printer_error:
+                    print(
+                        "Impresora sin errores. Se reanuda la admisión de documentos."
+                    )
+                self._printer_error = None
+            else:
+                error = STS2_MAP.get(
+                    sts2_byte, f"Error Desconocido ({sts2_byte.hex()})"
+                )
+                if error != self._printer_error:
+                    print(f"Impresora en error ({error}). Se suspende la admisión.")
+                self._printer_error = error
+
+    # --- Pausa de la admisión (cierre diario, detención del servidor) ---
+
+    def pause(self, key, reason):
+        """
+        Deja de admitir documentos hasta que el dueño 'key' llame a
+        resume(key). Cada dueño (ej: "z_closing", "server_stop") tiene su propia
+        pausa: la admisión se reanuda recién cuando no queda ninguna.
+        """
+        with self._lock:
+            self._pauses[key] = reason
+        print(f"Admisión de documentos suspendida: {reason}")
+
+    def resume(self, key):
+        """Quita la pausa de 'key'. Las pausas de otros dueños se mantienen."""
+        with self._lock:
+            removed = self._pauses.pop(key, None)
+            accepting = not self._pauses
+        if removed and accepting:
+            print("Se reanuda la admisión de documentos.")
+
+    def _pause_reason(self):
+        # La pausa más reciente, con el lock tomado.
+        return next(reversed(self._pauses.values()), None)
+
+    # --- Cola de documentos ---
+
+    def check(self, backlog_seconds=0.0, predicted_seconds=0.0):
+        """
+        Devuelve None si se puede aceptar un documento nuevo. En caso contrario
+        devuelve una tupla (código HTTP, segundos para Retry-After, mensaje).
+
+        backlog_seconds es el trabajo estimado que ya está en cola y
+        predicted_seconds la duración estimada del documento que se quiere encolar.
+        """
+        with self._lock:
+            if self._pauses:
+                self._rejected += 1
+                return (503, math.ceil(self.retry_interval), self._pause_reason())
+            if self._printer_error:
+                self._rejected += 1
+                return (
+                    503,
+                    math.ceil(self.retry_interval),
+                    f"Impresora no disponible: {self._printer_error}",
+                )
+
+            # Un documento siempre se admite si la cola está vacía, aunque por
+            # sí solo tarde más que MAX_QUEUE_WAIT.
+            excess = backlog_seconds + predicted_seconds - self.max_queue_wait
+            if backlog_seconds > 0 and excess > 0:
+                self._rejected += 1
+                return (
+                    429,
+                    math.ceil(excess),
+                    f"Cola de impresión llena ({backlog_seconds:.0f} s de trabajo pendiente).",
+                )
+        return None
+
+    def snapshot(self):
+        """Resumen del estado de admisión para exponer en la API."""
+        with self._lock:
+            return {
+                "accepting": self._printer_error is None and not self._pauses,
+                "printer_error": self._printer_error,
+                "paused": self._pause_reason(),
+                "max_queue_wait_seconds": self.max_queue_wait,
+                "rejected_total": self._rejected,
+            }
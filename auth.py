@@ -0,0 +1,196 @@
+# auth.py
+import hashlib
+import json
+import math
+import threading
+import time
+
+from config import (
+    API_KEYS_FILE,
+    API_DEFAULT_DOCUMENTS_PER_MINUTE,
+    API_DEFAULT_DOCUMENT_BURST,
+    API_DEFAULT_STATUS_PER_SECOND,
+    API_DEFAULT_MAX_QUEUED,
+)
+
+# Cabecera con la clave del cliente.
+API_KEY_HEADER = "X-API-Key"
+
+
+def _digest(key):
+    # Las claves se guardan y comparan como SHA-256, no en texto plano.
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """
+    Balde de fichas: se llena a 'rate' fichas por segundo hasta 'capacity'.
+    Cada operación consume una ficha; sin fichas, la operación se rechaza.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Consume una ficha. Devuelve 0 si se pudo, o los segundos a esperar."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class ApiClient:
+    """
+    Un cliente de la API (terminal, POS, integración) con sus límites y uso.
+    Con limited=False solo se cuenta el uso, sin límites de ritmo ni de cola.
+    """
+
+    def __init__(
+        self,
+        name,
+        documents_per_minute=API_DEFAULT_DOCUMENTS_PER_MINUTE,
+        document_burst=API_DEFAULT_DOCUMENT_BURST,
+        status_per_second=API_DEFAULT_STATUS_PER_SECOND,
+        max_queued=API_DEFAULT_MAX_QUEUED,
+        limited=True,
+    ):
+        self.name = name
+        self.limited = limited
+        self.documents_per_minute = float(documents_per_minute)
+        self.status_per_second = float(status_per_second)
+        self.max_queued = int(max_queued)
+        self._documents = TokenBucket(self.documents_per_minute / 60.0, document_burst)
+        self._status = TokenBucket(self.status_per_second, max(1.0, status_per_second))
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.counters = dict.fromkeys(
+            (
+                "documents_accepted",
+                "documents_rate_limited",
+                "documents_over_quota",
+                "status_calls",
+                "status_rate_limited",
+            ),
+            0,
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def allow_document(self):
+        """Devuelve 0 si el ritmo permite un documento más, o los segundos a esperar."""
+        wait = self._documents.take() if self.limited else 0.0
+        if wait:
+            self._count("documents_rate_limited")
+        return wait
+
+    def allow_status(self):
+        wait = self._status.take() if self.limited else 0.0
+        self._count("status_rate_limited" if wait else "status_calls")
+        return wait
+
+    def reserve_slot(self):
+        """Reserva un lugar en la cola para un documento (cuota por cliente)."""
+        with self._lock:
+            if self.limited and self.queued >= self.max_queued:
+                self.counters["documents_over_quota"] += 1
+                return False
+            self.queued += 1
+            self.counters["documents_accepted"] += 1
+            return True
+
+    def release_slot(self):
+        with self._lock:
+            self.queued = max(0, self.queued - 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "limited": self.limited,
+                "documents_per_minute": self.documents_per_minute,
+                "status_per_second": self.status_per_second,
+                "max_queued": self.max_queued,
+                "queued": self.queued,
+                **self.counters,
+            }
+
+
+class Authenticator:
+    """
+    Claves de API cargadas de API_KEYS_FILE. Si el archivo no existe la API
+    queda abierta (como antes): todas las peticiones usan un cliente anónimo
+    sin límites, del que solo se cuenta el uso. Lanza ValueError si el
+    archivo existe pero no es válido.
+    """
+
+    def __init__(self, path=API_KEYS_FILE):
+        self.path = path
+        self._clients = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = None
+        except ValueError as e:
+            raise ValueError(f"{path} no es un JSON válido: {e}")
+        self.enabled = raw is not None
+        if not self.enabled:
+            print(f"Sin {path}: la API no exige clave (cliente anónimo).")
+            self.anonymous = ApiClient("anonimo", limited=False)
+            return
+        if not isinstance(raw, dict):
+            raise ValueError(f"{path} debe ser un objeto {{clave: límites}}.")
+        for key, limits in raw.items():
+            if not isinstance(limits, (dict, type(None))):
+                raise ValueError(
+                    f"Los límites de una clave en {path} deben ser un objeto."
+                )
+            limits = dict(limits or {})
+            name = limits.pop("name", f"cliente-{len(self._clients) + 1}")
+            try:
+                self._clients[_digest(key)] = ApiClient(name, **limits)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Límites inválidos para '{name}' en {path}: {e}")
+        print(f"API con autenticación: {len(self._clients)} claves.")
+
+    def client_for(self, key):
+        """Cliente de la clave dada, o None si no es válida."""
+        if not self.enabled:
+            return self.anonymous
+        if not key:
+            return None
+        return self._clients.get(_digest(key))
+
+    def clients(self):
+        if not self.enabled:
+            return [self.anonymous]
+        return list(self._clients.values())
+
+    def usage(self):
+        """Uso por cliente, para exponer en /metrics."""
+        return [client.to_dict() for client in self.clients()]
+
+
+_authenticator = None
+_authenticator_lock = threading.Lock()
+
+
+def get_authenticator():
+    """Devuelve (cargándolas si hace falta) las claves de la aplicación."""
+    global _authenticator
+    with _authenticator_lock:
+        if _authenticator is None:
+            _authenticator = Authenticator()
+        return _authenticator
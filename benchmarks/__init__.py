@@ -0,0 +1,6 @@
+# benchmarks
+# Benchmarks contra el emulador de impresora (ver emulator.py).
+# Se ejecutan desde la raíz del proyecto, por ejemplo:
+#   python -m benchmarks.bench_baudrate
+# Los caminos calientes se comparan con una línea base guardada:
+#   python -m benchmarks.bench_hotpaths
@@ -0,0 +1,91 @@
+# benchmarks/bench_baudrate.py
+# Mide el rendimiento de la línea serial a cada velocidad soportada usando el emulador:
+# bytes por segundo en una lectura larga (U0X) y latencia de una factura completa.
+import argparse
+import contextlib
+import io
+import time
+
+import commands
+from communication import FiscalPrinter
+from config import SUPPORTED_BAUDRATES
+from emulator import get_emulator
+
+
+def _invoice_commands(num_items):
+    """Comandos de una factura con num_items ítems, como los arma send_full_invoice."""
+    frames = ["iR*V-12345678", "iS*Cliente de Benchmark"]
+    for i in range(num_items):
+        frames.append(
+            f"{commands.TAX_RATE_COMMANDS['Tasa General (G)']}"
+            f"{commands._format_price(12.5)}{commands._format_quantity(2)}"
+            f"Producto de prueba {i:03d}"
+        )
+    frames.append("101")
+    return frames
+
+
+def bench_rate(baudrate, num_items, repeat):
+    port = f"emu://bench-{baudrate}"
+    get_emulator(port, printer_baudrate=baudrate)
+    printer = FiscalPrinter(port=port, baudrate=baudrate, autobaud=False)
+
+    # Los mensajes de depuración de FiscalPrinter no deben contar en la medición.
+    with contextlib.redirect_stdout(io.StringIO()):
+        printer.connect()
+
+        start = time.perf_counter()
+        received = 0
+        for _ in range(repeat):
+            received += len(printer.send_command("U0X"))
+        read_seconds = time.perf_counter() - start
+
+        frames = _invoice_commands(num_items)
+        sent_bytes = sum(len(f) + 3 for f in frames)  # STX + ETX + LRC
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for frame in frames:
+                printer.send_command(frame)
+        doc_seconds = (time.perf_counter() - start) / repeat
+
+        printer.close()
+
+    return {
+        "baudrate": baudrate,
+        "u0x_bytes_per_second": received / read_seconds,
+        "document_bytes": sent_bytes,
+        "document_bytes_per_second": sent_bytes / doc_seconds,
+        "document_latency_ms": doc_seconds * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rendimiento de la línea serial por velocidad (emulador)."
+    )
+    parser.add_argument("--items", type=int, default=20, help="Ítems por factura")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por caso")
+    parser.add_argument(
+        "--rates",
+        type=int,
+        nargs="*",
+        default=SUPPORTED_BAUDRATES,
+        help="Velocidades a medir",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'Baudios':>8} {'U0X B/s':>10} {'Doc bytes':>10} {'Doc B/s':>10} "
+        f"{'Latencia doc (ms)':>18}"
+    )
+    for baudrate in args.rates:
+        r = bench_rate(baudrate, args.items, args.repeat)
+        print(
+            f"{r['baudrate']:>8} {r['u0x_bytes_per_second']:>10.0f} "
+            f"{r['document_bytes']:>10} {r['document_bytes_per_second']:>10.0f} "
+            f"{r['document_latency_ms']:>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/bench_encoding.py
+# Mide el costo por línea de codificar los ítems de una factura grande: el camino
+# ítem por ítem (formatear cada campo y armar cada trama por separado) contra el
+# codificador en lote de commands.encode_item_frames. No usa la impresora.
+import argparse
+import time
+from decimal import Decimal
+
+import commands
+from communication import FiscalPrinter
+
+
+def _sample_items(num_items):
+    return [
+        {
+            "desc": f"Producto mayorista {i:04d}",
+            "price": Decimal("19.99") + i,
+            "qty": Decimal("2.500"),
+            "tax_rate": "Tasa General (G)",
+        }
+        for i in range(num_items)
+    ]
+
+
+def _encode_per_item(items):
+    """Codificación ítem por ítem, como se hacía antes del codificador en lote."""
+    frames = []
+    for item in items:
+        command = (
+            f"{commands.TAX_RATE_COMMANDS[item['tax_rate']]}"
+            f"{commands._format_price(item['price'])}"
+            f"{commands._format_quantity(item['qty'])}{item['desc']}"
+        )
+        frames.append(FiscalPrinter.build_frame(command))
+    return frames
+
+
+def _encode_batch(items):
+    """Solo la etapa de codificación en lote (los montos ya están validados)."""
+    _, frames = commands.encode_item_frames(
+        [commands.TAX_RATE_COMMANDS[item["tax_rate"]] for item in items],
+        [commands.to_cents(item["price"]) for item in items],
+        [commands.to_millis(item["qty"]) for item in items],
+        [item["desc"] for item in items],
+    )
+    return frames
+
+
+def _compile(items):
+    return commands.compile_invoice({"rif": "V-12345678"}, items)
+
+
+def _per_line_microseconds(func, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(items)
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Costo por línea de la codificación de ítems."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[10, 100, 500, 2000],
+        help="Cantidad de ítems por documento",
+    )
+    parser.add_argument("--repeat", type=int, default=50, help="Repeticiones por caso")
+    args = parser.parse_args()
+
+    print(
+        f"{'Ítems':>6} {'Por ítem (µs/línea)':>20} {'Lote (µs/línea)':>16} "
+        f"{'Compilar (µs/línea)':>20}"
+    )
+    for size in args.sizes:
+        items = _sample_items(size)
+        # Ambos caminos deben producir exactamente las mismas tramas.
+        assert _encode_per_item(items) == _encode_batch(items)
+        per_item = _per_line_microseconds(_encode_per_item, items, args.repeat)
+        batch = _per_line_microseconds(_encode_batch, items, args.repeat)
+        compiled = _per_line_microseconds(_compile, items, args.repeat)
+        print(f"{size:>6} {per_item:>20.2f} {batch:>16.2f} {compiled:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# benchmarks/bench_hotpaths.py
+# Microbenchmarks de los caminos calientes del protocolo y del parseo, con una
+# línea base guardada en benchmarks/baseline.json. Termina con error (código 1)
+# si algún caso empeora más que la tolerancia respecto de la línea base:
+#   python -m benchmarks.bench_hotpaths                    # comparar
+#   python -m benchmarks.bench_hotpaths --update-baseline  # guardar la línea base
+# Los tiempos dependen de la máquina: la línea base se regenera en cada equipo
+# donde se use como control.
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import timeit
+from decimal import Decimal
+
+import commands
+import emulator
+from communication import FiscalPrinter
+from models import ReportXData, S5PrinterData
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.30  # 30 % más lento que la línea base se considera regresión
+
+_ITEM_COMMAND = "!000000199900002500Producto mayorista 0001"
+_S5_TRAMA = "S5\nJ-312171197\nZ1F9999988\n0001\n2048\n1980\n000123"
+_INVOICE = {
+    "customer_data": {"rif": "V-12345678", "name": "Cliente de Benchmark"},
+    "items": [
+        {
+            "desc": f"Producto de prueba {i:03d}",
+            "price": Decimal("12.50"),
+            "qty": Decimal("2"),
+            "tax_rate": "Tasa General (G)",
+        }
+        for i in range(10)
+    ],
+}
+
+
+_UNLIMITED_CLIENT = {
+    "name": "benchmark",
+    "documents_per_minute": 1e9,
+    "document_burst": 10**9,
+    "status_per_second": 1e9,
+}
+
+
+class _BufferedSerial:
+    """Puerto con una respuesta ya recibida, para medir solo la lectura y el armado."""
+
+    def __init__(self, response):
+        self.response = response
+        self._position = 0
+
+    def rewind(self):
+        self._position = 0
+
+    def read(self, size=1):
+        chunk = self.response[self._position : self._position + size]
+        self._position += len(chunk)
+        return chunk
+
+    def read_until(self, expected=b"\n"):
+        end = self.response.find(expected, self._position)
+        end = len(self.response) if end < 0 else end + len(expected)
+        chunk = self.response[self._position : end]
+        self._position = end
+        return chunk
+
+
+def _emulated_printer(port, baudrate):
+    emulator.get_emulator(port, printer_baudrate=baudrate)
+    printer = FiscalPrinter(port=port, baudrate=baudrate, autobaud=False)
+    printer.connect()
+    return printer
+
+
+# --- Casos: cada uno devuelve la función a medir (ya preparada) ---
+
+
+def case_lrc():
+    data = _ITEM_COMMAND.encode("ascii")
+    return lambda: FiscalPrinter._calculate_lrc(data)
+
+
+def case_build_frame():
+    return lambda: FiscalPrinter.build_frame(_ITEM_COMMAND)
+
+
+def case_read_response():
+    report = emulator.PrinterEmulator()._report_x_trama()
+    printer = FiscalPrinter(port="bench")
+    printer.serial_connection = _BufferedSerial(emulator._data_frame(report))
+
+    def read():
+        printer.serial_connection.rewind()
+        return printer.read_response()
+
+    return read
+
+
+def case_report_x_from_trama():
+    trama = emulator.PrinterEmulator()._report_x_trama()
+    return lambda: ReportXData.from_trama(trama)
+
+
+def case_s5_from_trama():
+    return lambda: S5PrinterData.from_trama(_S5_TRAMA)
+
+
+def case_format_price_quantity():
+    price, qty = Decimal("1234.56"), Decimal("2.500")
+    return lambda: (commands._format_price(price), commands._format_quantity(qty))
+
+
+def case_compile_invoice():
+    return lambda: commands.compile_invoice(
+        _INVOICE["customer_data"], _INVOICE["items"]
+    )
+
+
+def case_flask_invoice():
+    """POST /invoice por el cliente de pruebas de Flask, con la cola y el emulador."""
+    import web_server
+
+    # Clave sin límites de ritmo (en el directorio temporal de la corrida).
+    with open("api_keys.json", "w", encoding="utf-8") as f:
+        json.dump({"benchmark": _UNLIMITED_CLIENT}, f)
+    # Velocidad muy alta: el tiempo de línea no tapa el costo del servidor.
+    printer = _emulated_printer("emu://bench-flask", 10_000_000)
+    web_server.server_manager.start(printer, host="127.0.0.1", port=0)
+    client = web_server.api.test_client()
+    body = json.dumps(_INVOICE, default=str)
+
+    def post():
+        response = client.post(
+            "/invoice",
+            data=body,
+            content_type="application/json",
+            headers={"X-API-Key": "benchmark"},
+        )
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    return post
+
+
+def case_full_invoice_emulator():
+    """Factura completa contra el emulador a 115200 baudios."""
+    printer = _emulated_printer("emu://bench-invoice", 115200)
+
+    def send():
+        result = commands.send_full_invoice(
+            printer, _INVOICE["customer_data"], _INVOICE["items"]
+        )
+        assert "correctamente" in result, result
+
+    return send
+
+
+CASES = {
+    "lrc": case_lrc,
+    "build_frame": case_build_frame,
+    "read_response": case_read_response,
+    "report_x_from_trama": case_report_x_from_trama,
+    "s5_from_trama": case_s5_from_trama,
+    "format_price_quantity": case_format_price_quantity,
+    "compile_invoice": case_compile_invoice,
+    "flask_invoice": case_flask_invoice,
+    "full_invoice_emulator": case_full_invoice_emulator,
+}
+
+
+def measure(func, rounds):
+    """Microsegundos por llamada: el mejor de 'rounds' lotes de ~0,2 s."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=rounds, number=number)) / number * 1e6
+
+
+def compare(results, baseline, tolerance):
+    """Casos cuyo tiempo supera la línea base en más de 'tolerance': {caso: razón}."""
+    regressions = {}
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference and value > reference * (1 + tolerance):
+            regressions[name] = value / reference
+    return regressions
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks del protocolo y del parseo, con línea base."
+    )
+    parser.add_argument(
+        "--cases", nargs="*", choices=sorted(CASES), help="Casos a medir (todos)"
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="Lotes por caso")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        help=f"Empeoramiento admitido (ej: 0.3 = 30 %%; por defecto el de la línea "
+        f"base o {DEFAULT_TOLERANCE})",
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE_FILE, help="Archivo de línea base"
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Guarda los resultados como nueva línea base",
+    )
+    args = parser.parse_args()
+
+    stored = load_baseline(args.baseline)
+    baseline = stored.get("cases_us", {})
+    tolerance = (
+        args.tolerance
+        if args.tolerance is not None
+        else stored.get("tolerance", DEFAULT_TOLERANCE)
+    )
+
+    results = {}
+    root = os.getcwd()
+    # El diario, el índice de facturas y la serie de ventas de las facturas de
+    # prueba quedan en un directorio temporal, no en los del proyecto.
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for name in args.cases or CASES:
+                # Los mensajes de depuración de FiscalPrinter no cuentan en la medición.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[name] = measure(CASES[name](), args.rounds)
+                reference = baseline.get(name)
+                change = f"{results[name] / reference - 1:+.1%}" if reference else "-"
+                print(
+                    f"{name:<24} {results[name]:>12.2f} µs   base "
+                    f"{reference or 0:>12.2f} µs   {change:>7}"
+                )
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                import web_server
+
+                web_server.stop_server(timeout=5)
+            os.chdir(root)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {"tolerance": tolerance, "cases_us": {**baseline, **results}},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+        print(f"Línea base guardada en {args.baseline}.")
+        return 0
+
+    regressions = compare(results, baseline, tolerance)
+    if regressions:
+        for name, ratio in sorted(regressions.items()):
+            print(f"REGRESIÓN: {name} es {ratio:.2f}x la línea base.")
+        return 1
+    print(f"Sin regresiones (tolerancia {tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# catalog.py
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+import commands
+from communication import FiscalPrinter
+from config import CATALOG_FILE, CATALOG_RELOAD_CHECK
+from models import EncodedFrame
+
+# Trama de un producto ya codificada salvo la cantidad: la trama completa es
+# head + cantidad (8 dígitos) + tail, y su LRC es partial_lrc XOR los dígitos
+# de la cantidad (el LRC es un XOR, así que se puede calcular por partes).
+ItemTemplate = namedtuple(
+    "ItemTemplate", "command_prefix head tail partial_lrc tax_index"
+)
+
+CatalogEntry = namedtuple("CatalogEntry", "sku desc price_cents tax_rate templates")
+
+
+def _xor(data):
+    lrc = 0
+    for byte in data:
+        lrc ^= byte
+    return lrc
+
+
+def _build_entry(sku, raw):
+    """Valida un producto del archivo y precalcula sus tramas por tipo de documento."""
+    try:
+        desc, price, tax_rate = raw["desc"], raw["price"], raw["tax_rate"]
+    except (KeyError, TypeError):
+        raise ValueError(
+            f"Producto '{sku}' incompleto. Se requieren 'desc', 'price' y 'tax_rate'."
+        )
+    if not desc or not isinstance(desc, str):
+        raise ValueError(f"Producto '{sku}' sin descripción.")
+    if not (desc.isascii() and desc.isprintable()):
+        raise ValueError(f"El texto '{desc}' contiene caracteres no ASCII.")
+    price_cents = commands.to_cents(price)
+    if not 0 < price_cents <= commands.MAX_PRICE_CENTS:
+        raise ValueError(f"Precio fuera de rango en '{sku}'.")
+
+    templates = {}
+    for kind, tax_commands in (
+        ("invoice", commands.TAX_RATE_COMMANDS),
+        ("credit_note", commands.CREDIT_NOTE_TAX_COMMANDS),
+    ):
+        tax_command = tax_commands.get(tax_rate)
+        if tax_command is None:
+            raise ValueError(f"Tasa de impuesto desconocida '{tax_rate}' en '{sku}'.")
+        prefix = f"{tax_command}{price_cents:010d}"
+        head, tail = prefix.encode("ascii"), desc.encode("ascii")
+        templates[kind] = ItemTemplate(
+            prefix,
+            FiscalPrinter._STX + head,
+            tail + FiscalPrinter._ETX,
+            _xor(head + tail + FiscalPrinter._ETX),
+            list(tax_commands).index(tax_rate),
+        )
+    return CatalogEntry(sku, desc, price_cents, tax_rate, templates)
+
+
+class Catalog:
+    """
+    Catálogo local de productos: SKU -> descripción, precio y tasa.
+
+    Al cargar el archivo se valida cada producto y se precalcula su trama de
+    ítem (todo menos la cantidad) para facturas y notas de crédito, así que
+    una línea {"sku", "qty"} solo requiere una búsqueda y formatear la
+    cantidad. El archivo se vuelve a cargar solo cuando cambia; si la versión
+    nueva tiene errores se sigue usando la anterior.
+    """
+
+    def __init__(self, path=CATALOG_FILE, reload_check=CATALOG_RELOAD_CHECK):
+        self.path = path
+        self.reload_check = reload_check
+        self.loaded_at = None
+        self.error = None
+        self._entries = {}
+        self._version = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reload(self):
+        """Carga el archivo. Devuelve True si se cargó una versión nueva."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_check
+            try:
+                stat = os.stat(self.path)
+                version = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                self._entries, self._version, self.error = {}, None, None
+                return False
+            if version == self._version:
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = json.load(f, parse_float=Decimal)
+                if not isinstance(raw, dict):
+                    raise ValueError("El catálogo debe ser un objeto {SKU: producto}.")
+                entries = {
+                    str(sku): _build_entry(str(sku), item) for sku, item in raw.items()
+                }
+            except (OSError, ValueError) as e:
+                # No se reintenta hasta que el archivo vuelva a cambiar.
+                self._version, self.error = version, str(e)
+                print(f"Catálogo no recargado ({self.path}): {e}")
+                return False
+            # Se reemplaza el diccionario completo: las búsquedas en curso ven
+            # la versión anterior o la nueva, nunca una mezcla.
+            self._entries, self._version, self.error = entries, version, None
+            self.loaded_at = datetime.now()
+            print(f"Catálogo cargado: {len(entries)} productos.")
+            return True
+
+    def _maybe_reload(self):
+        if time.monotonic() >= self._next_check:
+            self.reload()
+
+    def get(self, sku):
+        self._maybe_reload()
+        return self._entries.get(sku)
+
+    def item_frame(self, kind, sku, qty_millis):
+        """
+        Trama de ítem (EncodedFrame) del producto 'sku' con la cantidad dada
+        (ya validada, en milésimas). Lanza ValueError si el SKU no existe.
+        """
+        entry = self.get(sku)
+        if entry is None:
+            raise ValueError(f"El SKU '{sku}' no está en el catálogo.")
+        template = entry.templates[kind]
+        qty = b"%08d" % qty_millis
+        frame = b"".join(
+            (
+                template.head,
+                qty,
+                template.tail,
+                bytes([template.partial_lrc ^ _xor(qty)]),
+            )
+        )
+        return EncodedFrame(
+            "item",
+            f"{template.command_prefix}{qty_millis:08d}{entry.desc}",
+            frame,
+            entry.desc,
+            commands.line_total_cents(entry.price_cents, qty_millis),
+            qty_millis,
+            template.tax_index,
+        )
+
+    def summary(self):
+        return {
+            "path": self.path,
+            "products": len(self._entries),
+            "loaded_at": (
+                self.loaded_at.isoformat(timespec="seconds") if self.loaded_at else None
+            ),
+            "error": self.error,
+        }
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Devuelve (cargándolo si hace falta) el catálogo de la aplicación."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
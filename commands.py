@@ -1,11 +1,42 @@
 # commands.py
 from communication import FiscalPrinter
-from models import S5PrinterData
+from models import (
+    ZRecord,
+    S2PrinterData,
+    S5PrinterData,
+    ReportXData,
+    CompiledDocument,
+    EncodedFrame,
+)
+from config import FRAME_RETRIES, FRAME_RETRY_BACKOFF, COMPLETION_TIMEOUT
+from config import NON_FISCAL_LINE_WIDTH
+from decimal import Decimal, InvalidOperation
+import sqlite3
+import textwrap
+import threading
 import time
+from datetime import datetime
+import catalog
+import counters
+import document_index
+import journal
+import tracing
 
 
-# commands.py -> Añadir al inicio 'from models import ReportXData'
-# y luego añadir esta función
+def read_report_x(printer: FiscalPrinter):
+    """Lee el Reporte X (U0X) como ReportXData, o None si no hubo respuesta."""
+    raw_response = printer.send_command("U0X")
+    if not raw_response or not raw_response.startswith(FiscalPrinter._STX):
+        return None
+    return ReportXData.from_trama(raw_response[1:-2].decode("ascii", errors="ignore"))
+
+
+def read_s5(printer: FiscalPrinter):
+    """Lee el status S5 (RIF y serial fiscal) como S5PrinterData, o None."""
+    raw_response = printer.send_command("S5")
+    if not raw_response or not raw_response.startswith(FiscalPrinter._STX):
+        return None
+    return S5PrinterData.from_trama(raw_response[1:-2].decode("ascii", errors="ignore"))
 
 
 def get_report_x_data(printer: FiscalPrinter):
@@ -67,6 +98,15 @@ STS1_MAP = {
     b"\x6a": "Modo Fiscal con la MF llena y en Transacción No fiscal",
 }
 
+# Valores de STS1 en los que la impresora está "en Espera" (sin transacción en curso).
+STS1_IDLE = FiscalPrinter._STS1_IDLE
+
+# Valores de STS1 con una transacción fiscal (factura o nota de crédito) abierta.
+STS1_FISCAL_TRANSACTION = {b"\x41", b"\x61", b"\x69"}
+
+# Valores de STS1 con un documento no fiscal abierto.
+STS1_NON_FISCAL_TRANSACTION = {b"\x42", b"\x62", b"\x6a"}
+
 # Referencia: Manual, Página 19, Tabla 8.
 STS2_MAP = {
     b"\x40": "Ningún error",
@@ -105,6 +145,171 @@ def read_printer_status(printer: FiscalPrinter):
         return f"Error de comunicación al leer status: {e}"
 
 
+def _await_completion(printer: FiscalPrinter, name: str, timeout: float) -> str:
+    """
+    Espera a que la impresora termine la operación 'name' ya aceptada (ACK) y
+    devuelve el mensaje para el usuario.
+    """
+    seconds = printer.await_completion(timeout)
+    if seconds is None:
+        return (
+            f"Error: la impresora aceptó '{name}' pero no volvió a Espera en "
+            f"{timeout:g} segundos. Verifique la impresora."
+        )
+    return f"{name} completado en {seconds:.1f} segundos. La impresora está en Espera."
+
+
+def get_last_z_number(printer: FiscalPrinter) -> int:
+    """
+    Número del último Reporte Z emitido, a partir del Reporte X (U0X).
+    Lanza ValueError si la impresora no devuelve una trama válida.
+    """
+    report = read_report_x(printer)
+    if report is None:
+        raise ValueError("La impresora no devolvió el Reporte X.")
+    return report.numero_proximo_z - 1
+
+
+def get_z_records(printer: FiscalPrinter, start_num: int, end_num: int) -> list:
+    """
+    Descarga de la memoria fiscal los Reportes Z del rango indicado (comando
+    U3A, respuesta en bloques) y devuelve una lista de ZRecord.
+    """
+    if not (0 < start_num <= end_num <= 999999):
+        raise ValueError("Rango de Reportes Z inválido.")
+    data = printer.send_upload_command(f"U3A{start_num:06d}{end_num:06d}")
+    lines = data.decode("ascii", errors="replace").split("\n")
+    return [ZRecord.from_line(line) for line in lines if line]
+
+
+def reconcile_with_printer(printer: FiscalPrinter) -> dict:
+    """
+    Compara lo que el diario local registró desde el último Reporte Z con los
+    acumulados actuales de la impresora (U0X), por tipo de documento y tasa.
+    Informa también la diferencia entre la cantidad de documentos emitidos
+    según la impresora y según el diario (documentos no registrados).
+    Los montos se devuelven en céntimos.
+    """
+    report = read_report_x(printer)
+    if report is None:
+        raise ValueError("La impresora no devolvió el Reporte X.")
+    last_z = report.numero_proximo_z - 1
+
+    # Inicio del período: la hora del último Z según la impresora (con
+    # resolución de minutos) o, si es posterior, la registrada al emitirlo.
+    since = 0.0
+    if last_z > 0 and report.fecha_ultimo_z != "000000":
+        since = datetime.strptime(
+            report.fecha_ultimo_z + report.hora_ultimo_z, "%d%m%y%H%M"
+        ).timestamp()
+    mark = journal.get_journal().last_z_mark(printer.port)
+    if mark is not None and mark > since:
+        since = mark
+    local = journal.get_journal().totals_since(printer.port, since)
+
+    buckets = []
+    for kind, prefix in journal.REPORT_PREFIX.items():
+        for column in journal.AMOUNT_COLUMNS:
+            printed = int(getattr(report, prefix + column).scaleb(2))
+            buckets.append(
+                {
+                    "kind": kind,
+                    "bucket": column,
+                    "printer": printed,
+                    "journal": local[kind][column],
+                    "difference": printed - local[kind][column],
+                }
+            )
+
+    # Documentos emitidos desde el último Z según la impresora: se comparan los
+    # contadores actuales con los del registro del último Z (descarga U3A).
+    gaps = None
+    try:
+        at_z = get_z_records(printer, last_z, last_z)[0] if last_z > 0 else None
+        gaps = {}
+        for kind, current, previous in (
+            (
+                "invoice",
+                report.numero_ultima_factura,
+                at_z.numero_ultima_factura if at_z else 0,
+            ),
+            (
+                "credit_note",
+                report.numero_ultima_nc,
+                at_z.numero_ultima_nc if at_z else 0,
+            ),
+        ):
+            issued = current - previous
+            gaps[kind] = {
+                "printer": issued,
+                "journal": local[kind]["count"],
+                "gap": issued - local[kind]["count"],
+            }
+    except (ConnectionError, ValueError, IndexError) as e:
+        print(f"No se pudieron leer los contadores del último Reporte Z: {e}")
+
+    balanced = all(b["difference"] == 0 for b in buckets) and (
+        gaps is None or all(c["gap"] == 0 for c in gaps.values())
+    )
+    return {
+        "since": (
+            datetime.fromtimestamp(since).isoformat(timespec="seconds")
+            if since
+            else None
+        ),
+        "last_z": last_z,
+        "balanced": balanced,
+        "buckets": buckets,
+        "counters": gaps,
+    }
+
+
+def format_reconciliation(result: dict) -> str:
+    """Texto legible del resultado de reconcile_with_printer()."""
+    if result["since"]:
+        period = f"desde el Reporte Z {result['last_z']} ({result['since']})"
+    else:
+        period = "sin Reportes Z previos"
+    lines = [f"--- Conciliación {period} ---"]
+    for b in result["buckets"]:
+        if b["printer"] or b["journal"]:
+            mark = "" if b["difference"] == 0 else "  <-- DIFERENCIA"
+            lines.append(
+                f"  {DOCUMENT_NAMES[b['kind']]} {b['bucket']}: impresora "
+                f"{cents_to_decimal(b['printer']):,.2f} / diario "
+                f"{cents_to_decimal(b['journal']):,.2f}{mark}"
+            )
+    if result["counters"] is None:
+        lines.append("  Contadores: no disponibles (sin registro del último Z).")
+    else:
+        for kind, c in result["counters"].items():
+            lines.append(
+                f"  {DOCUMENT_NAMES[kind]}, documentos emitidos: impresora "
+                f"{c['printer']} / diario {c['journal']} (faltan en el diario: {c['gap']})"
+            )
+    lines.append(
+        "Resultado: CONCILIADO"
+        if result["balanced"]
+        else "Resultado: HAY DIFERENCIAS, revise antes de emitir el Reporte Z."
+    )
+    return "\n".join(lines)
+
+
+def get_s2_status(printer: FiscalPrinter):
+    """
+    Obtiene el status S2 (documento en curso) y devuelve un objeto S2PrinterData,
+    o None si la impresora no respondió con una trama válida.
+    Referencia: Manual, Página 55.
+    """
+    raw_response = printer.send_command("S2")
+    if not raw_response or not raw_response.startswith(FiscalPrinter._STX):
+        return None
+    try:
+        return S2PrinterData.from_trama(raw_response[1:-2].decode("ascii"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
 def get_s5_status(printer: FiscalPrinter):
     """
     Obtiene el status S5 y devuelve un objeto S5PrinterData.
@@ -127,17 +332,15 @@ def get_s5_status(printer: FiscalPrinter):
         return f"Error: {e}"
 
 
-def send_report_x(printer: FiscalPrinter):
+def send_report_x(printer: FiscalPrinter, timeout=COMPLETION_TIMEOUT):
     """
-    Envía el comando para imprimir un Reporte X.
+    Envía el comando para imprimir un Reporte X y espera a que termine.
     """
     try:
         # Comando para Reporte X es 'I0X' (Página 67, Tabla 59)
         raw_response = printer.send_command("I0X")
         if raw_response == FiscalPrinter._ACK:
-            return (
-                "Comando de Reporte X aceptado. La impresora debería estar imprimiendo."
-            )
+            return _await_completion(printer, "Reporte X", timeout)
         else:
             return f"La impresora respondió con error: {raw_response}"
     except ConnectionError as e:
@@ -180,10 +383,11 @@ def send_invoice_example(printer: FiscalPrinter):
     # commands.py -> Añadir esta nueva función
 
 
-def print_programming(printer: FiscalPrinter):
+def print_programming(printer: FiscalPrinter, timeout=COMPLETION_TIMEOUT):
     """
     Envía el comando 'D' para que la impresora imprima su configuración actual.
-    Este comando no devuelve datos, solo una confirmación (ACK).
+    Este comando no devuelve datos, solo una confirmación (ACK); luego se
+    espera a que la impresora termine de imprimir.
     Referencia: Manual, Página 28, Tabla 25.
     """
     try:
@@ -192,7 +396,7 @@ def print_programming(printer: FiscalPrinter):
 
         # La respuesta esperada para un comando simple es ACK (0x06) [cite: 247]
         if raw_response == FiscalPrinter._ACK:
-            return "Comando 'Imprimir Programación' aceptado. La impresora debería estar imprimiendo el reporte de configuración."
+            return _await_completion(printer, "Imprimir Programación", timeout)
         # Si la impresora devuelve NAK (Comando No Aceptado) [cite: 252]
         elif raw_response == FiscalPrinter._NAK:
             return "Error: La impresora no aceptó el comando 'Imprimir Programación' (NAK)."
@@ -205,9 +409,10 @@ def print_programming(printer: FiscalPrinter):
 # commands.py -> Añadir esta nueva función
 
 
-def print_z_report(printer: FiscalPrinter):
+def print_z_report(printer: FiscalPrinter, timeout=COMPLETION_TIMEOUT):
     """
-    Envía el comando 'I0Z' para imprimir el Reporte Z (cierre diario).
+    Envía el comando 'I0Z' para imprimir el Reporte Z (cierre diario) y espera
+    a que la impresora vuelva a Espera.
     Esta es una operación crítica que reinicia los acumuladores diarios.
     Referencia: Manual, Página 67, Tabla 59.
     """
@@ -216,12 +421,9 @@ def print_z_report(printer: FiscalPrinter):
         raw_response = printer.send_command("I0Z")
 
         if raw_response == FiscalPrinter._ACK:
-            # Es crucial advertir al usuario sobre el tiempo que puede tomar la operación.
-            return (
-                "Comando 'Reporte Z' aceptado. La impresora iniciará el proceso de Cierre Diario. "
-                "Este proceso puede tardar varios segundos. Por favor, espere a que la impresora "
-                "termine completamente antes de enviar nuevos comandos."
-            )[cite:1729]
+            # El diario concilia desde este momento en adelante.
+            journal.get_journal().mark_z(printer.port)
+            return _await_completion(printer, "Reporte Z", timeout)
         elif raw_response == FiscalPrinter._NAK:
             return "Error: La impresora no aceptó el comando 'Reporte Z' (NAK). Verifique el estado de la impresora."
         else:
@@ -230,9 +432,12 @@ def print_z_report(printer: FiscalPrinter):
         return f"Error de comunicación: {e}"
 
 
-def reprint_z_by_number(printer: FiscalPrinter, start_num: int, end_num: int):
+def reprint_z_by_number(
+    printer: FiscalPrinter, start_num: int, end_num: int, timeout=COMPLETION_TIMEOUT
+):
     """
-    Envía el comando 'RZ' para reimprimir un rango de reportes Z por su número.
+    Envía el comando 'RZ' para reimprimir un rango de reportes Z por su número
+    y espera a que termine la reimpresión.
     Referencia: Manual, Página 49, Tabla 39.
     """
     try:
@@ -246,7 +451,9 @@ def reprint_z_by_number(printer: FiscalPrinter, start_num: int, end_num: int):
         raw_response = printer.send_command(command)
 
         if raw_response == FiscalPrinter._ACK:
-            return f"Comando 'Reimprimir Reporte Z' (rango: {start_num}-{end_num}) aceptado. La impresora iniciará la reimpresión."
+            return _await_completion(
+                printer, f"Reimprimir Reporte Z {start_num}-{end_num}", timeout
+            )
         elif raw_response == FiscalPrinter._NAK:
             return f"Error: La impresora no aceptó el comando 'Reimprimir Reporte Z' (NAK)."
         else:
@@ -256,14 +463,91 @@ def reprint_z_by_number(printer: FiscalPrinter, start_num: int, end_num: int):
 
 
 # --- Funciones de ayuda para formatear los datos ---
-def _format_price(price: float) -> str:
-    """Convierte un float a un string de 10 dígitos para el precio (8 enteros, 2 decimales)."""
-    return str(int(price * 100)).zfill(10)
+# Los montos viajan como enteros exactos: céntimos para los precios y milésimas
+# para las cantidades. Con float, int(19.99 * 100) da 1998 y no 1999.
+PRICE_DECIMALS = 2
+QUANTITY_DECIMALS = 3
+
+# Límites de los campos de un ítem (Manual, Página 32): precio 8+2 y cantidad 5+3 dígitos.
+MAX_PRICE_CENTS = 9999999999
+MAX_QUANTITY_MILLIS = 99999999
+
+
+def _to_fixed_point(value, decimals: int, field: str) -> int:
+    """
+    Convierte un monto (Decimal, int, str o float) a un entero con `decimals`
+    decimales implícitos, sin redondear. Lanza ValueError si el monto no es
+    un número o tiene más decimales de los que admite la impresora.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"{field} debe ser un número.")
+    if isinstance(value, float):
+        # repr() da el literal más corto que produce ese float (ej: '19.99').
+        value = repr(value)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"{field} '{value}' no es un número.")
+    if not amount.is_finite():
+        raise ValueError(f"{field} '{value}' no es un número.")
+
+    scaled = amount.scaleb(decimals)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"{field} {value} tiene más de {decimals} decimales.")
+    return int(scaled)
+
+
+def to_cents(price) -> int:
+    """Precio en céntimos exactos."""
+    return _to_fixed_point(price, PRICE_DECIMALS, "El precio")
+
+
+def to_millis(qty) -> int:
+    """Cantidad en milésimas exactas."""
+    return _to_fixed_point(qty, QUANTITY_DECIMALS, "La cantidad")
+
+
+def line_total_cents(price_cents: int, qty_millis: int) -> int:
+    """Total de una línea en céntimos, redondeado al céntimo (mitad hacia arriba)."""
+    return (price_cents * qty_millis + 500) // 1000
+
 
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-PRICE_DECIMALS)
 
-def _format_quantity(qty: float) -> str:
-    """Convierte un float a un string de 8 dígitos para la cantidad (5 enteros, 3 decimales)."""
-    return str(int(qty * 1000)).zfill(8)
+
+def _format_price(price) -> str:
+    """Convierte un precio a un string de 10 dígitos (8 enteros, 2 decimales)."""
+    return f"{to_cents(price):010d}"
+
+
+def _format_quantity(qty) -> str:
+    """Convierte una cantidad a un string de 8 dígitos (5 enteros, 3 decimales)."""
+    return f"{to_millis(qty):08d}"
+
+
+def encode_item_frames(
+    tax_codes: list, prices_cents: list, qtys_millis: list, descriptions: list
+) -> tuple:
+    """
+    Codifica los ítems de un documento en lote: un único formateo y una única
+    codificación ASCII para todas las líneas, en vez de una por campo y por ítem.
+    Las listas van en paralelo y ya validadas. Devuelve (comandos, tramas).
+    """
+    count = len(descriptions)
+    if not count:
+        return [], []
+
+    fields = [None] * (4 * count)
+    fields[0::4] = tax_codes
+    fields[1::4] = prices_cents
+    fields[2::4] = qtys_millis
+    fields[3::4] = descriptions
+    # Comando del ítem: CMD + Precio + Cantidad + Descripción, uno por línea.
+    batch = ("%s%010d%08d%s\n" * count) % tuple(fields)
+    commands = batch.split("\n")[:-1]
+    payloads = batch.encode("ascii").split(b"\n")[:-1]
+    return commands, [FiscalPrinter.frame_bytes(data) for data in payloads]
 
 
 # --- Diccionario para mapear tasas a comandos ---
@@ -275,62 +559,621 @@ TAX_RATE_COMMANDS = {
 }
 
 
-def send_full_invoice(printer: FiscalPrinter, customer_data: dict, items: list):
+# --- Diccionario para mapear tasas a comandos de Nota de Crédito ---
+CREDIT_NOTE_TAX_COMMANDS = {
+    "Exento (E)": "d0",
+    "Tasa General (G)": "d1",
+    "Tasa Reducida (R)": "d2",
+    "Tasa Adicional (A)": "d3",
+}
+
+# Nombres de los documentos para los mensajes al usuario.
+DOCUMENT_NAMES = {"invoice": "Factura", "credit_note": "Nota de Crédito"}
+
+
+# --- Etapa 1: compilar (validar y codificar sin tocar la impresora) ---
+
+
+def _encode(command, text=None):
+    try:
+        return FiscalPrinter.build_frame(command)
+    except UnicodeEncodeError:
+        text = command[3:] if text is None else text
+        raise ValueError(f"El texto '{text}' contiene caracteres no ASCII.")
+
+
+def _header_frame(command):
+    return EncodedFrame("header", command, _encode(command))
+
+
+def _compile_items(kind: str, items: list) -> list:
     """
-    Envía una secuencia de comandos completa para crear y cerrar una factura.
-    Referencia: Manual, Páginas 32-34.
+    Valida los ítems y devuelve sus tramas ya codificadas (con LRC). Un ítem
+    puede traer todos sus datos o solo {"sku", "qty"}: en ese caso la trama
+    sale del catálogo, ya precodificada salvo la cantidad.
     """
-    try:
-        # --- 1. Enviar datos del cliente ---
+    if not items:
+        raise ValueError("El documento no tiene ítems.")
+
+    tax_commands = TAX_RATE_COMMANDS if kind == "invoice" else CREDIT_NOTE_TAX_COMMANDS
+    tax_indexes = {code: index for index, code in enumerate(tax_commands.values())}
+    item_frames = [None] * len(items)
+    positions, tax_codes, prices, qtys, descs = [], [], [], [], []
+    for index, item in enumerate(items, start=1):
+        if isinstance(item, dict) and "sku" in item:
+            if "qty" not in item:
+                raise ValueError(f"Ítem {index} incompleto. Se requiere 'qty'.")
+            qty_millis = to_millis(item["qty"])
+            if not 0 < qty_millis <= MAX_QUANTITY_MILLIS:
+                raise ValueError(f"Cantidad fuera de rango en el SKU '{item['sku']}'.")
+            item_frames[index - 1] = catalog.get_catalog().item_frame(
+                kind, str(item["sku"]), qty_millis
+            )
+            continue
+
+        try:
+            tax_rate, price, qty, desc = (
+                item["tax_rate"],
+                item["price"],
+                item["qty"],
+                item["desc"],
+            )
+        except (KeyError, TypeError):
+            raise ValueError(
+                f"Ítem {index} incompleto. Se requieren 'sku' y 'qty', o 'desc', "
+                "'price', 'qty' y 'tax_rate'."
+            )
+
+        tax_command = tax_commands.get(tax_rate)
+        if tax_command is None:
+            raise ValueError(f"Tasa de impuesto desconocida '{tax_rate}'.")
+        if not desc or not isinstance(desc, str):
+            raise ValueError(f"Ítem {index} sin descripción.")
+        if not (desc.isascii() and desc.isprintable()):
+            raise ValueError(f"El texto '{desc}' contiene caracteres no ASCII.")
+
+        price_cents, qty_millis = to_cents(price), to_millis(qty)
+        if not 0 < price_cents <= MAX_PRICE_CENTS or not (
+            0 < qty_millis <= MAX_QUANTITY_MILLIS
+        ):
+            raise ValueError(f"Precio o cantidad fuera de rango en '{desc}'.")
+
+        positions.append(index - 1)
+        tax_codes.append(tax_command)
+        prices.append(price_cents)
+        qtys.append(qty_millis)
+        descs.append(desc)
+
+    commands, frames = encode_item_frames(tax_codes, prices, qtys, descs)
+    for position, command, frame, desc, price, qty, code in zip(
+        positions, commands, frames, descs, prices, qtys, tax_codes
+    ):
+        item_frames[position] = EncodedFrame(
+            "item",
+            command,
+            frame,
+            desc,
+            line_total_cents(price, qty),
+            qty,
+            tax_indexes[code],
+        )
+    return item_frames
+
+
+def compile_items(kind: str, items: list) -> list:
+    """Valida y codifica ítems sueltos de una factura o nota de crédito."""
+    return _compile_items(kind, items)
+
+
+def compile_close(payment: str = "01") -> EncodedFrame:
+    """
+    Trama de cierre con pago directo total. '101' es el pago con el medio 01.
+    Referencia: Manual, Página 34.
+    """
+    if not (isinstance(payment, str) and len(payment) == 2 and payment.isdigit()):
+        raise ValueError(f"Medio de pago inválido '{payment}'. Se esperan 2 dígitos.")
+    return EncodedFrame("close", f"1{payment}", _encode(f"1{payment}"))
+
+
+def compile_headers(kind: str, customer_data: dict, affected_doc: dict = None) -> list:
+    """
+    Valida y codifica los encabezados de un documento: datos del cliente y, en
+    las notas de crédito, los de la factura afectada (obligatorios).
+    """
+    if not isinstance(customer_data, dict):
+        raise ValueError("'customer_data' debe ser un objeto con 'rif' y 'name'.")
+    if kind == "invoice":
+        headers = []
         if customer_data.get("rif"):
-            printer.send_command(f"iR*{customer_data['rif']}")
-            time.sleep(0.1)  # Pequeña pausa entre comandos
+            headers.append(_header_frame(f"iR*{customer_data['rif']}"))
         if customer_data.get("name"):
-            printer.send_command(f"iS*{customer_data['name']}")
-            time.sleep(0.1)
-
-        # --- 2. Enviar los ítems de la factura ---
-        for item in items:
-            tax_command = TAX_RATE_COMMANDS.get(item["tax_rate"])
-            if tax_command is None:
-                return f"Error: Tasa de impuesto desconocida '{item['tax_rate']}'."
-
-            price_str = _format_price(item["price"])
-            qty_str = _format_quantity(item["qty"])
-
-            # Construir comando del ítem: CMD + Precio + Cantidad + Descripción
-            item_command = f"{tax_command}{price_str}{qty_str}{item['desc']}"
-
-            response = printer.send_command(item_command)
-            if response != FiscalPrinter._ACK:
-                return f"Error al agregar el ítem '{item['desc']}'. La impresora no aceptó el comando."
-            time.sleep(0.2)  # Pausa mayor para procesar el ítem
-
-        # --- 3. Cerrar la factura (Pago directo con medio de pago 01) ---
-        # El comando '101' es para pago directo total con el medio de pago 01.
-        close_response = printer.send_command("101")
-        if close_response == FiscalPrinter._ACK:
-            return "Factura enviada y cerrada correctamente. La impresora debería estar imprimiendo."
-        else:
-            # Si el cierre falla, es importante intentar anular el documento
-            printer.send_command("7")  # Comando para anular documento fiscal en curso
-            return "Error al cerrar la factura. Se ha intentado anular el documento en la impresora."
+            headers.append(_header_frame(f"iS*{customer_data['name']}"))
+        return headers
 
-    except (ConnectionError, ValueError) as e:
-        return f"Error durante el envío de la factura: {e}"
+    # El manual indica que estos campos son obligatorios.
+    try:
+        return [
+            _header_frame(f"iF*{affected_doc['number']}"),  # Número de Factura Afectada
+            _header_frame(f"iD*{affected_doc['date']}"),  # Fecha de Factura Afectada
+            # Serial de la Máquina Fiscal que emitió la factura
+            _header_frame(f"il*{affected_doc['serial']}"),
+            _header_frame(f"iR*{customer_data['rif']}"),  # RIF del Cliente
+            _header_frame(f"iS*{customer_data['name']}"),  # Nombre del Cliente
+        ]
+    except (KeyError, TypeError) as e:
+        raise ValueError(
+            f"Falta el dato obligatorio {e} del documento afectado o del cliente."
+        )
+
+
+@tracing.traced("compile_invoice")
+def compile_invoice(customer_data: dict, items: list) -> CompiledDocument:
+    """
+    Valida una factura completa y genera todas sus tramas, sin comunicarse con
+    la impresora. Lanza ValueError si el documento no es válido, de modo que un
+    documento erróneo se rechaza antes de abrir la transacción fiscal.
+    Referencia: Manual, Páginas 32-34.
+    """
+    headers = compile_headers("invoice", customer_data)
+    item_frames = compile_items("invoice", items)
+    return CompiledDocument(
+        "invoice",
+        headers + item_frames + [compile_close()],
+        len(item_frames),
+        len(headers),
+    )
+
+
+@tracing.traced("compile_credit_note")
+def compile_credit_note(
+    affected_doc: dict, customer_data: dict, items: list
+) -> CompiledDocument:
+    """
+    Valida una Nota de Crédito completa y genera todas sus tramas.
+    Referencia: Manual, Páginas 35-37.
+    """
+    headers = compile_headers("credit_note", customer_data, affected_doc)
+    item_frames = compile_items("credit_note", items)
+    return CompiledDocument(
+        "credit_note",
+        headers + item_frames + [compile_close()],
+        len(item_frames),
+        len(headers),
+    )
+
+
+def _match_invoice_line(invoice, item, index):
+    """Índice de la línea de la factura que corresponde a un ítem devuelto."""
+    if "line" in item:
+        line = item["line"]
+        if isinstance(line, bool) or not isinstance(line, int):
+            raise ValueError(f"Ítem {index}: 'line' debe ser un número de línea.")
+        if not 1 <= line <= len(invoice.lines):
+            raise ValueError(
+                f"Ítem {index}: la factura {invoice.number} no tiene la línea {line}."
+            )
+        return line - 1
+    try:
+        desc, price_cents = item["desc"], to_cents(item["price"])
+        tax_index = list(TAX_RATE_COMMANDS).index(item["tax_rate"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(
+            f"Ítem {index} incompleto. Se requieren 'line' y 'qty', o 'desc', "
+            "'price', 'qty' y 'tax_rate' de una línea de la factura."
+        )
+    for position, line in enumerate(invoice.lines):
+        if (line.desc, line.price_cents, line.tax_index) == (
+            desc,
+            price_cents,
+            tax_index,
+        ):
+            return position
+    raise ValueError(
+        f"Ítem {index}: '{desc}' con ese precio y tasa no está en la factura "
+        f"{invoice.number}."
+    )
+
+
+@tracing.traced("compile_credit_note_for_invoice")
+def compile_credit_note_for_invoice(
+    invoice, items: list = None, customer_data: dict = None
+) -> tuple:
+    """
+    Nota de Crédito de una factura del índice local (IndexedInvoice): los
+    encabezados salen del índice y cada ítem devuelto se valida contra las
+    líneas originales antes de tocar la impresora. Los ítems son
+    {"line": n, "qty": q} (línea 1..N de la factura) o ítems completos que
+    coinciden en descripción, precio y tasa con una línea; sin ítems se
+    devuelve todo lo que queda por devolver.
+    Devuelve (documento, {índice de línea: milésimas devueltas}).
+    """
+    returns = {}
+    if items is None:
+        returns = {
+            position: line.available_millis
+            for position, line in enumerate(invoice.lines)
+            if line.available_millis > 0
+        }
+        if not returns:
+            raise ValueError(
+                f"La factura {invoice.number} ya fue devuelta por completo."
+            )
+    else:
+        if not isinstance(items, list) or not items:
+            raise ValueError("El documento no tiene ítems.")
+        for index, item in enumerate(items, start=1):
+            if not isinstance(item, dict) or "qty" not in item:
+                raise ValueError(f"Ítem {index} incompleto. Se requiere 'qty'.")
+            position = _match_invoice_line(invoice, item, index)
+            qty_millis = to_millis(item["qty"])
+            if qty_millis <= 0:
+                raise ValueError(f"Ítem {index}: la cantidad debe ser positiva.")
+            returns[position] = returns.get(position, 0) + qty_millis
+
+    tax_names = list(TAX_RATE_COMMANDS)
+    lines = []
+    for position, qty_millis in returns.items():
+        line = invoice.lines[position]
+        if qty_millis > line.available_millis:
+            raise ValueError(
+                f"La línea {position + 1} ('{line.desc}') de la factura "
+                f"{invoice.number} admite devolver {line.available_millis / 1000:g}, "
+                f"se pidió {qty_millis / 1000:g}."
+            )
+        lines.append(
+            {
+                "desc": line.desc,
+                "price": cents_to_decimal(line.price_cents),
+                "qty": Decimal(qty_millis).scaleb(-QUANTITY_DECIMALS),
+                "tax_rate": tax_names[line.tax_index],
+            }
+        )
+    document = compile_credit_note(
+        invoice.affected_doc, customer_data or invoice.customer_data, lines
+    )
+    return document, returns
 
 
-# commands.py -> Añadir este nuevo código
+# --- Etapa 2: transmitir (solo E/S con la impresora) ---
 
-# --- Diccionario para mapear tasas a comandos de Nota de Crédito ---
-CREDIT_NOTE_TAX_COMMANDS = {
-    "Exento (E)": "d0",
-    "Tasa General (G)": "d1",
-    "Tasa Reducida (R)": "d2",
-    "Tasa Adicional (A)": "d3",
-}
+
+class DocumentTransaction:
+    """
+    Máquina de estados de un documento fiscal en curso en la impresora.
+
+    Recuerda cuántas tramas fueron confirmadas (ACK). Si una trama recibe NAK o
+    no recibe respuesta, consulta el status (ENQ y S2) para saber si la
+    impresora la registró de todos modos, y continúa desde la última línea
+    confirmada en vez de anular el documento:
+
+      - Encabezado: se reenvía (la impresora sobrescribe el dato).
+      - Ítem: se compara la cantidad de artículos del documento (S2) con la
+        suma de los ítems confirmados. Si ya incluye el ítem, se da por
+        aceptado; si no, se reenvía. Sin respuesta al ENQ o al S2 no se
+        reenvía: se vuelve a consultar o se suspende.
+      - Cierre: si la impresora volvió a Espera, el documento quedó cerrado.
+
+    Si la impresora deja de responder o reporta un error (sin papel, etc.), el
+    documento queda suspendido y se retoma en el próximo envío a esa impresora.
+    Solo se anula (comando 7) si la impresora responde pero rechaza la misma
+    trama más de FRAME_RETRIES veces.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    RECOVERING = "recovering"
+    COMPLETED = "completed"
+    SUSPENDED = "suspended"
+    VOIDED = "voided"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        document: CompiledDocument,
+        max_retries=FRAME_RETRIES,
+        backoff=FRAME_RETRY_BACKOFF,
+    ):
+        self.document = document
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.state = self.PENDING
+        self.next_frame = 0  # Índice de la primera trama sin confirmar
+        self.recoveries = 0  # Tramas recuperadas sin reimprimir el documento
+        self.unverified = False  # La trama siguiente se envió sin ACK ni verificación
+        self.reason = None
+        self.number = None  # Número asignado al confirmarse el cierre
+        self.closed_at = None
+
+    @property
+    def name(self):
+        return DOCUMENT_NAMES[self.document.kind]
+
+    def _confirmed_items(self):
+        return [f for f in self.document.frames[: self.next_frame] if f.role == "item"]
+
+    @property
+    def confirmed_item_count(self):
+        return len(self._confirmed_items())
+
+    @property
+    def issued(self):
+        """Número y hora del documento cerrado, o None si no se conocen."""
+        if self.number is None:
+            return None
+        return {
+            "number": self.number,
+            "issued_at": self.closed_at.isoformat(timespec="seconds"),
+        }
+
+    def _confirm(self, printer, frame):
+        """La trama quedó en la impresora; el cierre recibe el número siguiente."""
+        self.next_frame += 1
+        if frame.role == "close":
+            assigned = counters.counters_for(printer.port).advance(self.document.kind)
+            if assigned:
+                self.number, self.closed_at = assigned
+
+    def run(self, printer: FiscalPrinter) -> str:
+        """Envía (o retoma) el documento y devuelve el mensaje para el usuario."""
+        error = self.send_pending(printer)
+        return error if error else self.complete()
+
+    def send_pending(self, printer: FiscalPrinter):
+        """
+        Envía las tramas que aún no están confirmadas. Devuelve None si todas
+        quedaron confirmadas, o el mensaje de error si el documento se suspendió
+        o se anuló. Permite agregar tramas al documento entre llamadas.
+        """
+        frames = self.document.frames
+        retries = 0
+        self.state = self.SENDING
+        while self.next_frame < len(frames):
+            frame = frames[self.next_frame]
+            try:
+                # Una trama que quedó sin verificar (ej: antes de suspender) se
+                # comprueba con el status antes de volver a enviarla.
+                if not self.unverified:
+                    self.unverified = True
+                    response = printer.send_frame(frame.data, frame.command[:3])
+                    if response == FiscalPrinter._ACK:
+                        self.unverified = False
+                        self._confirm(printer, frame)
+                        retries = 0
+                        continue
+
+                retries += 1
+                self.state = self.RECOVERING
+                with tracing.span("recover", frame=self.next_frame, retry=retries):
+                    decision = self._recover(printer, frame, retries)
+            except OSError as e:  # Puerto cerrado o error de E/S del serial
+                decision = ("suspend", f"error de comunicación ({e})")
+
+            action, detail = decision
+            if action != "suspend":
+                self.unverified = False
+            if action == "advance":
+                self.recoveries += 1
+                self._confirm(printer, frame)
+                retries = 0
+            elif action == "resend":
+                time.sleep(self.backoff * retries)
+            elif action == "suspend":
+                return self._suspend(detail)
+            else:
+                return self.abort(printer, frame, detail)
+            self.state = self.SENDING
+        return None
+
+    def complete(self):
+        self.state = self.COMPLETED
+        name = self.name if self.number is None else f"{self.name} N° {self.number}"
+        message = f"{name} enviada y cerrada correctamente. La impresora debería estar imprimiendo."
+        if self.recoveries:
+            message += f" ({self.recoveries} trama(s) recuperada(s) sin reimprimir)"
+        return message
+
+    def _recover(self, printer, frame, retries):
+        """
+        Decide qué hacer con una trama sin ACK: (acción, detalle). Un ítem o un
+        cierre solo se reenvía cuando el status confirma que no llegó a la
+        impresora, ya que una línea fiscal repetida no se puede deshacer. Si
+        el status no responde se vuelve a consultar y, agotados los
+        reintentos, el documento se suspende.
+        """
+        checks = 0
+        while True:
+            action, detail = self._check_frame(printer, frame, retries)
+            if action != "unknown":
+                return action, detail
+            checks += 1
+            if checks > self.max_retries:
+                return "suspend", detail
+            time.sleep(self.backoff * checks)
+
+    def _check_frame(self, printer, frame, retries):
+        """Compara la trama con el status (ENQ y S2); "unknown" si no hay respuesta."""
+        sts1, sts2 = printer.get_status()
+        if sts1 is None:
+            if frame.role in ("item", "close"):
+                return "unknown", "la impresora no responde"
+            if retries > self.max_retries:
+                return "suspend", "la impresora no responde"
+            return "resend", None
+        if sts2 != b"\x40":
+            error = STS2_MAP.get(sts2, f"Error Desconocido ({sts2.hex()})")
+            return "suspend", error
+
+        if frame.role == "close":
+            if sts1 in STS1_IDLE:
+                return "advance", None  # El cierre llegó; se perdió el ACK
+        elif frame.role == "item":
+            s2 = get_s2_status(printer)
+            if s2 is None:
+                return "unknown", "la impresora no responde al S2"
+            confirmed = sum(f.quantity_millis for f in self._confirmed_items())
+            in_document = s2.cantidad_articulos if sts1 not in STS1_IDLE else 0
+            if in_document == confirmed + frame.quantity_millis:
+                return "advance", None  # El ítem quedó registrado; se perdió el ACK
+            if in_document != confirmed:
+                return (
+                    "abort",
+                    "el documento en la impresora no coincide con lo enviado",
+                )
+
+        if retries > self.max_retries:
+            return "abort", "la impresora no aceptó el comando"
+        return "resend", None
+
+    def _suspend(self, reason):
+        self.state = self.SUSPENDED
+        self.reason = reason
+        line = len(self._confirmed_items())
+        print(f"{self.name} suspendida tras {line} ítems confirmados: {reason}.")
+        return (
+            f"Error: {self.name} suspendida ({reason}). Se confirmaron {line} de "
+            f"{self.document.item_count} ítems; el documento se retomará desde ahí "
+            f"en el próximo envío."
+        )
+
+    def void(self, printer: FiscalPrinter):
+        """Anula el documento (comando 7) si quedó abierto en la impresora."""
+        try:
+            sts1, _ = printer.get_status()
+            if sts1 in STS1_FISCAL_TRANSACTION:
+                # Es importante anular el documento en curso (comando 7).
+                printer.send_command("7")
+                self.state = self.VOIDED
+                return True
+        except OSError:
+            pass
+        self.state = self.FAILED
+        return False
+
+    def abort(self, printer, frame, reason):
+        """La impresora rechaza el documento: se anula si quedó abierto."""
+        self.reason = reason
+        self.void(printer)
+
+        if frame.role == "item":
+            message = f"Error al agregar el ítem '{frame.description}'. La impresora no aceptó el comando ({reason})."
+        elif frame.role == "close":
+            message = f"Error al cerrar la {self.name} ({reason})."
+        else:
+            message = f"Error al enviar el encabezado '{frame.command[:3]}' ({reason})."
+        if self.state == self.VOIDED:
+            message += " Se ha anulado el documento en la impresora."
+        return message
+
+
+# Documentos suspendidos, por puerto de impresora. Se retoman antes del próximo
+# documento, ya que la impresora no acepta otro mientras tenga uno abierto.
+_suspended = {}
+_suspended_lock = threading.Lock()
+
+
+def suspended_transaction(printer: FiscalPrinter):
+    """Documento suspendido pendiente en la impresora, o None."""
+    with _suspended_lock:
+        return _suspended.get(printer.port)
+
+
+def _indexed_invoice(printer: FiscalPrinter, transaction: DocumentTransaction):
+    """Datos de una factura cerrada para el índice local, o None si falta el número."""
+    if printer.serial_number is None or transaction.number is None:
+        return None
+    customer = {"iR*": "", "iS*": ""}
+    lines = []
+    for frame in transaction.document.frames:
+        if frame.role == "header" and frame.command[:3] in customer:
+            customer[frame.command[:3]] = frame.command[3:]
+        elif frame.role == "item":
+            # Comando del ítem: tasa (1) + precio (10) + cantidad (8) + descripción
+            lines.append(
+                document_index.IndexedLine(
+                    frame.command[19:],
+                    int(frame.command[1:11]),
+                    frame.quantity_millis,
+                    frame.tax_index,
+                )
+            )
+    return document_index.IndexedInvoice(
+        printer.serial_number,
+        transaction.number,
+        transaction.closed_at.strftime("%d/%m/%Y"),
+        customer["iR*"],
+        customer["iS*"],
+        lines,
+    )
+
+
+def record_in_journal(printer: FiscalPrinter, transaction: DocumentTransaction):
+    """
+    Registra en el diario local un documento que quedó cerrado en la impresora
+    y, si es una factura con número, en el índice de facturas.
+    """
+    if transaction.state != DocumentTransaction.COMPLETED:
+        return
+    try:
+        journal.get_journal().record(printer.port, transaction.document)
+        if transaction.document.kind == "invoice":
+            invoice = _indexed_invoice(printer, transaction)
+            if invoice is not None:
+                document_index.get_index().add(invoice)
+    except sqlite3.Error as e:
+        # El documento ya se imprimió: un error del diario no debe ocultarlo.
+        print(f"Error al registrar el documento en el diario: {e}")
+
+
+@tracing.traced("transmit_document")
+def transmit_document(
+    printer: FiscalPrinter, document: CompiledDocument, on_closed=None
+) -> str:
+    """
+    Envía las tramas ya compiladas de un documento. Cada trama se envía cuando la
+    anterior fue confirmada (ACK), sin pausas fijas entre comandos. Si hay un
+    documento suspendido en la impresora, primero se termina ese.
+    on_closed(transaction) se llama si el documento quedó cerrado; su número y
+    hora están en transaction.issued.
+    """
+    pending = suspended_transaction(printer)
+    if pending is not None:
+        print(f"Retomando {pending.name} suspendida...")
+        result = pending.run(printer)
+        if pending.state == DocumentTransaction.SUSPENDED:
+            return (
+                f"Error: la impresora tiene una {pending.name} suspendida que no se "
+                f"pudo retomar ({pending.reason})."
+            )
+        with _suspended_lock:
+            _suspended.pop(printer.port, None)
+        record_in_journal(printer, pending)
+        print(f"Documento suspendido: {result}")
+
+    transaction = DocumentTransaction(document)
+    result = transaction.run(printer)
+    record_in_journal(printer, transaction)
+    if on_closed and transaction.state == DocumentTransaction.COMPLETED:
+        on_closed(transaction)
+    if transaction.state == DocumentTransaction.SUSPENDED:
+        with _suspended_lock:
+            _suspended[printer.port] = transaction
+    return result
+
+
+@tracing.traced("send_full_invoice")
+def send_full_invoice(printer: FiscalPrinter, customer_data: dict, items: list):
+    """
+    Envía una secuencia de comandos completa para crear y cerrar una factura.
+    Referencia: Manual, Páginas 32-34.
+    """
+    try:
+        document = compile_invoice(customer_data, items)
+    except ValueError as e:
+        return f"Error: {e}"
+    return transmit_document(printer, document)
 
 
+@tracing.traced("send_full_credit_note")
 def send_full_credit_note(
     printer: FiscalPrinter, affected_doc: dict, customer_data: dict, items: list
 ):
@@ -339,48 +1182,114 @@ def send_full_credit_note(
     Referencia: Manual, Páginas 35-37.
     """
     try:
-        # --- 1. Enviar datos OBLIGATORIOS del documento afectado y del cliente ---
-        # El manual indica que estos campos son obligatorios.
-        printer.send_command(
-            f"iF*{affected_doc['number']}"
-        )  # Número de Factura Afectada
-        time.sleep(0.1)
-        printer.send_command(f"iD*{affected_doc['date']}")  # Fecha de Factura Afectada
-        time.sleep(0.1)
-        printer.send_command(
-            f"il*{affected_doc['serial']}"
-        )  # Serial de la Máquina Fiscal que emitió la factura
-        time.sleep(0.1)
-        printer.send_command(f"iR*{customer_data['rif']}")  # RIF del Cliente
-        time.sleep(0.1)
-        printer.send_command(f"iS*{customer_data['name']}")  # Nombre del Cliente
-        time.sleep(0.1)
-
-        # --- 2. Enviar los ítems de la Nota de Crédito ---
-        for item in items:
-            tax_command = CREDIT_NOTE_TAX_COMMANDS.get(item["tax_rate"])
-            if tax_command is None:
-                return f"Error: Tasa de impuesto desconocida '{item['tax_rate']}'."
-
-            price_str = _format_price(item["price"])
-            qty_str = _format_quantity(item["qty"])
-
-            item_command = f"{tax_command}{price_str}{qty_str}{item['desc']}"
-
-            response = printer.send_command(item_command)
-            if response != FiscalPrinter._ACK:
-                return f"Error al agregar el ítem '{item['desc']}'. La impresora no aceptó el comando."
-            time.sleep(0.2)
-
-        # --- 3. Cerrar la Nota de Crédito (Pago directo con medio de pago 01) ---
-        close_response = printer.send_command("101")
-        if close_response == FiscalPrinter._ACK:
-            return "Nota de Crédito enviada y cerrada correctamente. La impresora debería estar imprimiendo."
+        document = compile_credit_note(affected_doc, customer_data, items)
+    except ValueError as e:
+        return f"Error: {e}"
+    return transmit_document(printer, document)
+
+
+# --- Documentos no fiscales ---
+
+NON_FISCAL_NAME = "Documento no fiscal"
+NON_FISCAL_TEXT_COMMAND = "800"  # 80 + atributo de la línea (0: texto normal)
+NON_FISCAL_CLOSE_COMMAND = "810"
+
+
+def wrap_non_fiscal_text(text: str, width: int = NON_FISCAL_LINE_WIDTH) -> list:
+    """
+    Ajusta el texto al ancho de la impresora: respeta los saltos de línea
+    (también las líneas en blanco) y parte en palabras las líneas largas.
+    """
+    lines = []
+    for paragraph in text.expandtabs(4).splitlines():
+        paragraph = paragraph.rstrip()
+        if len(paragraph) <= width:
+            lines.append(paragraph)  # Lo habitual: no hace falta textwrap
         else:
-            printer.send_command(
-                "7"
-            )  # Intentar anular el documento en curso si falla el cierre
-            return "Error al cerrar la Nota de Crédito. Se ha intentado anular el documento en la impresora."
+            lines.extend(textwrap.wrap(paragraph, width, break_on_hyphens=False))
+    return lines
 
-    except (ConnectionError, ValueError) as e:
-        return f"Error durante el envío de la Nota de Crédito: {e}"
+
+def compile_non_fiscal(lines: list) -> CompiledDocument:
+    """
+    Codifica las líneas (ya ajustadas al ancho) de un documento no fiscal,
+    con su cierre. Las tramas quedan listas antes de tomar la impresora.
+    """
+    if not lines:
+        raise ValueError("El documento no fiscal no tiene texto.")
+    frames = []
+    for line in lines:
+        command = NON_FISCAL_TEXT_COMMAND + line
+        frames.append(
+            EncodedFrame("text", command, _encode(command, line), description=line)
+        )
+    frames.append(
+        EncodedFrame(
+            "close", NON_FISCAL_CLOSE_COMMAND, _encode(NON_FISCAL_CLOSE_COMMAND)
+        )
+    )
+    return CompiledDocument("non_fiscal", frames, len(lines), 0)
+
+
+def _interrupt_non_fiscal(printer: FiscalPrinter, document, printed, reason) -> str:
+    """Cierra (810) el documento si quedó abierto, para no bloquear la impresora."""
+    message = (
+        f"Error: {NON_FISCAL_NAME} interrumpido tras {printed} de "
+        f"{document.item_count} líneas ({reason})."
+    )
+    try:
+        sts1, _ = printer.get_status()
+        if sts1 in STS1_NON_FISCAL_TRANSACTION:
+            if printer.send_command(NON_FISCAL_CLOSE_COMMAND) == FiscalPrinter._ACK:
+                message += " Se cerró el documento en la impresora."
+    except OSError:
+        pass
+    return message
+
+
+@tracing.traced("transmit_non_fiscal")
+def transmit_non_fiscal(
+    printer: FiscalPrinter,
+    document: CompiledDocument,
+    on_progress=None,
+    max_retries=FRAME_RETRIES,
+    backoff=FRAME_RETRY_BACKOFF,
+) -> str:
+    """
+    Envía un documento no fiscal ya compilado. Cada trama sale apenas llega el
+    ACK de la anterior (la impresora no acepta más de una trama sin
+    confirmar), sin pausas fijas por línea. on_progress(lineas_impresas) se
+    llama tras cada línea confirmada.
+
+    Una trama sin ACK se reintenta: si el ACK se había perdido la línea sale
+    repetida, lo que en un texto no fiscal no tiene efecto contable. Si la
+    impresora no la acepta, el documento se cierra para no bloquear la caja.
+    """
+    printed, assigned = 0, None
+    for frame in document.frames:
+        retries = 0
+        while True:
+            try:
+                response = printer.send_frame(frame.data, frame.command[:3])
+            except OSError as e:
+                return _interrupt_non_fiscal(
+                    printer, document, printed, f"error de comunicación ({e})"
+                )
+            if response == FiscalPrinter._ACK:
+                break
+            retries += 1
+            if retries > max_retries:
+                return _interrupt_non_fiscal(
+                    printer, document, printed, "la impresora no aceptó el comando"
+                )
+            time.sleep(backoff * retries)
+        if frame.role == "close":
+            assigned = counters.counters_for(printer.port).advance(document.kind)
+        elif frame.role == "text":
+            printed += 1
+            if on_progress:
+                on_progress(printed)
+    name = (
+        NON_FISCAL_NAME if assigned is None else f"{NON_FISCAL_NAME} N° {assigned[0]}"
+    )
+    return f"{name} impreso correctamente ({printed} líneas)."
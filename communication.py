@@ -1,9 +1,65 @@
 # communication.py
-import serial
+import contextlib
+import json
+import os
+import threading
 import time
+import serial
+
+import emulator
+import tracing
 
 # Ya no importamos SERIAL_PORT, pero sí el resto de la configuración
-from config import BAUDRATE, PARITY, STOPBITS, BYTESIZE
+from config import (
+    BAUDRATE,
+    PARITY,
+    STOPBITS,
+    BYTESIZE,
+    SUPPORTED_BAUDRATES,
+    BAUDRATE_PROBE_TIMEOUT,
+    BAUDRATE_STORE_FILE,
+    BAUDRATE_FLAG,
+    BAUDRATE_FLAG_VALUES,
+    COMPLETION_TIMEOUT,
+    COMPLETION_POLL_INITIAL,
+    COMPLETION_POLL_MAX,
+    COMPLETION_ENQ_TIMEOUT,
+    LINK_TIMEOUT_LIMIT,
+)
+
+
+def load_saved_baudrate(port):
+    """Devuelve la velocidad negociada previamente para 'port', o None."""
+    try:
+        with open(BAUDRATE_STORE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get(port)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baudrate(port, baudrate):
+    """Guarda la velocidad negociada para 'port' en BAUDRATE_STORE_FILE."""
+    try:
+        with open(BAUDRATE_STORE_FILE, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    saved[port] = baudrate
+    tmp_path = BAUDRATE_STORE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(tmp_path, BAUDRATE_STORE_FILE)
+
+
+def _describe_response(response):
+    """Clasifica una respuesta de la impresora para las trazas."""
+    if response == FiscalPrinter._ACK:
+        return "ACK"
+    if response == FiscalPrinter._NAK:
+        return "NAK"
+    if not response:
+        return "timeout"
+    return f"data ({len(response)} bytes)"
 
 
 class FiscalPrinter:
@@ -17,17 +73,39 @@ class FiscalPrinter:
     _ACK = b"\x06"
     _NAK = b"\x15"
     _ENQ = b"\x05"
+    _ETB = b"\x17"
+    _EOT = b"\x04"
+    # Valores de STS1 "en Espera" (sin transacción en curso).
+    # Referencia: Manual, Página 18, Tabla 7.
+    _STS1_IDLE = frozenset({b"\x40", b"\x60", b"\x68"})
 
     def __init__(
-        self, port, baudrate=BAUDRATE, timeout=2
+        self, port, baudrate=BAUDRATE, timeout=2, autobaud=True
     ):  # 'port' ahora es un argumento obligatorio
         """
         Inicializa la conexión serial.
+        Con autobaud=True, al conectar se usa la velocidad guardada para el puerto
+        y, si la impresora no responde, se detecta probando SUPPORTED_BAUDRATES.
         """
         self.port = port
+        # Puerto abierto realmente. Si la impresora reaparece con otro nombre
+        # (ver link_supervisor.py) cambia 'device' y no 'port', que sigue
+        # identificando a la impresora en el diario, los contadores, etc.
+        self.device = port
         self.baudrate = baudrate
         self.timeout = timeout
+        self.autobaud = autobaud
         self.serial_connection = None
+        self.serial_number = None  # Serial fiscal (S5), se lee al iniciar el servidor
+        # Salud del enlace: se marca caído tras un error de E/S o
+        # LINK_TIMEOUT_LIMIT respuestas vacías seguidas.
+        self.link_lost = threading.Event()
+        self.link_error = None
+        self.on_link_lost = None  # Se llama con el motivo al detectar la caída
+        self._silent_replies = 0
+        # Inicio (monotonic) de la operación con el puerto en curso, o None; lo
+        # usa el supervisor de workers para detectar un driver colgado.
+        self._io_since = None
         # La lógica de conexión se mueve al método connect() para ser llamada por el usuario
 
     def connect(self):
@@ -35,56 +113,282 @@ class FiscalPrinter:
         if self.serial_connection and self.serial_connection.is_open:
             print("La conexión ya está abierta.")
             return
+        if self.autobaud:
+            self.baudrate = load_saved_baudrate(self.port) or self.baudrate
         try:
-            self.serial_connection = serial.Serial(
-                port=self.port,
-                baudrate=self.baudrate,
-                parity=PARITY,
-                stopbits=STOPBITS,
-                bytesize=BYTESIZE,
-                timeout=self.timeout,
-            )
-            print(f"Conexión establecida en el puerto {self.port}.")
+            if self.device.startswith(emulator.EMULATOR_PREFIX):
+                self.serial_connection = emulator.open_emulator(
+                    self.device, self.baudrate, self.timeout
+                )
+            else:
+                self.serial_connection = serial.Serial(
+                    port=self.device,
+                    baudrate=self.baudrate,
+                    parity=PARITY,
+                    stopbits=STOPBITS,
+                    bytesize=BYTESIZE,
+                    timeout=self.timeout,
+                    # Sin compartir el puerto: otro proceso (u otro worker) no
+                    # puede abrirlo mientras esté en uso.
+                    exclusive=True,
+                )
+            print(f"Conexión establecida en el puerto {self.device}.")
         except serial.SerialException as e:
-            print(f"Error al abrir el puerto {self.port}: {e}")
-            raise ConnectionError(f"No se pudo conectar a la impresora en {self.port}.")
+            print(f"Error al abrir el puerto {self.device}: {e}")
+            raise ConnectionError(
+                f"No se pudo conectar a la impresora en {self.device}."
+            )
+
+        if self.autobaud and not self.probe_baudrate(self.baudrate):
+            if self.detect_baudrate() is None:
+                print(
+                    f"La impresora no respondió en ninguna velocidad; "
+                    f"se mantiene {self.baudrate} bps."
+                )
+
+    # --- Negociación de la velocidad del puerto ---
+
+    def probe_baudrate(self, baudrate):
+        """
+        Configura el puerto a 'baudrate' y envía ENQ. Devuelve True si la impresora
+        respondió con una trama de status válida a esa velocidad.
+        """
+        connection = self.serial_connection
+        connection.baudrate = baudrate
+        connection.reset_input_buffer()
+        previous_timeout = connection.timeout
+        connection.timeout = BAUDRATE_PROBE_TIMEOUT
+        try:
+            sts1_byte, _ = self._query_status()
+        finally:
+            connection.timeout = previous_timeout
+        return sts1_byte is not None
+
+    def detect_baudrate(self, candidates=SUPPORTED_BAUDRATES):
+        """
+        Prueba las velocidades candidatas (empezando por la actual) hasta que la
+        impresora responda al ENQ. Guarda y devuelve la velocidad encontrada,
+        o None si no respondió en ninguna (se restaura la velocidad anterior).
+        """
+        ordered = [self.baudrate] + [b for b in candidates if b != self.baudrate]
+        for baudrate in ordered:
+            if self.probe_baudrate(baudrate):
+                print(f"Impresora detectada a {baudrate} bps en {self.device}.")
+                self.baudrate = baudrate
+                save_baudrate(self.port, baudrate)
+                return baudrate
+        self.serial_connection.baudrate = self.baudrate
+        return None
+
+    def set_printer_baudrate(self, baudrate):
+        """
+        Reprograma la velocidad del puerto de la impresora con el comando PJ
+        (bandera BAUDRATE_FLAG) y cambia la velocidad local para seguirla.
+        Referencia: Manual, Página 24, Tabla 21.
+        Devuelve True si la impresora respondió a la nueva velocidad.
+        """
+        if BAUDRATE_FLAG is None:
+            raise ValueError(
+                "BAUDRATE_FLAG no está configurado para este modelo de impresora."
+            )
+        if baudrate not in BAUDRATE_FLAG_VALUES:
+            raise ValueError(f"Velocidad no soportada: {baudrate} bps.")
+
+        response = self.send_command(
+            f"PJ{BAUDRATE_FLAG}{BAUDRATE_FLAG_VALUES[baudrate]}"
+        )
+        if response != self._ACK:
+            return False
+
+        if self.probe_baudrate(baudrate):
+            self.baudrate = baudrate
+            save_baudrate(self.port, baudrate)
+            print(f"Velocidad del puerto cambiada a {baudrate} bps.")
+            return True
+        # La impresora no quedó a la velocidad pedida: volvemos a buscarla.
+        self.detect_baudrate()
+        return False
 
     # ... el resto de la clase (calculate_lrc, send_command, etc.) no cambia ...
 
-    def _calculate_lrc(self, data_bytes):
+    @classmethod
+    def _calculate_lrc(cls, data_bytes):
         lrc = 0
         for byte in data_bytes:
             lrc ^= byte
-        lrc ^= self._ETX[0]
+        lrc ^= cls._ETX[0]
         return bytes([lrc])
 
+    @classmethod
+    def build_frame(cls, command_data_str):
+        """
+        Arma la trama STX + DATOS + ETX + LRC de un comando. No usa el puerto,
+        por lo que se puede llamar sin tener el lock de la impresora.
+        Referencia: Manual, Página 16.
+        """
+        return cls.frame_bytes(command_data_str.encode("ascii"))
+
+    @classmethod
+    def frame_bytes(cls, command_bytes):
+        """Como build_frame(), para datos ya codificados en ASCII."""
+        return cls._STX + command_bytes + cls._ETX + cls._calculate_lrc(command_bytes)
+
     def send_command(self, command_data_str):
-        if not self.serial_connection or not self.serial_connection.is_open:
-            raise ConnectionError("La conexión serial no está abierta.")
+        return self.send_frame(self.build_frame(command_data_str), command_data_str[:3])
 
-        command_bytes = command_data_str.encode("ascii")
-        lrc = self._calculate_lrc(command_bytes)
-        frame = self._STX + command_bytes + self._ETX + lrc
+    def send_frame(self, frame, command_label=""):
+        """Envía una trama ya armada con build_frame() y devuelve la respuesta."""
+        self._check_link()
 
-        print(f"-> Enviando Trama: {frame}")
-        self.serial_connection.write(frame)
-        time.sleep(0.1)
-        return self.read_response()
+        # Un span por trama: código de comando (sin datos del cliente) y respuesta.
+        with tracing.span("frame", command=command_label, bytes=len(frame)):
+            print(f"-> Enviando Trama: {frame}")
+            try:
+                with self._serial_io():
+                    self.serial_connection.write(frame)
+                    response = self.read_response()
+            except OSError as e:
+                raise self._io_error(e) from e
+            tracing.set_attribute("response", _describe_response(response))
+        self._count_reply(response)
+        return response
 
     def read_response(self):
-        response = self.serial_connection.read_until(self._ETX)
-        if self._ETX in response:
-            lrc_byte = self.serial_connection.read(1)
-            response += lrc_byte
+        # Los comandos simples responden con un solo byte (ACK/NAK): no hay que
+        # esperar un ETX que nunca llegará.
+        response = self.serial_connection.read(1)
+        if response and response not in (self._ACK, self._NAK):
+            response += self.serial_connection.read_until(self._ETX)
+            if response.endswith(self._ETX):
+                lrc_byte = self.serial_connection.read(1)
+                response += lrc_byte
 
         print(f"<- Recibido: {response}")
         return response
 
+    def send_upload_command(self, command_data_str, max_retries=3):
+        """
+        Envía un comando de descarga (ej: U3A) cuya respuesta llega en varios
+        bloques STX + DATOS + ETB + LRC. Cada bloque se confirma con ACK (o se
+        pide de nuevo con NAK si el LRC no coincide) hasta recibir EOT.
+        Devuelve los datos de todos los bloques concatenados.
+        """
+        self._check_link()
+        try:
+            with self._serial_io():
+                return self._upload(command_data_str, max_retries)
+        except ConnectionError:
+            raise
+        except OSError as e:
+            raise self._io_error(e) from e
+
+    def _upload(self, command_data_str, max_retries):
+        data = bytearray()
+        retries = 0
+        with tracing.span("upload", command=command_data_str[:3]) as span:
+            self.serial_connection.write(self.build_frame(command_data_str))
+            while True:
+                first = self.serial_connection.read(1)
+                if first == self._EOT:
+                    break
+                if first == self._NAK:
+                    raise ValueError("La impresora rechazó el comando de descarga.")
+                block = first + self.serial_connection.read_until(self._ETB)
+                lrc = self.serial_connection.read(1)
+                payload = block[1:-1]
+                valid = (
+                    block.startswith(self._STX)
+                    and block.endswith(self._ETB)
+                    and lrc == self._block_lrc(payload)
+                )
+                if not valid:
+                    retries += 1
+                    if not first or retries > max_retries:
+                        raise ConnectionError("Descarga interrumpida: bloque inválido.")
+                    self.serial_connection.write(self._NAK)
+                    continue
+                data += payload
+                retries = 0
+                self._io_since = time.monotonic()  # La descarga avanza
+                self.serial_connection.write(self._ACK)
+            if span is not None:
+                span.attrs["bytes"] = len(data)
+        print(f"<- Descarga {command_data_str[:3]}: {len(data)} bytes")
+        return bytes(data)
+
+    @classmethod
+    def _block_lrc(cls, data_bytes):
+        lrc = 0
+        for byte in data_bytes + cls._ETB:
+            lrc ^= byte
+        return bytes([lrc])
+
     def close(self):
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
             print("Conexión serial cerrada.")
 
+    # --- Salud del enlace (ver link_supervisor.py) ---
+
+    def _check_link(self):
+        if not self.serial_connection or not self.serial_connection.is_open:
+            raise ConnectionError("La conexión serial no está abierta.")
+        if self.link_lost.is_set():
+            raise ConnectionError(
+                f"Enlace con la impresora caído ({self.link_error}); reconectando."
+            )
+
+    def _lose_link(self, reason):
+        if not self.link_lost.is_set():
+            self.link_error = reason
+            print(f"Enlace con la impresora en {self.device} caído: {reason}.")
+            self.link_lost.set()
+            if self.on_link_lost:
+                self.on_link_lost(reason)
+
+    @contextlib.contextmanager
+    def _serial_io(self):
+        """Marca una operación con el puerto en curso (ver io_stalled_seconds())."""
+        self._io_since = time.monotonic()
+        try:
+            yield
+        finally:
+            self._io_since = None
+
+    def io_stalled_seconds(self):
+        """
+        Segundos que lleva sin avanzar la operación con el puerto en curso (0 si
+        no hay ninguna). Las lecturas tienen timeout: un valor que sigue
+        creciendo indica una llamada al driver serie colgada.
+        """
+        since = self._io_since
+        return 0.0 if since is None else time.monotonic() - since
+
+    def _io_error(self, error):
+        """Un error de E/S del puerto (adaptador desconectado): el enlace cae."""
+        self._lose_link(f"error de E/S ({error})")
+        return ConnectionError(f"Error de comunicación con la impresora: {error}")
+
+    def _count_reply(self, response):
+        """Cuenta las respuestas vacías seguidas; cualquier respuesta las reinicia."""
+        if response:
+            self._silent_replies = 0
+            return
+        self._silent_replies += 1
+        if self._silent_replies >= LINK_TIMEOUT_LIMIT:
+            self._lose_link(f"{self._silent_replies} comandos seguidos sin respuesta")
+
+    def replace_connection(self, connection, device):
+        """
+        Adopta una conexión ya abierta y verificada (la impresora respondió en
+        'device') y da el enlace por restablecido.
+        """
+        self.serial_connection = connection
+        self.device = device
+        self._silent_replies = 0
+        self.link_error = None
+        self.link_lost.clear()
+
     # communication.py -> Añadir este método dentro de la clase FiscalPrinter
 
     def get_status(self):
@@ -93,17 +397,30 @@ class FiscalPrinter:
         Este es un comando especial que no usa la trama STX/ETX.
         Referencia: Manual, Página 17 y 18.
         """
-        if not self.serial_connection or not self.serial_connection.is_open:
-            raise ConnectionError("La conexión serial no está abierta.")
+        sts1_byte, sts2_byte = self._query_status()
+        self._count_reply(sts1_byte)
+        return sts1_byte, sts2_byte
+
+    def _query_status(self):
+        """
+        ENQ sin contar la falta de respuesta como falla del enlace: lo usan la
+        detección de velocidad y la espera de operaciones largas, en las que
+        la impresora puede no responder con el enlace sano.
+        """
+        self._check_link()
 
         enq_command = self._ENQ  # b'\x05'
-        print(f"-> Enviando ENQ: {enq_command}")
-        self.serial_connection.write(enq_command)
-        time.sleep(0.1)
+        with tracing.span("enq"):
+            print(f"-> Enviando ENQ: {enq_command}")
+            try:
+                with self._serial_io():
+                    self.serial_connection.write(enq_command)
 
-        # La respuesta esperada es: STX STS1 STS2 ETX LRC (5 bytes en total)
-        response = self.serial_connection.read(5)
-        print(f"<- Recibido de ENQ: {response}")
+                    # La respuesta esperada es: STX STS1 STS2 ETX LRC (5 bytes)
+                    response = self.serial_connection.read(5)
+            except OSError as e:
+                raise self._io_error(e) from e
+            print(f"<- Recibido de ENQ: {response}")
 
         # Verificamos que la respuesta tenga el formato correcto
         if (
@@ -117,3 +434,49 @@ class FiscalPrinter:
 
         # Si la respuesta no es la esperada
         return None, None
+
+    def await_completion(
+        self,
+        timeout=COMPLETION_TIMEOUT,
+        initial_interval=COMPLETION_POLL_INITIAL,
+        max_interval=COMPLETION_POLL_MAX,
+    ):
+        """
+        Espera a que termine una operación larga (Reporte X/Z, reimpresión,
+        programación) consultando ENQ hasta que STS1 indique "en Espera".
+        Mientras imprime la impresora puede no responder al ENQ; eso cuenta
+        como ocupada. El intervalo entre consultas empieza en initial_interval
+        y se duplica hasta max_interval, de modo que una operación corta se
+        detecta enseguida sin saturar el puerto durante una larga. Cada ENQ
+        espera a lo sumo COMPLETION_ENQ_TIMEOUT, así que el fin de la operación
+        se detecta con ese retraso y no con el timeout normal del puerto.
+
+        Devuelve los segundos que tardó en quedar en Espera, o None si no lo
+        hizo antes de 'timeout' segundos. Lanza ConnectionError si el puerto
+        no está abierto.
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = initial_interval
+        connection = self.serial_connection
+        if not connection or not connection.is_open:
+            raise ConnectionError("La conexión serial no está abierta.")
+        previous_timeout = connection.timeout
+        with tracing.span("await_completion"):
+            while True:
+                # Descarta una respuesta tardía a un ENQ anterior.
+                connection.reset_input_buffer()
+                connection.timeout = min(
+                    previous_timeout or COMPLETION_ENQ_TIMEOUT, COMPLETION_ENQ_TIMEOUT
+                )
+                try:
+                    sts1_byte, _ = self._query_status()
+                finally:
+                    connection.timeout = previous_timeout
+                now = time.monotonic()
+                if sts1_byte in self._STS1_IDLE:
+                    return now - start
+                if now >= deadline:
+                    return None
+                time.sleep(min(interval, deadline - now))
+                interval = min(interval * 2, max_interval)
@@ -7,3 +7,120 @@ BAUDRATE = 9600
 PARITY = "E"  # Par (Even)
 STOPBITS = 1
 BYTESIZE = 8
+
+# Velocidades que admite la familia de impresoras. Se prueban en este orden (después
+# de la velocidad guardada para el puerto) al detectar la velocidad con ENQ.
+SUPPORTED_BAUDRATES = [9600, 19200, 38400, 57600, 115200]
+BAUDRATE_PROBE_TIMEOUT = 0.3  # Segundos de espera de la respuesta ENQ en cada prueba
+BAUDRATE_STORE_FILE = "baudrates.json"  # Velocidad negociada por puerto
+# Bandera (comando PJ) con la que se programa la velocidad del puerto de la impresora.
+# Depende del modelo (ver la lista de flags del equipo en el portal de The Factory HKA);
+# con None no se permite reprogramar la velocidad desde la aplicación.
+BAUDRATE_FLAG = None
+BAUDRATE_FLAG_VALUES = {9600: "00", 19200: "01", 38400: "02", 57600: "03", 115200: "04"}
+
+# Control de admisión de la API (ver admission.py)
+SERVER_STOP_TIMEOUT = 30.0  # Espera máxima a los documentos en curso al detener la API
+STATUS_POLL_INTERVAL = 2.0  # Segundos entre consultas ENQ del monitor de status
+MAX_QUEUE_WAIT = 60.0  # Espera máxima (segundos) aceptable para un documento en cola
+
+# Modelo de tiempo de servicio (ver service_model.py). Valores iniciales en segundos,
+# se ajustan con las duraciones medidas.
+DEFAULT_DOCUMENT_SERVICE_TIME = 2.0  # Costo fijo por documento (apertura y cierre)
+DEFAULT_ITEM_SERVICE_TIME = 0.4  # Costo por ítem
+DEFAULT_HEADER_SERVICE_TIME = 0.2  # Costo por línea de encabezado (iR*, iS*, ...)
+DEFAULT_Z_REPORT_SERVICE_TIME = 30.0  # Duración del Reporte Z
+JOB_HISTORY_SIZE = 500  # Trabajos terminados que se conservan para consulta
+
+# Trazas de extremo a extremo (ver tracing.py)
+TRACE_SAMPLE_RATE = 0.1  # Fracción de peticiones HTTP que se trazan (0.0 a 1.0)
+TRACE_FILE = "traces.jsonl"  # Un span por línea, en formato JSON
+TRACE_QUEUE_SIZE = 10000  # Spans pendientes de escribir antes de empezar a descartar
+
+# Supervisión del enlace serie (ver link_supervisor.py)
+LINK_TIMEOUT_LIMIT = 3  # Comandos seguidos sin respuesta para dar el enlace por caído
+LINK_RECONNECT_INITIAL = 0.1  # Primera espera entre intentos de reconexión (se duplica)
+LINK_RECONNECT_MAX = 1.0  # Espera máxima entre intentos de reconexión
+LINK_WATCH_INTERVAL = 0.2  # Segundos entre revisiones del estado del enlace
+
+# Espera del fin de operaciones largas (reportes, reimpresiones): se consulta
+# ENQ con intervalos crecientes hasta que STS1 vuelve a "en Espera".
+COMPLETION_TIMEOUT = 180.0  # Segundos máximos de espera
+COMPLETION_POLL_INITIAL = 0.1  # Primer intervalo entre consultas ENQ
+COMPLETION_POLL_MAX = 2.0  # Intervalo máximo (se duplica en cada consulta)
+COMPLETION_ENQ_TIMEOUT = 0.2  # Espera de la respuesta a cada ENQ mientras imprime
+
+# Recuperación de documentos en curso (ver DocumentTransaction en commands.py)
+FRAME_RETRIES = 3  # Reintentos de una trama sin ACK antes de suspender o anular
+FRAME_RETRY_BACKOFF = 0.5  # Segundos de espera antes de cada reintento (se multiplica)
+
+# Sesiones de documento por líneas (ver sessions.py)
+SESSION_IDLE_TIMEOUT = 300.0  # Segundos sin líneas nuevas antes de anular el documento
+SESSION_EXPECTED_ITEMS = 10  # Ítems supuestos al estimar la duración de una sesión
+
+# Documentos no fiscales (ver commands.py y POST /non_fiscal)
+NON_FISCAL_LINE_WIDTH = 40  # Columnas de texto por línea (depende del modelo)
+NON_FISCAL_PART_LINES = 100  # Líneas por documento; entre documentos pasan facturas
+NON_FISCAL_PROGRESS_EVERY = 20  # Líneas entre avisos de progreso en la respuesta
+
+# Archivo local de Reportes Z (ver z_archive.py)
+Z_ARCHIVE_FILE = "z_archive.sqlite3"
+Z_ARCHIVE_CHUNK = 20  # Reportes Z por descarga; entre descargas se atienden documentos
+
+# Catálogo local de productos (ver catalog.py): {"SKU": {"desc", "price", "tax_rate"}}
+CATALOG_FILE = "catalog.json"
+CATALOG_RELOAD_CHECK = 2.0  # Segundos entre revisiones de cambios en el archivo
+
+# Reimpresión de rangos de Reportes Z (ver z_reprint.py)
+Z_REPRINT_CHUNK = 5  # Reportes Z por comando RZ; entre tramos se atienden documentos
+
+# Serie de ventas intradía (ver sales_sampler.py)
+SALES_SAMPLE_INTERVAL = 60.0  # Segundos entre lecturas del Reporte X (U0X)
+SALES_RING_CAPACITY = 10080  # Muestras por impresora (una semana a 1 por minuto)
+SALES_RING_DIR = "sales_series"  # Carpeta de los archivos circulares
+
+# Diario local de documentos impresos y conciliación antes del Z (ver journal.py)
+JOURNAL_FILE = "journal.sqlite3"
+# Porcentaje de IVA de las tasas General, Reducida y Adicional. Debe coincidir
+# con lo programado en la impresora.
+TAX_RATE_PERCENTAGES = (16, 8, 31)
+
+# Índice local de facturas emitidas, para las notas de crédito (ver document_index.py)
+INVOICE_INDEX_FILE = "invoice_index.sqlite3"
+INVOICE_INDEX_CACHE = 5000  # Facturas recientes que se mantienen en memoria
+
+# Cierre diario con vaciado de la cola (ver z_closing.py)
+Z_DRAIN_TIMEOUT = 360.0  # Espera máxima a que se vacíe la cola antes del Reporte Z
+Z_IDLE_TIMEOUT = 180.0  # Espera máxima a que la impresora quede en Espera
+Z_SCHEDULE_TIME = None  # Hora del cierre automático ("HH:MM"); None lo desactiva
+
+# Claves de API y límites por cliente (ver auth.py). Sin archivo de claves la
+# API no exige autenticación. Formato:
+# {"clave": {"name": "caja1", "documents_per_minute": 20, "status_per_second": 2,
+#            "max_queued": 3}}
+API_KEYS_FILE = "api_keys.json"
+API_DEFAULT_DOCUMENTS_PER_MINUTE = 30.0
+API_DEFAULT_DOCUMENT_BURST = 5  # Documentos seguidos antes de aplicar el ritmo
+API_DEFAULT_STATUS_PER_SECOND = 2.0  # Consultas (status, trabajos, sesiones)
+API_DEFAULT_MAX_QUEUED = 5  # Documentos en cola o imprimiéndose por cliente
+
+# Modo sombra (ver shadow.py): todos los documentos de la API se validan,
+# codifican y envían al emulador por una cola propia, con el mismo control de
+# admisión, sin imprimir. Por petición (sin cola): "dry_run": true.
+SHADOW_MODE = False
+
+# Gateway entre varias impresoras (ver gateway.py)
+GATEWAY_NODES = []  # URLs de los nodos, ej: ["http://192.168.68.109:5000"]
+GATEWAY_AFFINITY = {}  # Terminal (X-Terminal-Id) -> URL del nodo preferido
+GATEWAY_HEALTH_INTERVAL = 2.0  # Segundos entre chequeos de /status de cada nodo
+GATEWAY_HEALTH_TIMEOUT = 1.0  # Espera máxima de la respuesta del chequeo
+GATEWAY_TIMEOUT = 300.0  # Espera máxima de un documento reenviado a un nodo
+GATEWAY_API_KEY = None  # Clave con la que el gateway consulta /status de los nodos
+
+# Un proceso por impresora (ver workers.py y python main.py --workers)
+WORKER_BASE_PORT = 5101  # Puerto HTTP local del primer worker; los demás siguen
+WORKER_STATUS_INTERVAL = 0.25  # Segundos entre publicaciones del status compartido
+WORKER_HEARTBEAT_TIMEOUT = 10.0  # Un worker que no publica en este plazo se reinicia
+WORKER_IO_TIMEOUT = 30.0  # Operación serie sin avanzar en este plazo: driver colgado
+WORKER_RESTART_INITIAL = 1.0  # Espera antes de reiniciar un worker caído (se duplica)
+WORKER_RESTART_MAX = 30.0  # Espera máxima entre reinicios de un worker
@@ -0,0 +1,102 @@
+# counters.py
+import threading
+from datetime import datetime
+
+# Campo de ReportXData con el último número emitido de cada tipo de documento.
+REPORT_FIELDS = {
+    "invoice": "numero_ultima_factura",
+    "credit_note": "numero_ultima_nc",
+    "non_fiscal": "numero_ultimo_doc_no_fiscal",
+}
+
+
+class DocumentCounters:
+    """
+    Último número emitido de cada tipo de documento de una impresora, llevado
+    en memoria para informar el número de cada documento sin consultar la
+    impresora (U0X/S1) después del cierre.
+
+    Se inicializa con el Reporte X al conectar y avanza con cada cierre
+    confirmado (ACK). verify() lo compara con un Reporte X leído en un momento
+    ocioso: si no coincide (ej: un documento emitido desde otra aplicación)
+    se corrige con lo que informa la impresora.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = dict.fromkeys(REPORT_FIELDS)
+        self.seeded_at = None
+        self.verified_at = None
+        self.corrections = 0
+
+    @property
+    def seeded(self):
+        return self.seeded_at is not None
+
+    def _load(self, report):
+        for kind, field in REPORT_FIELDS.items():
+            self._last[kind] = getattr(report, field)
+        self.verified_at = datetime.now()
+
+    def seed(self, report):
+        """Toma los números del Reporte X (ReportXData) leído al conectar."""
+        with self._lock:
+            self._load(report)
+            self.seeded_at = self.verified_at
+
+    def advance(self, kind):
+        """
+        Asigna el número siguiente al documento que se acaba de cerrar.
+        Devuelve (número, hora) o None si los contadores no se inicializaron.
+        """
+        with self._lock:
+            if self._last.get(kind) is None:
+                return None
+            self._last[kind] += 1
+            return self._last[kind], datetime.now()
+
+    def verify(self, report):
+        """
+        Compara con un Reporte X leído con la impresora tomada (sin documentos
+        en curso) y corrige las diferencias. Devuelve {tipo: (local, impresora)}.
+        """
+        with self._lock:
+            differences = {
+                kind: (self._last[kind], getattr(report, field))
+                for kind, field in REPORT_FIELDS.items()
+                if self.seeded_at and self._last[kind] != getattr(report, field)
+            }
+            self._load(report)
+            self.seeded_at = self.seeded_at or self.verified_at
+            if differences:
+                self.corrections += 1
+        if differences:
+            print(
+                f"Contadores de documentos corregidos con el Reporte X: {differences}"
+            )
+        return differences
+
+    def snapshot(self):
+        def iso(value):
+            return value.isoformat(timespec="seconds") if value else None
+
+        with self._lock:
+            return {
+                "last": dict(self._last),
+                "seeded_at": iso(self.seeded_at),
+                "verified_at": iso(self.verified_at),
+                "corrections": self.corrections,
+            }
+
+
+# Contadores por impresora, identificada por su puerto serial.
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def counters_for(printer_key):
+    """Devuelve (creándolos si hace falta) los contadores de la impresora indicada."""
+    with _counters_lock:
+        if printer_key not in _counters:
+            _counters[printer_key] = DocumentCounters()
+        return _counters[printer_key]
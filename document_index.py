@@ -0,0 +1,216 @@
+# document_index.py
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from config import INVOICE_INDEX_FILE, INVOICE_INDEX_CACHE
+
+
+@dataclass
+class IndexedLine:
+    """Una línea de una factura emitida, con la cantidad ya devuelta en notas de crédito."""
+
+    desc: str
+    price_cents: int
+    qty_millis: int
+    tax_index: int  # 0: exento, 1: general, 2: reducida, 3: adicional
+    returned_millis: int = 0
+
+    @property
+    def available_millis(self):
+        return self.qty_millis - self.returned_millis
+
+
+@dataclass
+class IndexedInvoice:
+    """Datos de una factura emitida necesarios para su nota de crédito."""
+
+    serial: str
+    number: int
+    date: str  # DD/MM/AAAA, como lo pide el encabezado iD*
+    rif: str
+    name: str
+    lines: list
+
+    @property
+    def affected_doc(self):
+        """Datos de la factura afectada para los encabezados de la nota de crédito."""
+        return {"number": str(self.number), "date": self.date, "serial": self.serial}
+
+    @property
+    def customer_data(self):
+        return {"rif": self.rif, "name": self.name}
+
+    def to_dict(self):
+        return {
+            "serial": self.serial,
+            "number": self.number,
+            "date": self.date,
+            "customer_data": self.customer_data,
+            "lines": [
+                {
+                    "line": position,
+                    "desc": line.desc,
+                    "price": str(Decimal(line.price_cents).scaleb(-2)),
+                    "qty": str(Decimal(line.qty_millis).scaleb(-3)),
+                    "returned": str(Decimal(line.returned_millis).scaleb(-3)),
+                    "tax_index": line.tax_index,
+                }
+                for position, line in enumerate(self.lines, start=1)
+            ],
+        }
+
+
+class InvoiceIndex:
+    """
+    Índice local de las facturas emitidas por esta aplicación, por serial de
+    la impresora y número: fecha, cliente y líneas, con lo ya devuelto.
+
+    Permite que una nota de crédito indique solo el número de la factura: los
+    encabezados (factura afectada, fecha, serial y cliente) salen del índice.
+    Las últimas INVOICE_INDEX_CACHE facturas consultadas o emitidas quedan en
+    memoria (búsqueda en un dict); las demás se leen por la clave primaria.
+    """
+
+    def __init__(self, path=INVOICE_INDEX_FILE, cache_size=INVOICE_INDEX_CACHE):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS invoices ("
+            "serial TEXT NOT NULL, number INTEGER NOT NULL, date TEXT NOT NULL, "
+            "rif TEXT NOT NULL, name TEXT NOT NULL, lines TEXT NOT NULL, "
+            "PRIMARY KEY (serial, number)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    # --- Caché ---
+
+    def _remember(self, invoice):
+        key = (invoice.serial, invoice.number)
+        self._cache[key] = invoice
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _lookup(self, serial, number):
+        invoice = self._cache.get((serial, number))
+        if invoice is not None:
+            self._cache.move_to_end((serial, number))
+            return invoice
+        row = self._db.execute(
+            "SELECT date, rif, name, lines FROM invoices WHERE serial = ? AND number = ?",
+            (serial, number),
+        ).fetchone()
+        if row is None:
+            return None
+        date, rif, name, lines = row
+        invoice = IndexedInvoice(
+            serial,
+            number,
+            date,
+            rif,
+            name,
+            [IndexedLine(*l) for l in json.loads(lines)],
+        )
+        self._remember(invoice)
+        return invoice
+
+    def _save_lines(self, invoice):
+        with self._db:
+            self._db.execute(
+                "UPDATE invoices SET lines = ? WHERE serial = ? AND number = ?",
+                (_dump_lines(invoice.lines), invoice.serial, invoice.number),
+            )
+
+    # --- Escritura ---
+
+    def add(self, invoice):
+        """Registra una factura emitida (IndexedInvoice)."""
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO invoices VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        invoice.serial,
+                        invoice.number,
+                        invoice.date,
+                        invoice.rif,
+                        invoice.name,
+                        _dump_lines(invoice.lines),
+                    ),
+                )
+            self._remember(invoice)
+
+    def claim_returns(self, serial, number, returns):
+        """
+        Reserva las cantidades a devolver {índice de línea: milésimas} de la
+        factura. Lanza ValueError si alguna supera lo que queda por devolver;
+        en ese caso no se reserva nada. Si la nota de crédito no llega a
+        cerrarse, se debe llamar a release_returns().
+        """
+        with self._lock:
+            invoice = self._lookup(serial, number)
+            if invoice is None:
+                raise ValueError(f"La factura {number} no está en el índice local.")
+            for index, qty_millis in returns.items():
+                line = invoice.lines[index]
+                if qty_millis > line.available_millis:
+                    raise ValueError(
+                        f"La línea {index + 1} ('{line.desc}') de la factura {number} "
+                        f"admite devolver {line.available_millis / 1000:g}, "
+                        f"se pidió {qty_millis / 1000:g}."
+                    )
+            for index, qty_millis in returns.items():
+                invoice.lines[index].returned_millis += qty_millis
+            self._save_lines(invoice)
+
+    def release_returns(self, serial, number, returns):
+        """Devuelve a la factura las cantidades reservadas por claim_returns()."""
+        with self._lock:
+            invoice = self._lookup(serial, number)
+            if invoice is None:
+                return
+            for index, qty_millis in returns.items():
+                line = invoice.lines[index]
+                line.returned_millis = max(0, line.returned_millis - qty_millis)
+            self._save_lines(invoice)
+
+    # --- Consultas ---
+
+    def get(self, serial, number):
+        """La factura indexada, o None. Con la caché caliente no toca SQLite."""
+        with self._lock:
+            return self._lookup(serial, number)
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+
+def _dump_lines(lines):
+    return json.dumps(
+        [
+            [l.desc, l.price_cents, l.qty_millis, l.tax_index, l.returned_millis]
+            for l in lines
+        ]
+    )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Devuelve (abriéndolo si hace falta) el índice de facturas de la aplicación."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = InvoiceIndex()
+        return _index
@@ -0,0 +1,591 @@
+# emulator.py
+# Emulador de impresora fiscal HKA80 para pruebas y benchmarks sin hardware.
+# Implementa la misma interfaz que serial.Serial que usa FiscalPrinter
+# (write, read, read_until, is_open, close, baudrate, reset_input_buffer).
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import serial
+
+from config import PARITY, STOPBITS, BYTESIZE
+
+STX = b"\x02"
+ETX = b"\x03"
+ACK = b"\x06"
+NAK = b"\x15"
+ENQ = b"\x05"
+ETB = b"\x17"
+EOT = b"\x04"
+
+# Prefijo de los "puertos" que FiscalPrinter abre con el emulador.
+EMULATOR_PREFIX = "emu://"
+
+# Tasas de IVA (porcentaje) que aplica el emulador a cada comando de ítem.
+_INVOICE_TAX_COMMANDS = {" ": 0, "!": 1, '"': 2, "#": 3}
+_CREDIT_NOTE_TAX_COMMANDS = {"d0": 0, "d1": 1, "d2": 2, "d3": 3}
+_TAX_RATES = {0: 0, 1: 16, 2: 8, 3: 31}
+
+
+def bits_per_char(parity=PARITY, stopbits=STOPBITS, bytesize=BYTESIZE):
+    """Bits en la línea por cada byte: inicio + datos + paridad + parada."""
+    return 1 + bytesize + (0 if parity == "N" else 1) + stopbits
+
+
+def wire_time(num_bytes, baudrate):
+    """Segundos que tarda en transmitirse num_bytes a la velocidad indicada."""
+    return num_bytes * bits_per_char() / baudrate
+
+
+def _lrc(data):
+    lrc = 0
+    for byte in data + ETX:
+        lrc ^= byte
+    return bytes([lrc])
+
+
+def _data_frame(text):
+    data = text.encode("ascii", errors="replace")
+    return STX + data + ETX + _lrc(data)
+
+
+def _data_block(text):
+    """Bloque intermedio de una descarga (STX + DATOS + ETB + LRC)."""
+    data = text.encode("ascii", errors="replace")
+    lrc = 0
+    for byte in data + ETB:
+        lrc ^= byte
+    return STX + data + ETB + bytes([lrc])
+
+
+class PrinterEmulator:
+    """
+    Simula una impresora fiscal conectada por puerto serial.
+
+    El tiempo de transmisión de cada trama se calcula con la velocidad del
+    puerto, de modo que los benchmarks reflejan el costo real de la línea.
+    Si la velocidad del host no coincide con la de la impresora, la impresora
+    no entiende las tramas y no responde (igual que con el equipo real).
+    """
+
+    def __init__(
+        self,
+        port="emu://HKA80",
+        printer_baudrate=9600,
+        item_delay=0.0,
+        close_delay=0.0,
+        report_delay=0.0,
+        serial_number="Z1F9999988",
+        rif="J-312171197",
+        listed=True,
+    ):
+        self.port = port
+        self.listed = listed  # Aparece en list_ports() (no las impresoras sombra)
+        self.printer_baudrate = printer_baudrate
+        self.item_delay = item_delay
+        self.close_delay = close_delay
+        self.report_delay = report_delay
+        self.serial_number = serial_number
+        self.rif = rif
+
+        # Estado del lado "host" del puerto (lo que configura FiscalPrinter)
+        self.baudrate = printer_baudrate
+        self.timeout = 2
+        self.is_open = False
+        self.plugged = True
+
+        self._lock = threading.Lock()
+        self._output = bytearray()
+        self._output_ready_at = 0.0
+        self._busy_until = 0.0
+        self.sts2 = b"\x40"
+        self.baudrate_flag = None  # (flag, {valor: baudios}) si se programa por PJ
+        self.frames_received = deque(maxlen=1000)  # Últimos comandos recibidos
+        self._faults = deque()  # Fallas de línea programadas con inject_fault()
+        self._command_faults = []  # [prefijo, falla, restantes] por comando
+        self._dropped_status = 0  # ENQ sin respuesta programados con drop_status()
+        self._upload = deque()  # Bloques pendientes de una descarga (U3A)
+        self.upload_block_records = 4  # Registros Z por bloque de descarga
+        self._reset_fiscal_state()
+
+    # --- Estado fiscal ---
+
+    def _reset_fiscal_state(self):
+        self.next_z = 1
+        self.last_z_date = "000000"
+        self.last_z_time = "0000"
+        self.last_invoice = 0
+        self.last_invoice_date = "000000"
+        self.last_invoice_time = "0000"
+        self.last_credit_note = 0
+        self.last_debit_note = 0
+        self.last_non_fiscal = 0
+        self.invoices_today = 0
+        self.credit_notes_today = 0
+        self.non_fiscal_today = 0
+        self.sales = [0] * 7  # exento, base1, iva1, base2, iva2, base3, iva3 (céntimos)
+        self.credit_notes = [0] * 7
+        self.z_history = []
+        self._document = None  # "invoice", "credit_note" o "non_fiscal"
+        self._doc_lines = []
+
+    @property
+    def sts1(self):
+        if self._document in ("invoice", "credit_note"):
+            return b"\x61"
+        if self._document == "non_fiscal":
+            return b"\x62"
+        return b"\x60"
+
+    def set_error(self, sts2_byte):
+        """Simula un error de la impresora (ej: b'\\x41' sin papel)."""
+        self.sts2 = sts2_byte
+
+    def inject_fault(self, kind, count=1, after=0, command=None):
+        """
+        Programa fallas de línea para 'count' tramas STX...ETX, a partir de la
+        que sigue a las próximas 'after' tramas:
+          "lost_ack": la impresora procesa la trama pero la respuesta se pierde.
+          "ignore":   la trama se pierde y la impresora no responde.
+          "nak":      la trama llega corrupta y la impresora responde NAK.
+        Con 'command' la falla afecta a las próximas 'count' tramas cuyo
+        comando empieza así (ej: "S2" o el comando de un ítem), sin importar
+        cuántas otras tramas se envíen antes. El ENQ no se ve afectado (ver
+        drop_status()).
+        """
+        if kind not in ("lost_ack", "ignore", "nak"):
+            raise ValueError(f"Falla desconocida '{kind}'.")
+        with self._lock:
+            if command is not None:
+                self._command_faults.append([command, kind, count])
+            else:
+                self._faults.extend([None] * after + [kind] * count)
+
+    def drop_status(self, count=1):
+        """Las próximas 'count' consultas de status (ENQ) no reciben respuesta."""
+        with self._lock:
+            self._dropped_status += count
+
+    def clear_faults(self):
+        """Descarta las fallas programadas que aún no ocurrieron."""
+        with self._lock:
+            self._faults.clear()
+            self._command_faults.clear()
+            self._dropped_status = 0
+
+    def _next_fault(self, data):
+        """Falla programada para la trama 'data' (con el lock tomado), o None."""
+        command = data[1:-2].decode("ascii", errors="replace")
+        for fault in self._command_faults:
+            prefix, kind, remaining = fault
+            if command.startswith(prefix):
+                if remaining <= 1:
+                    self._command_faults.remove(fault)
+                else:
+                    fault[2] -= 1
+                return kind
+        return self._faults.popleft() if self._faults else None
+
+    # --- Conexión y desconexión del adaptador USB-serial ---
+
+    def unplug(self):
+        """
+        Simula que se desconecta el adaptador: la conexión abierta falla con
+        SerialException en cada lectura o escritura y el puerto no se puede abrir.
+        """
+        with self._lock:
+            self.plugged = False
+            self._output.clear()
+
+    def plug(self, port=None):
+        """Vuelve a conectar el adaptador, opcionalmente con otro nombre de puerto."""
+        with _emulators_lock:
+            if port is not None and port != self.port:
+                _emulators.pop(self.port, None)
+                _emulators[port] = self
+                self.port = port
+        with self._lock:
+            self.plugged = True
+
+    def _check_plugged(self):
+        if not self.plugged:
+            raise serial.SerialException(
+                f"El dispositivo {self.port} fue desconectado."
+            )
+
+    # --- Interfaz tipo serial.Serial ---
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            return len(self._output) if time.monotonic() >= self._output_ready_at else 0
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._output.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def write(self, data):
+        self._check_plugged()
+        # Tiempo que la trama ocupa la línea desde el host hacia la impresora.
+        time.sleep(wire_time(len(data), self.baudrate))
+        now = time.monotonic()
+        if self.baudrate != self.printer_baudrate or now < self._busy_until:
+            return len(data)  # Trama ilegible u ocupada: no hay respuesta
+
+        fault = None
+        if data[:1] == STX:
+            with self._lock:
+                fault = self._next_fault(bytes(data))
+        elif data == ENQ:
+            with self._lock:
+                if self._dropped_status:
+                    self._dropped_status -= 1
+                    fault = "ignore"
+        if fault == "ignore":
+            return len(data)
+        if fault == "nak":
+            response, delay = NAK, 0.0
+        else:
+            response, delay = self._handle(bytes(data))
+            if fault == "lost_ack":
+                response = b""
+        if response:
+            with self._lock:
+                self._output += response
+                self._output_ready_at = (
+                    now + delay + wire_time(len(response), self.baudrate)
+                )
+        return len(data)
+
+    def read(self, size=1):
+        return self._read(lambda buffer: size if len(buffer) >= size else None)
+
+    def read_until(self, expected=b"\n", size=None):
+        def ready(buffer):
+            index = buffer.find(expected)
+            if index >= 0:
+                return index + len(expected)
+            if size is not None and len(buffer) >= size:
+                return size
+            return None
+
+        return self._read(ready)
+
+    def _read(self, ready):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            self._check_plugged()
+            with self._lock:
+                wait = self._output_ready_at - time.monotonic()
+                if wait <= 0:
+                    count = ready(self._output)
+                    if count is not None:
+                        chunk = bytes(self._output[:count])
+                        del self._output[:count]
+                        return chunk
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    # Timeout: se devuelve lo que haya llegado, como pyserial
+                    if time.monotonic() >= self._output_ready_at:
+                        chunk = bytes(self._output)
+                        self._output.clear()
+                        return chunk
+                    return b""
+            time.sleep(min(max(wait, 0.0005), max(deadline - time.monotonic(), 0)))
+
+    # --- Protocolo ---
+
+    def _handle(self, data):
+        """Procesa una escritura y devuelve (respuesta, segundos de proceso)."""
+        if data == ENQ:
+            status = self.sts1 + self.sts2
+            return STX + status + ETX + _lrc(status), 0.0
+        if data in (ACK, NAK):
+            if not self._upload:
+                return b"", 0.0
+            # Descarga en curso: ACK pide el bloque siguiente, NAK repite el actual.
+            if data == ACK:
+                self._upload.popleft()
+            return (self._upload[0] if self._upload else EOT), 0.0
+        if not (data.startswith(STX) and len(data) >= 3 and data[-2:-1] == ETX):
+            return NAK, 0.0
+
+        payload = data[1:-2]
+        if _lrc(payload) != data[-1:]:
+            return NAK, 0.0
+        command = payload.decode("ascii", errors="replace")
+        self.frames_received.append(command)
+        return self._dispatch(command)
+
+    def _dispatch(self, cmd):
+        if self.sts2 != b"\x40" and not cmd.startswith(("S", "U")):
+            return NAK, 0.0  # Con error (sin papel, gaveta...) no imprime
+
+        # Comandos de consulta
+        if cmd == "U0X":
+            return _data_frame(self._report_x_trama()), 0.0
+        if cmd == "S1":
+            return _data_frame(self._s1_trama()), 0.0
+        if cmd == "S2":
+            return _data_frame(self._s2_trama()), 0.0
+        if cmd.startswith("U3A") and len(cmd) == 15 and cmd[3:].isdigit():
+            return self._start_z_upload(int(cmd[3:9]), int(cmd[9:15])), 0.0
+        if cmd == "S5":
+            return (
+                _data_frame(
+                    f"S5\n{self.rif}\n{self.serial_number}\n0001\n2048\n1980\n"
+                    f"{self.last_invoice + self.last_credit_note:06d}"
+                ),
+                0.0,
+            )
+
+        # Programación
+        if cmd.startswith("PJ") and len(cmd) == 6:
+            return self._program_flag(cmd[2:4], cmd[4:6]), 0.0
+
+        # Encabezados del documento (se aceptan fuera de transacción)
+        if cmd[:3] in ("iR*", "iS*", "iF*", "iD*", "il*"):
+            return ACK, 0.0
+
+        # Ítems de factura y de nota de crédito
+        if cmd[:1] in _INVOICE_TAX_COMMANDS and len(cmd) > 19:
+            return self._add_item("invoice", _INVOICE_TAX_COMMANDS[cmd[0]], cmd[1:])
+        if cmd[:2] in _CREDIT_NOTE_TAX_COMMANDS and len(cmd) > 20:
+            return self._add_item(
+                "credit_note", _CREDIT_NOTE_TAX_COMMANDS[cmd[:2]], cmd[2:]
+            )
+
+        # Cierre con pago directo y anulación
+        if cmd.startswith("1") and len(cmd) == 3:
+            return self._close_document()
+        if cmd == "7":
+            if self._document not in ("invoice", "credit_note"):
+                return NAK, 0.0
+            self._document, self._doc_lines = None, []
+            return ACK, self.close_delay
+
+        # Documentos no fiscales
+        if cmd.startswith("80") and len(cmd) >= 3:
+            if self._document not in (None, "non_fiscal"):
+                return NAK, 0.0
+            self._document = "non_fiscal"
+            return ACK, self.item_delay
+        if cmd.startswith("810"):
+            if self._document != "non_fiscal":
+                return NAK, 0.0
+            self._document = None
+            self.last_non_fiscal += 1
+            self.non_fiscal_today += 1
+            return ACK, self.close_delay
+
+        # Reportes y reimpresiones (la impresora queda ocupada mientras imprime)
+        if cmd in ("I0X", "D") or cmd.startswith("RZ"):
+            if self._document:
+                return NAK, 0.0
+            self._busy_until = time.monotonic() + self.report_delay
+            return ACK, 0.0
+        if cmd == "I0Z":
+            if self._document:
+                return NAK, 0.0
+            self._close_day()
+            self._busy_until = time.monotonic() + self.report_delay
+            return ACK, 0.0
+
+        return NAK, 0.0
+
+    def _program_flag(self, flag, value):
+        if self.baudrate_flag and flag == self.baudrate_flag[0]:
+            rates = self.baudrate_flag[1]
+            if value not in rates:
+                return NAK
+            # La impresora confirma a la velocidad vieja y luego cambia.
+            self.printer_baudrate = rates[value]
+        return ACK
+
+    def _add_item(self, kind, tax_index, fields):
+        if self._document not in (None, kind):
+            return NAK, 0.0
+        try:
+            price_cents = int(fields[0:10])
+            qty_milli = int(fields[10:18])
+        except ValueError:
+            return NAK, 0.0
+        self._document = kind
+        base = price_cents * qty_milli // 1000
+        self._doc_lines.append((tax_index, base, qty_milli))
+        return ACK, self.item_delay
+
+    def _close_document(self):
+        if self._document not in ("invoice", "credit_note"):
+            return NAK, 0.0
+        accumulators = self.sales if self._document == "invoice" else self.credit_notes
+        for tax_index, base, _ in self._doc_lines:
+            if tax_index == 0:
+                accumulators[0] += base
+            else:
+                rate = _TAX_RATES[tax_index]
+                accumulators[2 * tax_index - 1] += base
+                accumulators[2 * tax_index] += (base * rate + 50) // 100
+
+        now = datetime.now()
+        if self._document == "invoice":
+            self.last_invoice += 1
+            self.invoices_today += 1
+            self.last_invoice_date = now.strftime("%d%m%y")
+            self.last_invoice_time = now.strftime("%H%M")
+        else:
+            self.last_credit_note += 1
+            self.credit_notes_today += 1
+        self._document, self._doc_lines = None, []
+        return ACK, self.close_delay
+
+    def _close_day(self):
+        now = datetime.now()
+        self.z_history.append(
+            {
+                "number": self.next_z,
+                "date": now.strftime("%d%m%y"),
+                "time": now.strftime("%H%M"),
+                "last_invoice": self.last_invoice,
+                "last_credit_note": self.last_credit_note,
+                "sales": list(self.sales),
+                "credit_notes": list(self.credit_notes),
+            }
+        )
+        self.next_z += 1
+        self.last_z_date = now.strftime("%d%m%y")
+        self.last_z_time = now.strftime("%H%M")
+        self.sales = [0] * 7
+        self.credit_notes = [0] * 7
+        self.invoices_today = 0
+        self.credit_notes_today = 0
+        self.non_fiscal_today = 0
+
+    def _start_z_upload(self, start, end):
+        records = [
+            _z_record_line(z) for z in self.z_history if start <= z["number"] <= end
+        ]
+        size = self.upload_block_records
+        self._upload = deque(
+            _data_block("".join(records[i : i + size]))
+            for i in range(0, len(records), size)
+        )
+        return self._upload[0] if self._upload else EOT
+
+    # --- Tramas de respuesta ---
+
+    def _report_x_trama(self):
+        """Trama U0X con el orden de campos de la Tabla 63 del manual."""
+        fields = [
+            f"{self.next_z:04d}",
+            self.last_z_date,
+            self.last_z_time,
+            f"{self.last_invoice:08d}",
+            self.last_invoice_date,
+            self.last_invoice_time,
+            f"{self.last_credit_note:08d}",
+            f"{self.last_debit_note:08d}",
+            f"{self.last_non_fiscal:08d}",
+        ]
+        fields += [f"{amount:018d}" for amount in self.sales]
+        fields += [f"{0:018d}"] * 7  # Notas de débito
+        fields += [f"{amount:018d}" for amount in self.credit_notes]
+        return "U0X\n" + "\n".join(fields)
+
+    def _s1_trama(self):
+        """Trama S1 con el orden de campos de la Tabla 45 (HKA80)."""
+        subtotal = sum(base for _, base, _ in self._doc_lines)
+        now = datetime.now()
+        fields = [
+            "00",
+            f"{subtotal:017d}",
+            f"{self.last_invoice:08d}",
+            f"{self.invoices_today:05d}",
+            f"{self.last_debit_note:08d}",
+            f"{0:05d}",
+            f"{self.last_credit_note:08d}",
+            f"{self.credit_notes_today:05d}",
+            f"{self.last_non_fiscal:08d}",
+            f"{self.non_fiscal_today:05d}",
+            f"{self.next_z - 1:04d}",
+            f"{0:04d}",
+            self.rif,
+            self.serial_number,
+            now.strftime("%H%M%S"),
+            now.strftime("%d%m%y"),
+        ]
+        return "S1\n" + "\n".join(fields)
+
+    def _s2_trama(self):
+        """Trama S2 con el orden de campos de la Tabla 46 (HKA80)."""
+        bases = sum(base for _, base, _ in self._doc_lines)
+        taxes = sum(
+            (base * _TAX_RATES[tax] + 50) // 100 for tax, base, _ in self._doc_lines
+        )
+        quantity = sum(qty for _, _, qty in self._doc_lines)
+        doc_type = {"invoice": 1, "credit_note": 2}.get(self._document, 0)
+        fields = [
+            f"{bases:017d}",
+            f"{taxes:017d}",
+            f"{0:017d}",
+            f"{quantity:017d}",
+            f"{bases + taxes:017d}",
+            "0000",
+            str(doc_type),
+        ]
+        return "S2\n" + "\n".join(fields)
+
+
+def _z_record_line(z):
+    """Registro Z de ancho fijo, como lo devuelve la descarga U3A (ver models.ZRecord)."""
+    return (
+        f"{z['number']:04d}{z['date']}{z['time']}"
+        f"{z['last_invoice']:08d}{z['last_credit_note']:08d}"
+        + "".join(f"{amount:018d}" for amount in z["sales"] + z["credit_notes"])
+        + "\n"
+    )
+
+
+# Emuladores abiertos, por nombre de puerto. Así una reconexión encuentra la
+# misma "impresora" (con sus contadores y su velocidad programada).
+_emulators = {}
+_emulators_lock = threading.Lock()
+
+
+def get_emulator(port, **options):
+    """Devuelve el emulador asociado a 'port', creándolo si no existe."""
+    with _emulators_lock:
+        if port not in _emulators:
+            _emulators[port] = PrinterEmulator(port=port, **options)
+        return _emulators[port]
+
+
+def list_ports():
+    """Puertos emulados conectados, como serial.tools.list_ports para los reales."""
+    with _emulators_lock:
+        return [
+            port
+            for port, emulator in _emulators.items()
+            if emulator.listed and emulator.plugged
+        ]
+
+
+def open_emulator(port, baudrate, timeout):
+    """Abre el emulador como si fuera un serial.Serial (usado por FiscalPrinter)."""
+    emulator = get_emulator(port)
+    if not emulator.plugged:
+        raise serial.SerialException(f"No se encuentra el dispositivo {port}.")
+    emulator.baudrate = baudrate
+    emulator.timeout = timeout
+    emulator.open()
+    return emulator
@@ -0,0 +1,397 @@
+# gateway.py
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+
+from flask import Flask, request, jsonify, Response
+
+from config import (
+    GATEWAY_NODES,
+    GATEWAY_AFFINITY,
+    GATEWAY_HEALTH_INTERVAL,
+    GATEWAY_HEALTH_TIMEOUT,
+    GATEWAY_TIMEOUT,
+    GATEWAY_API_KEY,
+    JOB_HISTORY_SIZE,
+)
+
+# Cabeceras que el gateway reenvía al nodo (el resto las arma urllib).
+_FORWARDED_HEADERS = ("Content-Type", "X-Trace-Id", "X-Terminal-Id", "X-API-Key")
+
+# Peso del último valor en el promedio móvil de latencia de cada nodo.
+_LATENCY_SMOOTHING = 0.3
+
+
+class Node:
+    """Un servidor de impresora (web_server) y lo último que se sabe de él."""
+
+    def __init__(self, url, read_status=None):
+        self.url = url.rstrip("/")
+        # Lectura del status sin HTTP (workers locales, ver workers.py), o None.
+        self.read_status = read_status
+        self.printer = None  # Status de la impresora leído con read_status
+        self.healthy = False
+        self.accepting = False
+        self.pending_documents = 0
+        self.backlog_seconds = 0.0
+        self.health_latency = None  # Segundos del último chequeo de /status
+        self.document_latency = None  # Promedio móvil de los documentos reenviados
+        self.forwarded = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_check = None
+
+    def observe_latency(self, seconds):
+        if self.document_latency is None:
+            self.document_latency = seconds
+        else:
+            self.document_latency += _LATENCY_SMOOTHING * (
+                seconds - self.document_latency
+            )
+
+    def to_dict(self):
+        def rounded(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "accepting": self.accepting,
+            "pending_documents": self.pending_documents,
+            "backlog_seconds": rounded(self.backlog_seconds),
+            "health_latency_seconds": rounded(self.health_latency),
+            "document_latency_seconds": rounded(self.document_latency),
+            "forwarded": self.forwarded,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_check": self.last_check,
+            "printer": self.printer,
+        }
+
+
+class Gateway:
+    """
+    Reparte los documentos entre varios nodos de impresión.
+
+    Cada GATEWAY_HEALTH_INTERVAL segundos consulta /status?printer=0 de cada
+    nodo (cola y admisión, sin tocar la impresora). Un documento va al nodo
+    preferido de su terminal (X-Terminal-Id) si está sano y admitiendo, o si
+    no al nodo sano con menos trabajo en cola. Si el nodo elegido rechaza el
+    documento (429/503) o no se puede conectar, se prueba el siguiente: en
+    ambos casos el documento no llegó a la impresora.
+    """
+
+    def __init__(
+        self,
+        urls=GATEWAY_NODES,
+        affinity=GATEWAY_AFFINITY,
+        health_interval=GATEWAY_HEALTH_INTERVAL,
+        health_timeout=GATEWAY_HEALTH_TIMEOUT,
+        timeout=GATEWAY_TIMEOUT,
+        api_key=GATEWAY_API_KEY,
+        status_readers=None,
+    ):
+        if not urls:
+            raise ValueError("El gateway necesita al menos un nodo.")
+        readers = status_readers or {}
+        self.nodes = [Node(url, readers.get(url)) for url in urls]
+        self.affinity = {k: v.rstrip("/") for k, v in affinity.items()}
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.timeout = timeout
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Trabajo asíncrono -> nodo que lo tiene, para reenviar GET /jobs/<id>.
+        self._jobs = OrderedDict()
+
+    # --- Chequeo de salud ---
+
+    def start(self):
+        self.check_all()
+        threading.Thread(target=self._health_loop, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_all()
+
+    def check_all(self):
+        for node in self.nodes:
+            self.check(node)
+
+    def check(self, node):
+        if node.read_status is not None:
+            self._check_shared(node)
+            return
+        start = time.monotonic()
+        probe = urllib.request.Request(
+            f"{node.url}/status?printer=0",
+            headers={"X-API-Key": self.api_key} if self.api_key else {},
+        )
+        try:
+            with urllib.request.urlopen(probe, timeout=self.health_timeout) as response:
+                queue = json.load(response)["queue"]
+            healthy, error = True, None
+        except urllib.error.HTTPError as e:
+            healthy, error, queue = False, f"HTTP {e.code}", None
+        except (OSError, ValueError, KeyError) as e:
+            healthy, error, queue = False, str(e), None
+        with self._lock:
+            node.healthy, node.last_error = healthy, error
+            node.last_check = time.strftime("%Y-%m-%dT%H:%M:%S")
+            if healthy:
+                node.health_latency = time.monotonic() - start
+                node.accepting = bool(queue.get("accepting"))
+                node.pending_documents = int(queue.get("pending_documents", 0))
+                node.backlog_seconds = float(queue.get("backlog_seconds", 0.0))
+            else:
+                node.accepting = False
+
+    def _check_shared(self, node):
+        """Salud de un worker local, leída de la memoria compartida (sin HTTP)."""
+        status = node.read_status()
+        healthy = bool(status.get("connected"))
+        with self._lock:
+            node.printer = status
+            node.healthy = healthy
+            node.last_error = (
+                None
+                if healthy
+                else status.get("message") or "El worker no está conectado."
+            )
+            node.last_check = time.strftime("%Y-%m-%dT%H:%M:%S")
+            node.accepting = healthy and status["accepting"]
+            if healthy:
+                node.pending_documents = status["pending_documents"]
+                node.backlog_seconds = status["backlog_seconds"]
+
+    # --- Elección del nodo ---
+
+    def candidates(self, terminal=None):
+        """Nodos sanos y admitiendo, en orden de preferencia."""
+        with self._lock:
+            ready = [n for n in self.nodes if n.healthy and n.accepting]
+            ready.sort(
+                key=lambda n: (
+                    n.backlog_seconds,
+                    n.pending_documents,
+                    n.document_latency or 0.0,
+                )
+            )
+        preferred = self.affinity.get(terminal) if terminal else None
+        if preferred:
+            ready.sort(key=lambda n: n.url != preferred)  # sort() es estable
+        return ready
+
+    # --- Reenvío ---
+
+    def _send(self, node, method, path, body, headers):
+        forward = urllib.request.Request(
+            f"{node.url}{path}", data=body, headers=headers, method=method
+        )
+        try:
+            with urllib.request.urlopen(forward, timeout=self.timeout) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+    def forward_document(self, path, body, headers, terminal=None):
+        """
+        Envía un documento al mejor nodo disponible. Devuelve (nodo, código
+        HTTP, cuerpo, cabeceras); nodo es None si ninguno lo aceptó.
+        """
+        last = (None, 503, b"", {})
+        for node in self.candidates(terminal):
+            start = time.monotonic()
+            try:
+                status, content, response_headers = self._send(
+                    node, "POST", path, body, headers
+                )
+            except urllib.error.URLError as e:
+                # Sin conexión: el documento no llegó al nodo.
+                with self._lock:
+                    node.healthy, node.last_error = False, str(e.reason)
+                    node.failures += 1
+                continue
+            except OSError as e:
+                # Se cortó después de enviar: el documento pudo imprimirse, no se
+                # reintenta en otro nodo para no duplicarlo.
+                with self._lock:
+                    node.healthy, node.last_error = False, str(e)
+                    node.failures += 1
+                return node, 502, b"", {}
+            if status in (429, 503):
+                # El nodo no admitió el documento; hasta el próximo chequeo no
+                # se le envían más.
+                with self._lock:
+                    node.accepting = False
+                last = (node, status, content, response_headers)
+                continue
+            with self._lock:
+                node.forwarded += 1
+                node.observe_latency(time.monotonic() - start)
+                # El nodo tiene un documento más hasta el próximo chequeo.
+                node.pending_documents += 1
+            self._remember_job(node, content)
+            return node, status, content, response_headers
+        return last
+
+    def forward_job_query(self, job_id, headers):
+        """Reenvía GET /jobs/<id> al nodo que recibió el documento."""
+        with self._lock:
+            node = self._jobs.get(job_id)
+        if node is None:
+            return None, 404, b"", {}
+        try:
+            return (node, *self._send(node, "GET", f"/jobs/{job_id}", None, headers))
+        except OSError as e:
+            return node, 502, str(e).encode(), {}
+
+    def _remember_job(self, node, content):
+        try:
+            job_id = json.loads(content)["job"]["id"]
+        except (ValueError, KeyError, TypeError):
+            return
+        with self._lock:
+            self._jobs[job_id] = node
+            while len(self._jobs) > JOB_HISTORY_SIZE:
+                self._jobs.popitem(last=False)
+
+    # --- Resumen ---
+
+    def summary(self):
+        with self._lock:
+            nodes = [n.to_dict() for n in self.nodes]
+        healthy = [n for n in nodes if n["healthy"]]
+        latencies = [
+            n["document_latency_seconds"]
+            for n in nodes
+            if n["document_latency_seconds"] is not None
+        ]
+        return {
+            "nodes": nodes,
+            "healthy_nodes": len(healthy),
+            "accepting_nodes": sum(1 for n in healthy if n["accepting"]),
+            "pending_documents": sum(n["pending_documents"] for n in healthy),
+            "backlog_seconds": round(sum(n["backlog_seconds"] for n in healthy), 3),
+            "document_latency_seconds": (
+                round(sum(latencies) / len(latencies), 3) if latencies else None
+            ),
+            "forwarded": sum(n["forwarded"] for n in nodes),
+        }
+
+
+# --- Aplicación HTTP del gateway ---
+
+app = Flask(__name__)
+g_gateway = None
+
+
+def _relay(node, status, content, headers):
+    """Respuesta del nodo tal cual, indicando qué nodo la atendió."""
+    if node is None and not content:
+        return (
+            jsonify(
+                {"status": "error", "message": "No hay nodos de impresión disponibles."}
+            ),
+            503,
+        )
+    response = Response(
+        content, status=status, content_type=headers.get("Content-Type")
+    )
+    for name in ("Retry-After", "X-Trace-Id"):
+        if headers.get(name):
+            response.headers[name] = headers[name]
+    if node is not None:
+        response.headers["X-Printer-Node"] = node.url
+    return response
+
+
+def _forwarded_headers():
+    return {
+        name: request.headers[name]
+        for name in _FORWARDED_HEADERS
+        if name in request.headers
+    }
+
+
+def _forward(path):
+    headers = _forwarded_headers()
+    query = request.query_string.decode()
+    target = f"{path}?{query}" if query else path
+    return _relay(
+        *g_gateway.forward_document(
+            target,
+            request.get_data(),
+            headers,
+            terminal=request.headers.get("X-Terminal-Id"),
+        )
+    )
+
+
+@app.route("/invoice", methods=["POST"])
+def route_invoice():
+    """Reenvía la factura al mejor nodo (ver Gateway)."""
+    return _forward("/invoice")
+
+
+@app.route("/credit_note", methods=["POST"])
+def route_credit_note():
+    """Reenvía la nota de crédito al mejor nodo (ver Gateway)."""
+    return _forward("/credit_note")
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def route_job(job_id):
+    """Consulta un trabajo asíncrono en el nodo que lo recibió."""
+    node, status, content, headers = g_gateway.forward_job_query(
+        job_id, _forwarded_headers()
+    )
+    if node is None:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado."}), 404
+    return _relay(node, status, content, headers)
+
+
+@app.route("/printers/<int:index>/<path:path>", methods=["GET", "POST", "DELETE"])
+def route_printer(index, path):
+    """
+    Reenvía la petición al nodo indicado, sin repartir (ej: POST
+    /printers/0/z_close). Las respuestas NDJSON llegan completas al final.
+    """
+    if not 0 <= index < len(g_gateway.nodes):
+        return jsonify({"status": "error", "message": "Nodo inexistente."}), 404
+    node = g_gateway.nodes[index]
+    query = request.query_string.decode()
+    target = f"/{path}?{query}" if query else f"/{path}"
+    try:
+        status, content, headers = g_gateway._send(
+            node,
+            request.method,
+            target,
+            request.get_data() or None,
+            _forwarded_headers(),
+        )
+    except OSError as e:
+        return jsonify({"status": "error", "message": str(e)}), 502
+    return _relay(node, status, content, headers)
+
+
+@app.route("/status", methods=["GET"])
+def gateway_status():
+    """Estado agregado de los nodos: salud, colas y latencias."""
+    return jsonify({"status": "success", "gateway": g_gateway.summary()})
+
+
+def start_gateway(urls=GATEWAY_NODES, host="0.0.0.0", port=5000, **options):
+    """Arranca el gateway con los nodos indicados (bloquea, como start_server)."""
+    global g_gateway
+    g_gateway = Gateway(urls, **options)
+    g_gateway.start()
+    print(f"Gateway iniciado en http://{host}:{port} con {len(g_gateway.nodes)} nodos.")
+    app.run(host=host, port=port, threaded=True)
@@ -3,10 +3,13 @@ import tkinter as tk
 from tkinter import ttk  # Importar ttk para el Treeview
 from tkinter import messagebox, scrolledtext
 from communication import FiscalPrinter
+from config import SUPPORTED_BAUDRATES
 import commands
 import serial.tools.list_ports
 import threading
+from decimal import Decimal, InvalidOperation
 import web_server  # Importamos nuestro nuevo módulo de servidor
+import z_reprint
 
 
 # gui.py -> Modificar la clase FiscalApp
@@ -84,6 +87,10 @@ class FiscalApp(tk.Tk):
         )
 
         self.reports_menu.add_separator()  # Separador para agrupar comandos
+        self.reports_menu.add_command(
+            label="Conciliar antes del Reporte Z",
+            command=self.reconcile_before_z,
+        )
         self.reports_menu.add_command(
             label="Imprimir Reporte Z (Cierre Diario)",
             command=self.print_z_report_confirmation,
@@ -93,6 +100,10 @@ class FiscalApp(tk.Tk):
             label="Reimprimir Reporte Z por Número...",
             command=self.reprint_z_by_number_dialog,
         )
+        self.reports_menu.add_command(
+            label="Cancelar Reimpresión de Reportes Z",
+            command=self.cancel_z_reprints,
+        )
         # --- FIN DE CAMBIOS ---
 
         self.docs_menu = tk.Menu(self.menubar, tearoff=0)
@@ -120,6 +131,9 @@ class FiscalApp(tk.Tk):
         self.maintenance_menu.add_command(
             label="Imprimir Programación", command=self.print_printer_programming
         )
+        self.maintenance_menu.add_command(
+            label="Velocidad del Puerto...", command=self.baudrate_dialog
+        )
         # --- FIN DE CAMBIOS ---
 
         self.update_ports_list()
@@ -145,6 +159,29 @@ class FiscalApp(tk.Tk):
         self.output_area.config(state="disabled")
         self.output_area.see(tk.END)
 
+    def _run_in_background(self, func, on_done=None):
+        """
+        Ejecuta func() con la impresora tomada en un hilo aparte y muestra su
+        resultado. Toda operación con la impresora pasa por aquí: el lock puede
+        estar tomado mucho tiempo (una sesión de la API espera líneas hasta
+        SESSION_IDLE_TIMEOUT, un Reporte Z o una reimpresión esperan a la
+        impresora) y la ventana no debe congelarse mientras tanto.
+        on_done(resultado) se llama después, en el hilo principal.
+        """
+
+        def finished(result):
+            self.log_message(result)
+            if on_done:
+                on_done(result)
+
+        def run():
+            with web_server.printer_lock:
+                result = func()
+            # La GUI solo se actualiza desde el hilo principal.
+            self.after(0, finished, result)
+
+        threading.Thread(target=run, daemon=True).start()
+
     def connect_printer(self):
         # ... (código existente para conectar) ...
         selected_port = self.port_variable.get()
@@ -168,42 +205,57 @@ class FiscalApp(tk.Tk):
 
             # 2. Habilitamos el nuevo menú al conectar
             self.menubar.entryconfig("Mantenimiento", state="normal")
-            # Iniciar el servidor web en un hilo separado
-            server_thread = threading.Thread(
-                target=web_server.start_server,
-                args=(
-                    self.printer,
-                ),  # Pasamos la instancia de la impresora al servidor
-                daemon=True,  # El hilo del servidor se cerrará automáticamente cuando cerremos la GUI
-            )
-            server_thread.start()
-            self.log_message("Servidor web activado. Escuchando en el puerto 5000.")
+            # Iniciar el servidor web (corre en su propio hilo)
+            try:
+                web_server.server_manager.start(self.printer)
+                self.log_message("Servidor web activado. Escuchando en el puerto 5000.")
+            except (OSError, ValueError) as e:
+                self.log_message(f"Servidor web no disponible: {e}")
 
         except ConnectionError as e:
             self.log_message(str(e))
             messagebox.showerror("Error de Conexión", str(e))
 
-    def disconnect_printer(self):
-        # ... (código existente para desconectar) ...
-        if self.printer:
-            self.printer.close()
+    def disconnect_printer(self, on_done=None):
+        """
+        Detiene el servidor web esperando los documentos en curso y recién
+        entonces cierra el puerto serie. La espera corre en segundo plano;
+        on_done se llama (en el hilo de la interfaz) al terminar.
+        """
+        if not self.printer:
+            if on_done:
+                on_done()
+            return
+        printer = self.printer
+        self.connect_button.config(state="disabled")
+        self.disconnect_button.config(state="disabled")
+        for menu in ("Estado", "Reportes", "Documentos Fiscales", "Mantenimiento"):
+            self.menubar.entryconfig(menu, state="disabled")
+        self.log_message(
+            "Deteniendo el servidor web (esperando documentos en curso)..."
+        )
+
+        def worker():
+            drained = web_server.stop_server()
+            with web_server.printer_lock:
+                printer.close()
+            self.after(0, finished, drained)
+
+        def finished(drained):
             self.printer = None
+            self.log_message(
+                "Servidor web desactivado."
+                if drained
+                else "Servidor web desactivado: algunos documentos no terminaron a tiempo."
+            )
             self.log_message("Desconectado de la impresora.")
-
             self.connect_button.config(state="normal")
-            self.disconnect_button.config(state="disabled")
             self.refresh_button.config(state="normal")
             self.ports_menu.config(state="normal")
+            if on_done:
+                on_done()
 
-            self.menubar.entryconfig("Estado", state="disabled")
-            self.menubar.entryconfig("Reportes", state="disabled")
-            self.menubar.entryconfig("Documentos Fiscales", state="disabled")
-
-            # 3. Deshabilitamos el nuevo menú al desconectar
-            self.menubar.entryconfig("Mantenimiento", state="disabled")
-
-            web_server.stop_server()
-            self.log_message("Servidor web desactivado.")
+        threading.Thread(target=worker, daemon=True).start()
 
     # ... (read_status, get_s5, etc., se mantienen igual) ...
     def read_status(self):
@@ -213,8 +265,7 @@ class FiscalApp(tk.Tk):
             )
             return
 
-        result = commands.read_printer_status(self.printer)
-        self.log_message(result)
+        self._run_in_background(lambda: commands.read_printer_status(self.printer))
 
     def get_s5(self):
         if not self.printer:
@@ -223,8 +274,9 @@ class FiscalApp(tk.Tk):
             )
             return
 
-        result = commands.get_s5_status(self.printer)
-        self.log_message(f"Respuesta S5: {result}")
+        self._run_in_background(
+            lambda: f"Respuesta S5: {commands.get_s5_status(self.printer)}"
+        )
 
     def print_report_x(self):
         if not self.printer:
@@ -233,8 +285,8 @@ class FiscalApp(tk.Tk):
             )
             return
 
-        result = commands.send_report_x(self.printer)
-        self.log_message(f"Comando Reporte X: {result}")
+        self.log_message("Imprimiendo Reporte X...")
+        self._run_in_background(lambda: commands.send_report_x(self.printer))
 
     def send_example_invoice(self):
         if not self.printer:
@@ -243,12 +295,13 @@ class FiscalApp(tk.Tk):
             )
             return
 
-        result = commands.send_invoice_example(self.printer)
-        self.log_message(f"Comando Factura: {result}")
+        self._run_in_background(
+            lambda: f"Comando Factura: {commands.send_invoice_example(self.printer)}"
+        )
 
     def on_closing(self):
-        self.disconnect_printer()
-        self.destroy()
+        # La ventana se cierra recién cuando terminan los documentos en curso.
+        self.disconnect_printer(on_done=self.destroy)
 
     # --- INICIO DE CAMBIOS ---
     # 4. Creamos la función que llama nuestro comando desde el menú
@@ -262,8 +315,76 @@ class FiscalApp(tk.Tk):
             )
             return
 
-        result = commands.print_programming(self.printer)
-        self.log_message(result)
+        self.log_message("Imprimiendo la programación de la impresora...")
+        self._run_in_background(lambda: commands.print_programming(self.printer))
+
+    def baudrate_dialog(self):
+        """
+        Diálogo para detectar la velocidad actual del puerto (ENQ a cada velocidad)
+        o reprogramar la velocidad de la impresora.
+        """
+        if not self.printer:
+            messagebox.showwarning(
+                "Sin Conexión", "Por favor, conecta la impresora primero."
+            )
+            return
+
+        dialog = tk.Toplevel(self)
+        dialog.title("Velocidad del Puerto")
+        dialog.geometry("320x150")
+        dialog.resizable(False, False)
+
+        frame = tk.Frame(dialog, padx=15, pady=15)
+        frame.pack(expand=True, fill="both")
+
+        tk.Label(frame, text=f"Velocidad actual: {self.printer.baudrate} bps").grid(
+            row=0, column=0, columnspan=2, sticky="w", pady=5
+        )
+        tk.Label(frame, text="Nueva velocidad:").grid(row=1, column=0, sticky="w")
+        rate_var = tk.IntVar(value=self.printer.baudrate)
+        tk.OptionMenu(frame, rate_var, *SUPPORTED_BAUDRATES).grid(
+            row=1, column=1, padx=5
+        )
+
+        def detect():
+            baudrate = self.printer.detect_baudrate()
+            if baudrate:
+                return f"Impresora detectada a {baudrate} bps."
+            return "La impresora no respondió en ninguna velocidad."
+
+        def program(baudrate):
+            try:
+                changed = self.printer.set_printer_baudrate(baudrate)
+            except (ValueError, ConnectionError) as e:
+                return f"Error al cambiar la velocidad: {e}"
+            if changed:
+                return f"Velocidad del puerto cambiada a {baudrate} bps."
+            return (
+                f"La impresora no aceptó el cambio de velocidad. "
+                f"Velocidad actual: {self.printer.baudrate} bps."
+            )
+
+        def on_detect():
+            dialog.destroy()
+            self.log_message("Detectando la velocidad de la impresora...")
+            self._run_in_background(detect)
+
+        def on_program():
+            baudrate = rate_var.get()
+            dialog.destroy()
+            self.log_message(f"Programando la velocidad {baudrate} bps...")
+            self._run_in_background(lambda: program(baudrate))
+
+        tk.Button(frame, text="Detectar", command=on_detect).grid(
+            row=2, column=0, pady=15
+        )
+        tk.Button(frame, text="Programar", command=on_program).grid(
+            row=2, column=1, pady=15
+        )
+
+        dialog.transient(self)
+        dialog.grab_set()
+        self.wait_window(dialog)
 
     def get_x_report_data(self):
         """
@@ -276,10 +397,29 @@ class FiscalApp(tk.Tk):
             return
 
         self.log_message("Obteniendo datos del Reporte X, por favor espera...")
-        self.update_idletasks()  # Forzamos la actualización de la GUI para mostrar el mensaje
+        self._run_in_background(lambda: commands.get_report_x_data(self.printer))
+
+    def reconcile_before_z(self):
+        """
+        Compara los documentos registrados en el diario local desde el último
+        Reporte Z con los acumulados de la impresora.
+        """
+        if not self.printer:
+            messagebox.showwarning(
+                "Sin Conexión", "Por favor, conecta la impresora primero."
+            )
+            return
 
-        result = commands.get_report_x_data(self.printer)
-        self.log_message(result)
+        self.log_message("Conciliando el diario con la impresora, por favor espera...")
+
+        def reconcile():
+            try:
+                result = commands.reconcile_with_printer(self.printer)
+            except (ConnectionError, ValueError) as e:
+                return f"Error en la conciliación: {e}"
+            return commands.format_reconciliation(result)
+
+        self._run_in_background(reconcile)
 
     def print_z_report_confirmation(self):
         """
@@ -300,16 +440,41 @@ class FiscalApp(tk.Tk):
             "¿Está seguro de que desea continuar?",
         )
 
-        if is_confirmed:
-            self.log_message("Enviando comando de Cierre Diario (Reporte Z)...")
-            self.update_idletasks()  # Actualiza la GUI para mostrar el mensaje de espera
-            result = commands.print_z_report(self.printer)
-            self.log_message(result)
+        if is_confirmed and not web_server.server_manager.running:
+            # Sin la API no hay cola que vaciar ni admisión que suspender:
+            # el Reporte Z se envía directamente.
+            self.log_message("Cierre Diario (Reporte Z): enviando el comando...")
+            self._run_in_background(lambda: commands.print_z_report(self.printer))
+        elif is_confirmed:
+            self.log_message(
+                "Cierre Diario (Reporte Z): se suspenden los documentos de la API y "
+                "se espera a que termine la cola antes de emitirlo..."
+            )
+            closing = web_server.g_z_closing
+
+            def run_closing():
+                result = closing.run("gui")
+                # La GUI solo se actualiza desde el hilo principal.
+                self.after(0, self.log_message, result)
+
+            threading.Thread(target=run_closing, daemon=True).start()
         else:
             self.log_message(
                 "Operación de Cierre Diario (Reporte Z) cancelada por el usuario."
             )
 
+    def cancel_z_reprints(self):
+        """Cancela las reimpresiones en curso al terminar su tramo actual."""
+        pending = z_reprint.running()
+        if not pending:
+            self.log_message("No hay reimpresiones de Reportes Z en curso.")
+            return
+        for reprint in pending:
+            reprint.cancel()
+        self.log_message(
+            "Cancelación solicitada: la reimpresión se detendrá al terminar el tramo en curso."
+        )
+
     # Añade este nuevo método completo a la clase FiscalApp
     def reprint_z_by_number_dialog(self):
         """
@@ -360,12 +525,20 @@ class FiscalApp(tk.Tk):
                     return
 
                 self.log_message(
-                    f"Enviando comando para reimprimir Reportes Z del {start} al {end}..."
+                    f"Reimprimiendo Reportes Z del {start} al {end} por tramos. "
+                    "Los documentos de venta se atienden entre tramos."
+                )
+                # La GUI solo se actualiza desde el hilo principal.
+                web_server.start_z_reprint(
+                    start,
+                    end,
+                    on_progress=lambda r: self.after(
+                        0,
+                        self.log_message,
+                        f"Reimpresión: {r.printed} de {r.total} Reportes Z.",
+                    ),
+                    on_finish=lambda r: self.after(0, self.log_message, r.result),
                 )
-                self.update_idletasks()
-
-                result = commands.reprint_z_by_number(self.printer, start, end)
-                self.log_message(result)
                 dialog.destroy()  # Cierra el diálogo después de enviar
 
             except ValueError:
@@ -483,8 +656,8 @@ class FiscalApp(tk.Tk):
         def add_item():
             try:
                 desc = desc_entry.get()
-                price = float(price_entry.get())
-                qty = float(qty_entry.get())
+                price = Decimal(price_entry.get())
+                qty = Decimal(qty_entry.get())
                 tax = tax_var.get()
 
                 if not desc or price <= 0 or qty <= 0:
@@ -512,7 +685,7 @@ class FiscalApp(tk.Tk):
                 qty_entry.delete(0, "end")
                 desc_entry.focus_set()
 
-            except (ValueError, TypeError):
+            except (ValueError, TypeError, InvalidOperation):
                 messagebox.showerror(
                     "Error",
                     "El precio y la cantidad deben ser números válidos.",
@@ -537,14 +710,20 @@ class FiscalApp(tk.Tk):
                 return
 
             self.log_message("Enviando factura a la impresora...")
-            self.update_idletasks()
-
-            result = commands.send_full_invoice(self.printer, customer, invoice_items)
-            self.log_message(result)
-
-            # Si tuvo éxito, cierra la ventana
-            if "correctamente" in result:
-                invoice_window.destroy()
+            submit_button.config(state="disabled")  # Evita enviarla dos veces
+
+            def done(result):
+                # Si tuvo éxito, cierra la ventana
+                if "correctamente" in result:
+                    invoice_window.destroy()
+                else:
+                    submit_button.config(state="normal")
+
+            items = list(invoice_items)
+            self._run_in_background(
+                lambda: commands.send_full_invoice(self.printer, customer, items),
+                on_done=done,
+            )
 
         # --- Botón de Acción Final ---
         submit_button = ttk.Button(
@@ -679,8 +858,8 @@ class FiscalApp(tk.Tk):
             # ... (esta función es idéntica a la de la factura)
             try:
                 desc = desc_entry.get()
-                price = float(price_entry.get())
-                qty = float(qty_entry.get())
+                price = Decimal(price_entry.get())
+                qty = Decimal(qty_entry.get())
                 tax = tax_var.get()
                 if not desc or price <= 0 or qty <= 0:
                     messagebox.showerror(
@@ -706,7 +885,7 @@ class FiscalApp(tk.Tk):
                 price_entry.delete(0, "end")
                 qty_entry.delete(0, "end")
                 desc_entry.focus_set()
-            except (ValueError, TypeError):
+            except (ValueError, TypeError, InvalidOperation):
                 messagebox.showerror(
                     "Error",
                     "Precio y cantidad deben ser números.",
@@ -747,15 +926,21 @@ class FiscalApp(tk.Tk):
                 return
 
             self.log_message("Enviando Nota de Crédito a la impresora...")
-            self.update_idletasks()
-
-            result = commands.send_full_credit_note(
-                self.printer, affected_doc_data, customer, credit_note_items
+            submit_button.config(state="disabled")  # Evita enviarla dos veces
+
+            def done(result):
+                if "correctamente" in result:
+                    credit_note_window.destroy()
+                else:
+                    submit_button.config(state="normal")
+
+            items = list(credit_note_items)
+            self._run_in_background(
+                lambda: commands.send_full_credit_note(
+                    self.printer, affected_doc_data, customer, items
+                ),
+                on_done=done,
             )
-            self.log_message(result)
-
-            if "correctamente" in result:
-                credit_note_window.destroy()
 
         # --- Botón de Acción Final ---
         submit_button = ttk.Button(
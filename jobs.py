@@ -0,0 +1,233 @@
+# jobs.py
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import tracing
+from config import JOB_HISTORY_SIZE
+
+# Prioridades de los trabajos: un número menor se atiende primero.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class Job:
+    """Un trabajo encolado para la impresora, con su estimación de tiempo."""
+
+    def __init__(self, kind, func, predicted_seconds, priority, on_finish=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.func = func
+        self.priority = priority
+        self.predicted_seconds = predicted_seconds
+        self.on_finish = on_finish
+        self.status = "queued"
+        self.result = None
+        self.document = None  # Número y hora del documento emitido, si lo hubo
+        self.accepted_at = datetime.now()
+        self.estimated_start = None
+        self.estimated_finish = None
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        # Contexto de quien encoló el trabajo (traza en curso), para continuarla
+        # en el hilo de la cola.
+        self.context = contextvars.copy_context()
+        self._accepted_ts = time.time()
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def to_dict(self):
+        def iso(value):
+            return value.isoformat(timespec="milliseconds") if value else None
+
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "accepted_at": iso(self.accepted_at),
+            "estimated_start": iso(self.estimated_start),
+            "estimated_finish": iso(self.estimated_finish),
+            "predicted_seconds": round(self.predicted_seconds, 3),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "duration_seconds": (
+                round(self.duration, 3) if self.duration is not None else None
+            ),
+        }
+
+
+class JobQueue:
+    """
+    Cola de trabajos de una impresora atendida por un único hilo.
+
+    Cada trabajo se ejecuta con el lock de la impresora tomado, en orden de
+    prioridad y luego de llegada. Al aceptar un trabajo se calcula su hora
+    estimada de inicio y fin a partir de lo que ya está en cola.
+    """
+
+    def __init__(self, lock, history_size=JOB_HISTORY_SIZE):
+        self.lock = lock
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._current = None
+        self._current_started = None
+        self._jobs = OrderedDict()
+        self._history_size = history_size
+        self._stopped = False
+        self._held = None  # Motivo por el que no se despachan trabajos (hold())
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    # --- Consultas ---
+
+    def depth(self):
+        """Documentos pendientes, incluyendo el que se está procesando."""
+        with self._cond:
+            return len(self._heap) + (1 if self._current else 0)
+
+    def backlog_seconds(self, priority=PRIORITY_NORMAL):
+        """Segundos estimados de trabajo por delante de un trabajo con esa prioridad."""
+        with self._cond:
+            return self._backlog_locked(priority)
+
+    def _backlog_locked(self, priority):
+        backlog = sum(
+            job.predicted_seconds for p, _, job in self._heap if p <= priority
+        )
+        if self._current:
+            elapsed = time.monotonic() - self._current_started
+            backlog += max(0.0, self._current.predicted_seconds - elapsed)
+        return backlog
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    @property
+    def held(self):
+        return self._held
+
+    # --- Encolado y ejecución ---
+
+    def submit(
+        self, kind, func, predicted_seconds, priority=PRIORITY_NORMAL, on_finish=None
+    ):
+        """Encola func() y devuelve el Job con su ETA ya calculada."""
+        job = Job(kind, func, predicted_seconds, priority, on_finish)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("La cola de trabajos está detenida.")
+            wait = self._backlog_locked(priority)
+            job.estimated_start = job.accepted_at + timedelta(seconds=wait)
+            job.estimated_finish = job.estimated_start + timedelta(
+                seconds=predicted_seconds
+            )
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._remember(job)
+            self._cond.notify()
+        return job
+
+    def update_prediction(self, job, predicted_seconds):
+        """
+        Corrige la duración estimada de un trabajo ya encolado o en curso (una
+        sesión que recibe más líneas de las supuestas al abrirla).
+        """
+        with self._cond:
+            job.predicted_seconds = predicted_seconds
+            if job.estimated_start is not None:
+                job.estimated_finish = job.estimated_start + timedelta(
+                    seconds=predicted_seconds
+                )
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._history_size:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.done.is_set():
+                break
+            del self._jobs[oldest_id]
+
+    def hold(self, reason):
+        """
+        Deja de despachar trabajos hasta llamar a release(): los que están en
+        cola (y los que lleguen) esperan en vez de fallar. El trabajo en curso
+        no se interrumpe.
+        """
+        with self._cond:
+            self._held = reason
+
+    def release(self):
+        with self._cond:
+            self._held = None
+            self._cond.notify_all()
+
+    def stop(self):
+        """
+        Detiene el hilo después de terminar el trabajo en curso. Los trabajos
+        que seguían en cola se marcan como cancelados; su on_finish se llama
+        igual, para liberar lo que reservaron (cuotas, devoluciones, etc.).
+        """
+        with self._cond:
+            self._stopped = True
+            pending = [job for _, _, job in self._heap]
+            self._heap.clear()
+            self._cond.notify_all()
+        for job in pending:
+            job.status = "cancelled"
+            job.result = "Trabajo cancelado: la cola de la impresora se detuvo."
+            self._finish(job)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (not self._heap or self._held) and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                self._current = job
+                self._current_started = time.monotonic()
+
+            job.context.run(self._execute, job)
+
+            with self._cond:
+                self._current = None
+            self._finish(job)
+
+    def _finish(self, job):
+        if job.on_finish:
+            try:
+                job.on_finish(job)
+            except Exception as e:
+                print(f"Error al registrar el fin del trabajo {job.id}: {e}")
+        job.done.set()
+
+    def _execute(self, job):
+        dequeued = time.time()
+        tracing.record_span(
+            "queue_wait", job._accepted_ts, dequeued, job_id=job.id, kind=job.kind
+        )
+        with self.lock:
+            tracing.record_span("lock_wait", dequeued, time.time())
+            job.status = "running"
+            job.started_at = datetime.now()
+            with tracing.span(f"job.{job.kind}", job_id=job.id):
+                try:
+                    job.result = job.func()
+                    job.status = "finished"
+                except Exception as e:
+                    job.result = f"Error inesperado al procesar el trabajo: {e}"
+                    job.status = "failed"
+            job.finished_at = datetime.now()
@@ -0,0 +1,118 @@
+# journal.py
+import sqlite3
+import threading
+import time
+
+from config import JOURNAL_FILE, TAX_RATE_PERCENTAGES
+
+# Columnas de montos del diario (céntimos), en el orden de los acumulados de
+# la impresora para un tipo de documento.
+AMOUNT_COLUMNS = (
+    "exento",
+    "base_tasa1",
+    "iva_tasa1",
+    "base_tasa2",
+    "iva_tasa2",
+    "base_tasa3",
+    "iva_tasa3",
+)
+
+# Prefijo de los campos de ReportXData que corresponden a cada tipo de documento.
+REPORT_PREFIX = {"invoice": "venta_", "credit_note": "nc_"}
+
+
+class Journal:
+    """
+    Diario local de los documentos que este servidor imprimió correctamente,
+    con sus totales por tasa. Sirve para conciliar contra los acumulados de la
+    impresora antes del Reporte Z.
+
+    También guarda la hora de cada Reporte Z emitido desde la aplicación, que
+    marca el inicio del período a conciliar.
+    """
+
+    def __init__(self, path=JOURNAL_FILE, rates=TAX_RATE_PERCENTAGES):
+        self.rates = rates
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL: registrar un documento no espera a un fsync completo.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        amount_columns = ", ".join(f"{c} INTEGER NOT NULL" for c in AMOUNT_COLUMNS)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, printer TEXT NOT NULL, printed_at REAL NOT NULL, "
+            f"kind TEXT NOT NULL, items INTEGER NOT NULL, {amount_columns});"
+            "CREATE INDEX IF NOT EXISTS documents_printer_time "
+            "ON documents (printer, printed_at);"
+            "CREATE TABLE IF NOT EXISTS z_marks ("
+            "printer TEXT NOT NULL, closed_at REAL NOT NULL);"
+        )
+        self._db.commit()
+
+    def record(self, printer_key, document, printed_at=None):
+        """Registra un documento (CompiledDocument) impreso y cerrado."""
+        row = (
+            printer_key,
+            printed_at or time.time(),
+            document.kind,
+            document.item_count,
+            *document.tax_totals(self.rates),
+        )
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    f"INSERT INTO documents (printer, printed_at, kind, items, "
+                    f"{', '.join(AMOUNT_COLUMNS)}) VALUES ({', '.join('?' * len(row))})",
+                    row,
+                )
+
+    def mark_z(self, printer_key, closed_at=None):
+        """Registra que se emitió un Reporte Z en la impresora."""
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO z_marks VALUES (?, ?)",
+                    (printer_key, closed_at or time.time()),
+                )
+
+    def last_z_mark(self, printer_key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(closed_at) FROM z_marks WHERE printer = ?", (printer_key,)
+            ).fetchone()
+        return row[0]
+
+    def totals_since(self, printer_key, since):
+        """
+        Cantidad de documentos y totales por tasa (céntimos) desde 'since'
+        (epoch), por tipo de documento. La suma la hace SQLite sobre el índice
+        (printer, printed_at), sin recorrer los documentos en Python.
+        """
+        sums = ", ".join(f"COALESCE(SUM({c}), 0)" for c in AMOUNT_COLUMNS)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT kind, COUNT(*), {sums} FROM documents "
+                "WHERE printer = ? AND printed_at >= ? GROUP BY kind",
+                (printer_key, since),
+            ).fetchall()
+        result = {
+            kind: {"count": 0, **dict.fromkeys(AMOUNT_COLUMNS, 0)}
+            for kind in REPORT_PREFIX
+        }
+        for kind, count, *amounts in rows:
+            result[kind] = {"count": count, **dict(zip(AMOUNT_COLUMNS, amounts))}
+        return result
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Devuelve (abriéndolo si hace falta) el diario de la aplicación."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal()
+        return _journal
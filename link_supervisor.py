@@ -0,0 +1,213 @@
+# link_supervisor.py
+import threading
+import time
+from datetime import datetime
+
+import serial.tools.list_ports
+
+import commands
+import emulator
+from communication import FiscalPrinter
+from config import LINK_RECONNECT_INITIAL, LINK_RECONNECT_MAX, LINK_WATCH_INTERVAL
+
+# Puertos de otras impresoras del equipo (ej: los de los demás workers, ver
+# workers.py): el supervisor nunca los abre al buscar la suya.
+_reserved_ports = set()
+
+
+def reserve_ports(ports):
+    """Marca 'ports' como ocupados por otras impresoras."""
+    _reserved_ports.update(ports)
+
+
+def available_ports():
+    """Puertos serie del equipo y puertos emulados conectados."""
+    ports = [port.device for port in serial.tools.list_ports.comports()]
+    return ports + emulator.list_ports()
+
+
+class LinkSupervisor:
+    """
+    Vigila el enlace serie de una impresora y lo restablece sin operador.
+
+    FiscalPrinter da el enlace por caído ante un error de E/S (ej: se
+    desconectó o se reinició el adaptador USB-serial) o LINK_TIMEOUT_LIMIT
+    comandos seguidos sin respuesta. Entonces la cola deja de despachar
+    trabajos (esperan en vez de fallar), se cierra el puerto y se vuelve a
+    abrir con esperas crecientes desde LINK_RECONNECT_INITIAL hasta
+    LINK_RECONNECT_MAX segundos. Si la impresora no aparece en su puerto, se
+    busca en los puertos que aparecieron después de la caída la que responda
+    al ENQ con el mismo serial fiscal (S5): un adaptador que vuelve con otro
+    nombre (ej: COM3 -> COM5) se adopta sin cambiar la identidad de la
+    impresora (printer.port). Los puertos que ya existían (otros equipos
+    conectados) y los reservados con reserve_ports() nunca se abren.
+    on_restored(sts1, sts2) recibe el status leído al reconectar.
+    """
+
+    def __init__(
+        self,
+        printer,
+        lock,
+        queue,
+        on_restored=None,
+        list_ports=available_ports,
+        initial_delay=LINK_RECONNECT_INITIAL,
+        max_delay=LINK_RECONNECT_MAX,
+    ):
+        self.printer = printer
+        self.lock = lock
+        self.queue = queue
+        self.on_restored = on_restored
+        self.list_ports = list_ports
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.reconnecting = False
+        self.outages = 0
+        self.attempts = 0  # Intentos de la reconexión en curso o de la última
+        self.last_outage = None  # {"error", "lost_at", "restored_at", "seconds", ...}
+        self._known_ports = set()  # Puertos que existían al caer el enlace
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # La cola se retiene en el mismo hilo que detecta la caída, antes de
+        # que termine el trabajo en curso: el siguiente ya no se despacha.
+        self.printer.on_link_lost = self._hold_queue
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.printer.on_link_lost = None
+
+    def _hold_queue(self, reason):
+        self.queue.hold(f"Reconectando con la impresora ({reason}).")
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.printer.link_lost.wait(LINK_WATCH_INTERVAL):
+                self._reconnect()
+
+    # --- Reconexión ---
+
+    def _reconnect(self):
+        reason = self.printer.link_error
+        started = time.monotonic()
+        self.reconnecting = True
+        self.outages += 1
+        self.attempts = 0
+        self.last_outage = {
+            "error": reason,
+            "device": self.printer.device,
+            "lost_at": datetime.now().isoformat(timespec="milliseconds"),
+        }
+        self._hold_queue(reason)
+        self._known_ports = set(self._list_ports())
+        try:
+            # El trabajo en curso termina enseguida: con el enlace caído cada
+            # comando falla sin esperar el timeout del puerto.
+            with self.lock:
+                self._close_connection()
+            delay = self.initial_delay
+            while not self._stop.is_set():
+                self.attempts += 1
+                found = self._find_printer()
+                if found is not None:
+                    self._restore(*found, started)
+                    return
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_delay)
+        finally:
+            self.reconnecting = False
+            self.queue.release()
+
+    def _close_connection(self):
+        try:
+            self.printer.close()
+        except OSError:
+            pass  # El dispositivo ya no existe
+
+    def _restore(self, connection, device, started):
+        with self.lock:
+            if self._stop.is_set():
+                connection.close()  # Se desconectó la impresora mientras tanto
+                return
+            self.printer.replace_connection(connection, device)
+            try:
+                sts1_byte, sts2_byte = self.printer.get_status()
+            except ConnectionError:
+                sts1_byte, sts2_byte = None, None
+        seconds = time.monotonic() - started
+        moved = device != self.last_outage["device"]
+        self.last_outage.update(
+            {
+                "restored_at": datetime.now().isoformat(timespec="milliseconds"),
+                "seconds": round(seconds, 3),
+                "attempts": self.attempts,
+                "new_device": device if moved else None,
+            }
+        )
+        print(
+            f"Enlace con la impresora restablecido en {seconds:.2f} s"
+            + (f" (ahora en {device})." if moved else ".")
+        )
+        if self.on_restored:
+            self.on_restored(sts1_byte, sts2_byte)
+
+    def _list_ports(self):
+        try:
+            return self.list_ports()
+        except OSError as e:
+            print(f"Error al listar los puertos serie: {e}")
+            return []
+
+    def _find_printer(self):
+        """
+        Busca la impresora primero en su puerto y luego en los que aparecieron
+        después de la caída. Devuelve (conexión abierta, puerto) o None. Sin
+        serial fiscal conocido solo se prueba el puerto actual: no habría cómo
+        reconocerla en otro.
+        """
+        candidates = [self.printer.device]
+        if self.printer.serial_number:
+            skip = self._known_ports | _reserved_ports | {self.printer.device}
+            candidates += [p for p in self._list_ports() if p not in skip]
+        for device in candidates:
+            connection = self._probe(device)
+            if connection is not None:
+                return connection, device
+        return None
+
+    def _probe(self, device):
+        """Abre 'device' y verifica que responda la misma impresora (ENQ y S5)."""
+        probe = FiscalPrinter(
+            device,
+            baudrate=self.printer.baudrate,
+            timeout=self.printer.timeout,
+            autobaud=False,
+        )
+        try:
+            probe.connect()
+            if probe.probe_baudrate(self.printer.baudrate):
+                if self.printer.serial_number is None:
+                    return probe.serial_connection
+                s5 = commands.read_s5(probe)
+                if s5 is not None and s5.serial_number == self.printer.serial_number:
+                    return probe.serial_connection
+        except (ConnectionError, ValueError, OSError) as e:
+            print(f"La impresora no responde en {device}: {e}")
+        try:
+            probe.close()
+        except OSError:
+            pass
+        return None
+
+    def snapshot(self):
+        return {
+            "device": self.printer.device,
+            "state": "reconnecting" if self.reconnecting else "up",
+            "error": self.printer.link_error,
+            "outages": self.outages,
+            "attempts": self.attempts if self.reconnecting else None,
+            "last_outage": self.last_outage,
+        }
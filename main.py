@@ -1,9 +1,72 @@
 # Generated by Copilot
-import serial
-from gui import FiscalApp
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Impresora fiscal HKA80: interfaz gráfica, nodo de impresión o gateway."
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--node",
+        metavar="PUERTO",
+        help="Sin interfaz gráfica: conecta la impresora en PUERTO (ej: COM3 o "
+        "emu://caja1 para el emulador) y atiende la API HTTP",
+    )
+    mode.add_argument(
+        "--gateway",
+        metavar="URL",
+        nargs="+",
+        help="Reparte los documentos entre los nodos indicados "
+        "(ej: http://127.0.0.1:5001 http://127.0.0.1:5002)",
+    )
+    mode.add_argument(
+        "--workers",
+        metavar="PUERTO",
+        nargs="+",
+        help="Un proceso por impresora en los puertos indicados (ej: COM3 COM4), "
+        "con el gateway delante en el proceso de la API",
+    )
+    parser.add_argument(
+        "--shadow",
+        action="store_true",
+        help="Con --node o --workers: modo sombra, los documentos se validan y se "
+        "envían al emulador sin imprimir",
+    )
+    parser.add_argument("--host", default="0.0.0.0", help="Interfaz HTTP")
+    parser.add_argument("--http-port", type=int, default=5000, help="Puerto HTTP")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    app = FiscalApp()
-    app.protocol("WM_DELETE_WINDOW", app.on_closing)
-    app.mainloop()
+    args = parse_args()
+    if args.node:
+        from communication import FiscalPrinter
+        import web_server
+
+        printer = FiscalPrinter(port=args.node)
+        printer.connect()
+        try:
+            web_server.start_server(
+                printer, host=args.host, port=args.http_port, shadow=args.shadow
+            )
+        except KeyboardInterrupt:
+            # Ctrl+C: se terminan los documentos en curso antes de cerrar el puerto.
+            web_server.stop_server()
+            printer.close()
+    elif args.workers:
+        import workers
+
+        workers.start_workers(
+            args.workers, host=args.host, port=args.http_port, shadow=args.shadow
+        )
+    elif args.gateway:
+        import gateway
+
+        gateway.start_gateway(args.gateway, host=args.host, port=args.http_port)
+    else:
+        from gui import FiscalApp
+
+        app = FiscalApp()
+        app.protocol("WM_DELETE_WINDOW", app.on_closing)
+        app.mainloop()
@@ -1,15 +1,19 @@
 # models.py -> Añadir este nuevo código
 
 from dataclasses import dataclass
+from decimal import Decimal
 
 
-def _parse_fiscal_amount(value_str: str) -> float:
-    """Función de ayuda para convertir montos fiscales (ej: '000012345') a float (123.45)."""
+def _parse_fiscal_amount(value_str: str) -> Decimal:
+    """
+    Función de ayuda para convertir montos fiscales (ej: '000012345') a
+    Decimal exacto (123.45), sin pasar por float.
+    """
     try:
         # Los montos vienen como enteros, los últimos 2 dígitos son los decimales.
-        return float(value_str) / 100.0
+        return Decimal(int(value_str)).scaleb(-2)
     except (ValueError, TypeError):
-        return 0.0
+        return Decimal("0.00")
 
 
 @dataclass
@@ -29,20 +33,20 @@ class ReportXData:
     numero_ultima_nc: int
     numero_ultimo_nd: int
     numero_ultimo_doc_no_fiscal: int
-    venta_exento: float
-    venta_base_tasa1: float
-    venta_iva_tasa1: float
-    venta_base_tasa2: float
-    venta_iva_tasa2: float
-    venta_base_tasa3: float
-    venta_iva_tasa3: float
-    nc_exento: float
-    nc_base_tasa1: float
-    nc_iva_tasa1: float
-    nc_base_tasa2: float
-    nc_iva_tasa2: float
-    nc_base_tasa3: float
-    nc_iva_tasa3: float
+    venta_exento: Decimal
+    venta_base_tasa1: Decimal
+    venta_iva_tasa1: Decimal
+    venta_base_tasa2: Decimal
+    venta_iva_tasa2: Decimal
+    venta_base_tasa3: Decimal
+    venta_iva_tasa3: Decimal
+    nc_exento: Decimal
+    nc_base_tasa1: Decimal
+    nc_iva_tasa1: Decimal
+    nc_base_tasa2: Decimal
+    nc_iva_tasa2: Decimal
+    nc_base_tasa3: Decimal
+    nc_iva_tasa3: Decimal
 
     @classmethod
     def from_trama(cls, trama_str: str):
@@ -53,7 +57,8 @@ class ReportXData:
         # El separador es el carácter 0x0A (LF o '\n').
         parts = trama_str.strip().split("\n")
 
-        if not parts[0].startswith("U0X") or len(parts) < 22:
+        # 9 campos de contadores y fechas + 7 acumulados de ventas, ND y NC.
+        if not parts[0].startswith("U0X") or len(parts) < 31:
             raise ValueError("Trama de Reporte X no válida o incompleta.")
 
         # El primer elemento es el comando 'U0X', los datos empiezan desde el índice 1
@@ -79,15 +84,15 @@ class ReportXData:
             venta_iva_tasa2=_parse_fiscal_amount(data[13]),
             venta_base_tasa3=_parse_fiscal_amount(data[14]),
             venta_iva_tasa3=_parse_fiscal_amount(data[15]),
-            # Omitimos los datos de ND por brevedad en el ejemplo
-            # y saltamos a los de NC (Devoluciones)
-            nc_exento=_parse_fiscal_amount(data[24]),
-            nc_base_tasa1=_parse_fiscal_amount(data[25]),
-            nc_iva_tasa1=_parse_fiscal_amount(data[26]),
-            nc_base_tasa2=_parse_fiscal_amount(data[27]),
-            nc_iva_tasa2=_parse_fiscal_amount(data[28]),
-            nc_base_tasa3=_parse_fiscal_amount(data[29]),
-            nc_iva_tasa3=_parse_fiscal_amount(data[30]),
+            # Omitimos los datos de ND (índices 16 a 22) por brevedad
+            # y saltamos a los de NC (Devoluciones), Tabla 63.
+            nc_exento=_parse_fiscal_amount(data[23]),
+            nc_base_tasa1=_parse_fiscal_amount(data[24]),
+            nc_iva_tasa1=_parse_fiscal_amount(data[25]),
+            nc_base_tasa2=_parse_fiscal_amount(data[26]),
+            nc_iva_tasa2=_parse_fiscal_amount(data[27]),
+            nc_base_tasa3=_parse_fiscal_amount(data[28]),
+            nc_iva_tasa3=_parse_fiscal_amount(data[29]),
         )
 
 
@@ -125,6 +130,61 @@ class S5PrinterData:
         )
 
 
+@dataclass
+class EncodedFrame:
+    """
+    Una trama de un documento ya validada y codificada (STX + DATOS + ETX + LRC).
+    role es "header", "item" o "close"; description es la del ítem, para los
+    mensajes de error; amount_cents y quantity_millis son el total y la cantidad
+    de la línea (en céntimos y milésimas).
+    """
+
+    role: str
+    command: str
+    data: bytes
+    description: str = ""
+    amount_cents: int = 0
+    quantity_millis: int = 0
+    tax_index: int = 0  # 0: exento, 1: general, 2: reducida, 3: adicional
+
+
+@dataclass
+class CompiledDocument:
+    """
+    Documento fiscal completo listo para transmitir: todas sus tramas en orden,
+    desde los encabezados hasta el cierre.
+    """
+
+    kind: str
+    frames: list
+    item_count: int
+    header_lines: int
+
+    @property
+    def byte_count(self) -> int:
+        return sum(len(frame.data) for frame in self.frames)
+
+    @property
+    def subtotal_cents(self) -> int:
+        return sum(frame.amount_cents for frame in self.frames)
+
+    def tax_totals(self, rates) -> tuple:
+        """
+        Totales del documento en céntimos por tasa, en el orden de los
+        acumulados de la impresora: exento, base1, iva1, base2, iva2, base3,
+        iva3. El IVA se calcula sobre la base total de cada tasa, con 'rates'
+        los porcentajes de las tasas 1 a 3.
+        """
+        bases = [0, 0, 0, 0]
+        for frame in self.frames:
+            if frame.role == "item":
+                bases[frame.tax_index] += frame.amount_cents
+        totals = [bases[0]]
+        for base, rate in zip(bases[1:], rates):
+            totals += [base, (base * rate + 50) // 100]
+        return tuple(totals)
+
+
 # Puedes agregar más clases para otros status (S1, S2, S3, ReporteX, etc.)
 # siguiendo la misma lógica y consultando las tablas del manual.
 # Por ejemplo, para S1:
@@ -144,3 +204,90 @@ class S1PrinterData:
     def from_trama(cls, trama_str: str):
         # Implementar la lógica de parseo aquí...
         pass
+
+
+@dataclass
+class S2PrinterData:
+    """
+    Representa los datos del comando S2 (documento fiscal en curso) para HKA80.
+    Los montos vienen en céntimos y la cantidad de artículos en milésimas.
+    Referencia: Manual, Página 55, Tabla 46.
+    """
+
+    subtotal_bases: int
+    subtotal_iva: int
+    data_dummy: int
+    cantidad_articulos: int
+    monto_por_pagar: int
+    numero_pagos_realizados: int
+    tipo_documento: int  # 0: ninguno, 1: factura, 2: nota de crédito, 3: nota de débito
+
+    @classmethod
+    def from_trama(cls, trama_str: str):
+        """Crea una instancia a partir de la trama 'S2\nCAMPO1\n...'."""
+        parts = trama_str.strip().split("\n")
+        if not parts[0].startswith("S2") or len(parts) < 8:
+            raise ValueError("Trama de status S2 no válida o incompleta.")
+
+        data = parts[1:]
+        return cls(
+            subtotal_bases=int(data[0]),
+            subtotal_iva=int(data[1]),
+            data_dummy=int(data[2]),
+            cantidad_articulos=int(data[3]),
+            monto_por_pagar=int(data[4]),
+            numero_pagos_realizados=int(data[5]),
+            tipo_documento=int(data[6]),
+        )
+
+
+# Nombres de los 14 acumulados de un Reporte Z, en el orden en que vienen.
+Z_AMOUNT_FIELDS = (
+    "venta_exento",
+    "venta_base_tasa1",
+    "venta_iva_tasa1",
+    "venta_base_tasa2",
+    "venta_iva_tasa2",
+    "venta_base_tasa3",
+    "venta_iva_tasa3",
+    "nc_exento",
+    "nc_base_tasa1",
+    "nc_iva_tasa1",
+    "nc_base_tasa2",
+    "nc_iva_tasa2",
+    "nc_base_tasa3",
+    "nc_iva_tasa3",
+)
+
+
+@dataclass
+class ZRecord:
+    """
+    Un Reporte Z descargado de la memoria fiscal (comando U3A). Cada registro es
+    una línea de ancho fijo: número (4), fecha DDMMAA (6), hora HHMM (4), última
+    factura (8), última nota de crédito (8) y los 14 acumulados de
+    Z_AMOUNT_FIELDS (18 dígitos cada uno, en céntimos).
+    """
+
+    numero: int
+    fecha: str  # AAAA-MM-DD
+    hora: str
+    numero_ultima_factura: int
+    numero_ultima_nc: int
+    montos: tuple  # En céntimos, en el orden de Z_AMOUNT_FIELDS
+
+    LINE_LENGTH = 30 + 18 * len(Z_AMOUNT_FIELDS)
+
+    @classmethod
+    def from_line(cls, line: str):
+        if len(line) != cls.LINE_LENGTH or not line.isdigit():
+            raise ValueError(f"Registro Z inválido: '{line[:30]}...'")
+        day, month, year = line[4:6], line[6:8], line[8:10]
+        return cls(
+            numero=int(line[0:4]),
+            fecha=f"20{year}-{month}-{day}",
+            hora=f"{line[10:12]}:{line[12:14]}",
+            numero_ultima_factura=int(line[14:22]),
+            numero_ultima_nc=int(line[22:30]),
+            montos=tuple(int(line[i : i + 18]) for i in range(30, cls.LINE_LENGTH, 18)),
+        )
@@ -0,0 +1,183 @@
+# non_fiscal.py
+import threading
+from queue import SimpleQueue
+
+import commands
+from config import NON_FISCAL_PART_LINES, NON_FISCAL_PROGRESS_EVERY
+
+
+class NonFiscalPrint:
+    """
+    Impresión de un texto no fiscal largo (resúmenes de cierre, comprobantes)
+    en partes de NON_FISCAL_PART_LINES líneas.
+
+    Cada parte es un documento no fiscal propio que se entrega a
+    submit(func, lineas, on_finish) (la web lo encola como trabajo de baja
+    prioridad): mientras un documento no fiscal está abierto la impresora no
+    acepta facturas, así que entre una parte y otra se atienden los documentos
+    fiscales. Las partes se compilan y encolan a medida que llega el texto, de
+    modo que la impresión empieza antes de recibirlo completo. El avance se
+    publica como eventos (ver events()).
+    """
+
+    def __init__(
+        self,
+        printer,
+        submit,
+        part_lines=NON_FISCAL_PART_LINES,
+        progress_every=NON_FISCAL_PROGRESS_EVERY,
+        on_finish=None,
+    ):
+        if part_lines <= 0:
+            raise ValueError("El tamaño de las partes debe ser positivo.")
+        self.printer = printer
+        self.submit = submit
+        self.part_lines = part_lines
+        self.progress_every = progress_every
+        self.on_finish = on_finish
+        self.jobs = []
+        self.line_count = 0  # Líneas recibidas (ya ajustadas al ancho)
+        self.printed = 0
+        self.error = None
+        self._buffer = []
+        self._pending = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._events = SimpleQueue()
+
+    # --- Entrada (hilo de la petición) ---
+
+    def add_text(self, text):
+        """Agrega texto; cada parte completa se compila y se encola."""
+        lines = commands.wrap_non_fiscal_text(text)
+        self.line_count += len(lines)
+        self._buffer.extend(lines)
+        while len(self._buffer) >= self.part_lines:
+            part, self._buffer = (
+                self._buffer[: self.part_lines],
+                self._buffer[self.part_lines :],
+            )
+            self._submit_part(part)
+
+    def finish(self):
+        """Fin del texto: encola lo que quedó como última parte."""
+        if self._buffer:
+            part, self._buffer = self._buffer, []
+            self._submit_part(part)
+        self._close()
+
+    def abort(self, reason):
+        """
+        Descarta el texto que falta: las partes que aún no empezaron no se
+        imprimen. La parte en curso termina (no se corta un documento abierto).
+        """
+        with self._lock:
+            self.error = self.error or reason
+        self._buffer = []
+        self._close()
+
+    def _submit_part(self, lines):
+        document = commands.compile_non_fiscal(lines)
+        number = len(self.jobs) + 1
+        with self._lock:
+            self._pending += 1
+        try:
+            job = self.submit(
+                lambda: self._run_part(number, document),
+                len(lines),
+                lambda job: self._part_finished(number, job),
+            )
+        except Exception:
+            # No se encoló (cola detenida, cliente rechazado): abort() no debe
+            # esperar a esta parte.
+            with self._lock:
+                self._pending -= 1
+            raise
+        self.jobs.append(job)
+
+    def _close(self):
+        with self._lock:
+            self._closed = True
+            done = not self._pending
+        if done:
+            self._finish()
+
+    # --- Impresión (hilo de la cola, con la impresora tomada) ---
+
+    def _run_part(self, number, document):
+        if self.error:
+            return f"Parte {number} no impresa: {self.error}"
+        printed_before = self.printed
+
+        def on_progress(printed):
+            self.printed = printed_before + printed
+            if printed % self.progress_every == 0:
+                self._publish("progress", part=number)
+
+        result = commands.transmit_non_fiscal(self.printer, document, on_progress)
+        if "correctamente" not in result:
+            with self._lock:
+                self.error = self.error or result
+        return result
+
+    def _part_finished(self, number, job):
+        ok = job.status == "finished" and "correctamente" in job.result
+        if not ok:
+            with self._lock:
+                self.error = self.error or job.result
+        self._publish(
+            "part",
+            part=number,
+            status="success" if ok else "error",
+            message=job.result,
+            job=job.to_dict(),
+        )
+        with self._lock:
+            self._pending -= 1
+            done = self._closed and not self._pending
+        if done:
+            self._finish()
+
+    def _finish(self):
+        if self.on_finish:
+            self.on_finish()
+        if self.error:
+            message = f"Error: {self.error}"
+        else:
+            message = (
+                f"{commands.NON_FISCAL_NAME} impreso correctamente "
+                f"({self.printed} líneas en {len(self.jobs)} documento(s))."
+            )
+        self._publish(
+            "done", status="error" if self.error else "success", message=message
+        )
+
+    # --- Salida ---
+
+    def _publish(self, event, **fields):
+        self._events.put(
+            {
+                "event": event,
+                **fields,
+                "printed_lines": self.printed,
+                "total_lines": self.line_count,
+            }
+        )
+
+    def events(self):
+        """
+        Eventos en orden hasta el final: "accepted" con los trabajos, "progress"
+        cada NON_FISCAL_PROGRESS_EVERY líneas, "part" al terminar cada documento
+        y "done" con el resultado.
+        """
+        yield {
+            "event": "accepted",
+            "parts": len(self.jobs),
+            "total_lines": self.line_count,
+            "jobs": [job.id for job in self.jobs],
+        }
+        while True:
+            event = self._events.get()
+            yield event
+            if event["event"] == "done":
+                return
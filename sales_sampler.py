@@ -0,0 +1,195 @@
+# sales_sampler.py
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+import commands
+from config import SALES_SAMPLE_INTERVAL, SALES_RING_CAPACITY, SALES_RING_DIR
+from models import Z_AMOUNT_FIELDS
+
+_FIELDS = len(Z_AMOUNT_FIELDS)
+
+# Cabecera: marca, versión, capacidad, muestras escritas (total), hora, número
+# del próximo Reporte Z y acumulados absolutos de la última lectura (para
+# calcular el próximo delta).
+_HEADER = struct.Struct(f"<8sIIQdq{_FIELDS}q")
+_MAGIC = b"HKASALES"
+_VERSION = 2
+# Cada muestra: hora (epoch) y los deltas de los 14 acumulados, en céntimos.
+_RECORD = struct.Struct(f"<d{_FIELDS}q")
+
+
+class SalesRing:
+    """
+    Serie de ventas de una impresora en un archivo circular de tamaño fijo,
+    mapeado en memoria. Al llenarse, cada muestra nueva reemplaza a la más vieja.
+    """
+
+    def __init__(self, path, capacity=SALES_RING_CAPACITY):
+        size = _HEADER.size + capacity * _RECORD.size
+        new = not os.path.exists(path) or os.path.getsize(path) != size
+        self._lock = threading.Lock()
+        self._file = open(path, "r+b" if not new else "w+b")
+        if new:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        magic, version = struct.unpack_from("<8sI", self._map, 0)
+        if new or magic != _MAGIC or version != _VERSION:
+            _HEADER.pack_into(
+                self._map, 0, _MAGIC, _VERSION, capacity, 0, 0.0, 0, *([0] * _FIELDS)
+            )
+        _, _, self.capacity, self._written, self.last_time, z_number, *last = (
+            _HEADER.unpack_from(self._map, 0)
+        )
+        self.last_z_number = z_number if self._written else None
+        self.last_totals = tuple(last) if self._written else None
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    def record(self, timestamp, totals, z_number):
+        """
+        Registra los acumulados absolutos leídos a 'timestamp' y guarda el delta
+        contra la lectura anterior. z_number es el número del próximo Reporte Z
+        según el mismo Reporte X: si cambió, hubo un Z entre ambas lecturas y
+        los acumulados volvieron a cero, así que el delta de todos los campos es
+        el valor nuevo completo.
+        """
+        with self._lock:
+            if self.last_totals is None:
+                deltas = (0,) * _FIELDS  # Primera lectura: solo punto de partida
+            elif z_number != self.last_z_number:
+                deltas = tuple(totals)
+            else:
+                deltas = tuple(new - old for new, old in zip(totals, self.last_totals))
+            slot = self._written % self.capacity
+            _RECORD.pack_into(
+                self._map, _HEADER.size + slot * _RECORD.size, timestamp, *deltas
+            )
+            self._written += 1
+            self.last_time, self.last_totals = timestamp, tuple(totals)
+            self.last_z_number = z_number
+            _HEADER.pack_into(
+                self._map,
+                0,
+                _MAGIC,
+                _VERSION,
+                self.capacity,
+                self._written,
+                timestamp,
+                z_number,
+                *totals,
+            )
+        return deltas
+
+    def samples(self):
+        """Muestras (hora, deltas) en orden cronológico."""
+        with self._lock:
+            count = len(self)
+            start = self._written % self.capacity if self._written > count else 0
+            body = memoryview(self._map)[_HEADER.size :]
+            records = list(_RECORD.iter_unpack(body[: self.capacity * _RECORD.size]))
+            body.release()
+        ordered = records[start:count] + records[:start] if count else []
+        return [(r[0], r[1:]) for r in ordered]
+
+    def downsample(self, bucket_seconds, since=None, until=None):
+        """
+        Suma los deltas en intervalos de bucket_seconds (ej: 3600 para ventas por
+        hora). Devuelve [(inicio del intervalo, totales)] en orden.
+        """
+        buckets = {}
+        for timestamp, deltas in self.samples():
+            if (since is not None and timestamp < since) or (
+                until is not None and timestamp >= until
+            ):
+                continue
+            key = timestamp - timestamp % bucket_seconds
+            current = buckets.get(key)
+            buckets[key] = (
+                deltas if current is None else tuple(map(sum, zip(current, deltas)))
+            )
+        return sorted(buckets.items())
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+def ring_path(port, directory=SALES_RING_DIR):
+    """Archivo de la serie de una impresora (el puerto se limpia para el nombre)."""
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", port)
+    return os.path.join(directory, f"{safe}.ring")
+
+
+def _report_totals(report):
+    """Acumulados de un Reporte X (ReportXData) en céntimos."""
+    return tuple(int(getattr(report, name).scaleb(2)) for name in Z_AMOUNT_FIELDS)
+
+
+class SalesSampler:
+    """
+    Lee el Reporte X (U0X) cada SALES_SAMPLE_INTERVAL segundos y guarda los
+    deltas en el SalesRing de la impresora.
+
+    Solo lee cuando la impresora está ociosa: si hay trabajos en cola o el lock
+    de la impresora está tomado, la muestra se salta sin esperar, para no
+    agregar latencia a la caja. on_report(report) recibe cada Reporte X leído,
+    todavía con el lock tomado (la web verifica así los contadores de
+    documentos sin una consulta aparte).
+    """
+
+    def __init__(
+        self,
+        printer,
+        lock,
+        is_busy,
+        ring,
+        interval=SALES_SAMPLE_INTERVAL,
+        on_report=None,
+    ):
+        self.printer = printer
+        self.lock = lock
+        self.is_busy = is_busy
+        self.ring = ring
+        self.interval = interval
+        self.on_report = on_report
+        self.skipped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sample_once(self):
+        """Toma una muestra si la impresora está libre. Devuelve True si la tomó."""
+        if self.is_busy() or not self.lock.acquire(blocking=False):
+            self.skipped += 1
+            return False
+        try:
+            report = commands.read_report_x(self.printer)
+            if report is not None and self.on_report:
+                self.on_report(report)
+        except (ConnectionError, ValueError) as e:
+            print(f"Error al leer el Reporte X para la serie de ventas: {e}")
+            report = None
+        finally:
+            self.lock.release()
+        if report is None:
+            return False
+        self.ring.record(time.time(), _report_totals(report), report.numero_proximo_z)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample_once()
+        self.ring.close()
@@ -0,0 +1,100 @@
+# service_model.py
+import threading
+
+from config import (
+    DEFAULT_DOCUMENT_SERVICE_TIME,
+    DEFAULT_ITEM_SERVICE_TIME,
+    DEFAULT_HEADER_SERVICE_TIME,
+    DEFAULT_Z_REPORT_SERVICE_TIME,
+)
+
+
+class ServiceTimeModel:
+    """
+    Modelo lineal del tiempo que tarda la impresora en procesar un documento:
+
+        duración = fijo + por_item * items + por_linea_encabezado * encabezados
+
+    Los coeficientes se ajustan en línea con mínimos cuadrados recursivos (RLS)
+    a partir de las duraciones medidas, con un factor de olvido para seguir los
+    cambios de la impresora (papel, velocidad del puerto, etc.). La duración del
+    Reporte Z se estima aparte con un promedio móvil exponencial.
+    """
+
+    def __init__(
+        self,
+        fixed=DEFAULT_DOCUMENT_SERVICE_TIME,
+        per_item=DEFAULT_ITEM_SERVICE_TIME,
+        per_header=DEFAULT_HEADER_SERVICE_TIME,
+        z_report=DEFAULT_Z_REPORT_SERVICE_TIME,
+        forgetting=0.98,
+        z_smoothing=0.3,
+    ):
+        self._lock = threading.Lock()
+        self._theta = [float(fixed), float(per_item), float(per_header)]
+        # Covarianza inicial amplia: las primeras mediciones pesan mucho.
+        self._p = [[100.0 if i == j else 0.0 for j in range(3)] for i in range(3)]
+        self._forgetting = forgetting
+        self._z_report = float(z_report)
+        self._z_smoothing = z_smoothing
+        self._samples = 0
+        self._z_samples = 0
+
+    def predict(self, items, header_lines=0):
+        """Duración estimada (segundos) de un documento."""
+        with self._lock:
+            fixed, per_item, per_header = (max(0.0, c) for c in self._theta)
+        return fixed + per_item * items + per_header * header_lines
+
+    def predict_z(self):
+        """Duración estimada (segundos) del Reporte Z."""
+        with self._lock:
+            return self._z_report
+
+    def observe(self, items, header_lines, seconds):
+        """Incorpora la duración medida de un documento al modelo."""
+        x = [1.0, float(items), float(header_lines)]
+        with self._lock:
+            p, theta, lam = self._p, self._theta, self._forgetting
+            px = [sum(p[i][j] * x[j] for j in range(3)) for i in range(3)]
+            denom = lam + sum(x[i] * px[i] for i in range(3))
+            gain = [v / denom for v in px]
+            error = seconds - sum(theta[i] * x[i] for i in range(3))
+            self._theta = [theta[i] + gain[i] * error for i in range(3)]
+            # P = (P - k * x^T * P) / lambda ; P es simétrica, x^T * P == px^T
+            self._p = [
+                [(p[i][j] - gain[i] * px[j]) / lam for j in range(3)] for i in range(3)
+            ]
+            self._samples += 1
+
+    def observe_z(self, seconds):
+        """Incorpora la duración medida de un Reporte Z."""
+        with self._lock:
+            self._z_report += self._z_smoothing * (seconds - self._z_report)
+            self._z_samples += 1
+
+    def coefficients(self):
+        """Coeficientes actuales del modelo, para exponer en la API."""
+        with self._lock:
+            fixed, per_item, per_header = self._theta
+            return {
+                "fixed_seconds": round(fixed, 4),
+                "per_item_seconds": round(per_item, 4),
+                "per_header_line_seconds": round(per_header, 4),
+                "z_report_seconds": round(self._z_report, 4),
+                "document_samples": self._samples,
+                "z_report_samples": self._z_samples,
+            }
+
+
+# Un modelo por impresora, identificada por su puerto serial.
+_models = {}
+_models_lock = threading.Lock()
+
+
+def model_for(printer_key):
+    """Devuelve (creándolo si hace falta) el modelo de la impresora indicada."""
+    with _models_lock:
+        if printer_key not in _models:
+            _models[printer_key] = ServiceTimeModel()
+        return _models[printer_key]
@@ -0,0 +1,179 @@
+# sessions.py
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import commands
+from config import SESSION_IDLE_TIMEOUT, JOB_HISTORY_SIZE
+from models import CompiledDocument
+
+# Marca en la cola de líneas para cancelar la sesión.
+_CANCEL = object()
+
+
+class DocumentSession:
+    """
+    Documento fiscal que se arma línea por línea mientras el cajero escanea.
+
+    La sesión ocupa la cola de la impresora como un único trabajo: al empezar
+    envía los encabezados y luego transmite cada línea apenas llega, de modo
+    que la impresora imprime en paralelo con la caja. Al cerrar solo falta la
+    trama de pago (101). Si no llegan líneas en SESSION_IDLE_TIMEOUT segundos
+    el documento se anula, para no dejar la impresora bloqueada.
+    """
+
+    OPEN = "open"
+    CLOSING = "closing"
+    CLOSED = "closed"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    def __init__(self, kind, headers, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.idle_timeout = idle_timeout
+        self.state = self.OPEN
+        self.lines_received = 0
+        self.created_at = datetime.now()
+        self.first_print_at = None
+        self.result = None
+        self.job = None
+        self.document = CompiledDocument(kind, [], 0, len(headers))
+        self.transaction = commands.DocumentTransaction(self.document)
+        self._incoming = queue.Queue()
+        self._incoming.put(headers)
+        self._lock = threading.Lock()
+
+    # --- Lado del cliente (hilos de las peticiones HTTP) ---
+
+    def add_items(self, frames):
+        """Encola tramas de ítems ya compiladas para enviarlas a la impresora."""
+        with self._lock:
+            if self.state != self.OPEN:
+                raise RuntimeError(
+                    f"La sesión {self.id} no está abierta ({self.state})."
+                )
+            self.lines_received += len(frames)
+            self._incoming.put(frames)
+
+    def close(self, close_frame):
+        """Encola el cierre (pago). Se debe esperar al trabajo para el resultado."""
+        with self._lock:
+            if self.state != self.OPEN:
+                raise RuntimeError(
+                    f"La sesión {self.id} no está abierta ({self.state})."
+                )
+            if not self.lines_received:
+                raise ValueError("El documento no tiene ítems.")
+            self.state = self.CLOSING
+            self._incoming.put([close_frame])
+
+    def cancel(self):
+        """Pide anular el documento. Se debe esperar al trabajo para el resultado."""
+        with self._lock:
+            if self.state not in (self.OPEN, self.CLOSING):
+                raise RuntimeError(f"La sesión {self.id} ya terminó ({self.state}).")
+            self._incoming.put(_CANCEL)
+
+    # --- Lado de la impresora (hilo de la cola de trabajos, con el lock tomado) ---
+
+    def run(self, printer):
+        """Función del trabajo encolado: transmite las líneas a medida que llegan."""
+        name = commands.DOCUMENT_NAMES[self.kind]
+        while True:
+            try:
+                frames = self._incoming.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self.transaction.void(printer)
+                return self._finish(
+                    self.FAILED,
+                    f"Error: {name} anulada por inactividad "
+                    f"({self.idle_timeout:.0f} s sin líneas nuevas).",
+                )
+
+            if frames is _CANCEL:
+                voided = self.transaction.void(printer)
+                message = (
+                    f"{name} anulada en la impresora."
+                    if voided
+                    else f"{name} cancelada (no llegó a abrirse en la impresora)."
+                )
+                return self._finish(self.CANCELLED, message)
+
+            self.document.frames.extend(frames)
+            self.document.item_count += sum(1 for f in frames if f.role == "item")
+            error = self.transaction.send_pending(printer)
+            if error:
+                if self.transaction.state == self.transaction.SUSPENDED:
+                    # Sin cierre no se puede retomar: se intenta anular.
+                    self.transaction.void(printer)
+                return self._finish(self.FAILED, error)
+
+            if self.first_print_at is None and self.document.item_count:
+                self.first_print_at = datetime.now()
+            if frames and frames[-1].role == "close":
+                message = self.transaction.complete()
+                commands.record_in_journal(printer, self.transaction)
+                return self._finish(self.CLOSED, message)
+
+    def _finish(self, state, message):
+        with self._lock:
+            self.state = state
+            self.result = message
+        return message
+
+    def to_dict(self):
+        def iso(value):
+            return value.isoformat(timespec="milliseconds") if value else None
+
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "lines_received": self.lines_received,
+            "lines_printed": self.transaction.confirmed_item_count,
+            "subtotal": str(commands.cents_to_decimal(self.document.subtotal_cents)),
+            "created_at": iso(self.created_at),
+            "first_print_at": iso(self.first_print_at),
+            "document": self.transaction.issued,
+            "job": self.job.to_dict() if self.job else None,
+            "result": self.result,
+        }
+
+
+# Sesiones conocidas (abiertas y terminadas recientemente), por id.
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def register(session):
+    with _sessions_lock:
+        _sessions[session.id] = session
+        while len(_sessions) > JOB_HISTORY_SIZE:
+            oldest_id, oldest = next(iter(_sessions.items()))
+            if oldest.state in (DocumentSession.OPEN, DocumentSession.CLOSING):
+                break
+            del _sessions[oldest_id]
+
+
+def get(session_id):
+    with _sessions_lock:
+        return _sessions.get(session_id)
+
+
+def cancel_open():
+    """Pide anular todas las sesiones abiertas (al detener el servidor)."""
+    with _sessions_lock:
+        open_sessions = [
+            s
+            for s in _sessions.values()
+            if s.state in (DocumentSession.OPEN, DocumentSession.CLOSING)
+        ]
+    for session in open_sessions:
+        try:
+            session.cancel()
+        except RuntimeError:
+            pass  # Terminó mientras tanto
+    return len(open_sessions)
@@ -0,0 +1,67 @@
+# shadow.py
+import threading
+import time
+
+import commands
+import emulator
+from communication import FiscalPrinter
+from jobs import JobQueue
+
+
+class ShadowPrinter:
+    """
+    Impresora emulada que atiende los documentos de prueba (dry_run) y el
+    modo sombra del servidor: el documento se valida y codifica igual que uno
+    real y se transmite al emulador, a la misma velocidad del puerto que la
+    impresora real, sin gastar papel ni contadores fiscales.
+
+    En modo sombra los documentos pasan por una cola propia (queue), con el
+    mismo control de admisión que la impresora real, para medir el
+    comportamiento de la cola sin imprimir. Los dry_run sueltos se atienden
+    con run(), sin cola.
+    """
+
+    def __init__(self, printer_port, baudrate):
+        self.baudrate = baudrate
+        port = f"{emulator.EMULATOR_PREFIX}shadow-{printer_port}"
+        emulator.get_emulator(port, printer_baudrate=baudrate, listed=False)
+        self.printer = FiscalPrinter(port, baudrate=baudrate, autobaud=False)
+        self.printer.connect()
+        self._lock = threading.Lock()
+        self.queue = JobQueue(self._lock)
+
+    def run(self, document):
+        """
+        Transmite el documento al emulador y devuelve el resultado junto con
+        las tramas exactas, su tamaño y el tiempo de línea estimado.
+        """
+        with self._lock:
+            start = time.monotonic()
+            result = commands.transmit_document(self.printer, document)
+            elapsed = time.monotonic() - start
+        return {
+            "message": result,
+            "kind": document.kind,
+            "items": document.item_count,
+            "header_lines": document.header_lines,
+            "frames": [
+                {"role": f.role, "command": f.command, "bytes": f.data.hex()}
+                for f in document.frames
+            ],
+            "byte_count": document.byte_count,
+            "baudrate": self.baudrate,
+            # Tramas enviadas más el ACK de cada una.
+            "wire_seconds": round(
+                emulator.wire_time(
+                    document.byte_count + len(document.frames), self.baudrate
+                ),
+                4,
+            ),
+            "emulated_seconds": round(elapsed, 4),
+        }
+
+    def close(self):
+        """Detiene la cola y libera la conexión con el emulador."""
+        self.queue.stop()
+        with self._lock:
+            self.printer.close()
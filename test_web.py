@@ -1,7 +1,8 @@
 import requests
 import json
 
-api_url = "http://192.168.68.109:5000/invoice"  # IP de la máquina con la impresora
+# IP de la máquina con la impresora, o del gateway (python main.py --gateway ...)
+api_url = "http://192.168.68.109:5000/invoice"
 
 invoice_data = {
     "customer_data": {"rif": "V-12345678", "name": "Pedro Perez"},
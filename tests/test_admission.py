@@ -0,0 +1,51 @@
+# tests/test_admission.py
+import threading
+
+import emulator
+from admission import AdmissionController
+from communication import FiscalPrinter
+from jobs import JobQueue
+from service_model import ServiceTimeModel
+from z_closing import ZClosing
+
+
+def test_pauses_are_kept_per_owner():
+    admission = AdmissionController()
+    admission.pause("z_closing", "Cierre diario (Reporte Z) en curso.")
+    admission.pause("server_stop", "El servidor se está deteniendo.")
+    admission.resume("server_stop")
+
+    assert admission.check() == (
+        503,
+        admission.retry_interval,
+        "Cierre diario (Reporte Z) en curso.",
+    )
+    admission.resume("z_closing")
+    assert admission.check() is None
+    assert admission.snapshot()["accepting"]
+
+
+def test_z_close_finishing_during_server_stop_keeps_the_stop_pause(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)  # Diario y contadores de la corrida
+    port = "emu://test-admission"
+    emulator.get_emulator(port, printer_baudrate=115200)
+    printer = FiscalPrinter(port=port, baudrate=115200, timeout=0.1, autobaud=False)
+    printer.connect()
+    lock = threading.Lock()
+    queue = JobQueue(lock)
+    admission = AdmissionController()
+    closing = ZClosing(printer, lock, queue, admission, ServiceTimeModel())
+    try:
+        # El servidor empieza a detenerse y, mientras drena, termina un cierre Z.
+        admission.pause("server_stop", "El servidor se está deteniendo.")
+        result = closing.run("test")
+        assert "completado" in result
+
+        assert admission.check()[2] == "El servidor se está deteniendo."
+        admission.resume("server_stop")
+        assert admission.check() is None
+    finally:
+        queue.stop()
+        printer.close()
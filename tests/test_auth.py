@@ -0,0 +1,41 @@
+# tests/test_auth.py
+import json
+
+import pytest
+
+from auth import Authenticator
+
+
+def _keys(tmp_path, content):
+    path = tmp_path / "api_keys.json"
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_without_keys_file_the_api_is_unlimited(tmp_path):
+    authenticator = Authenticator(str(tmp_path / "api_keys.json"))
+    client = authenticator.client_for(None)
+
+    assert not authenticator.enabled
+    assert all(client.allow_document() == 0 for _ in range(100))
+    assert all(client.reserve_slot() for _ in range(100))
+
+
+def test_keys_file_limits_documents(tmp_path):
+    path = _keys(tmp_path, json.dumps({"k1": {"name": "pos", "document_burst": 2}}))
+    authenticator = Authenticator(path)
+    client = authenticator.client_for("k1")
+
+    assert authenticator.client_for("otra") is None
+    assert client.name == "pos"
+    assert [client.allow_document() == 0 for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.parametrize(
+    "content",
+    ['{"k1": ', "[1]", '{"k1": 3}', '{"k1": {"documents_per_minute": "x"}}'],
+)
+def test_invalid_keys_file_names_the_file(tmp_path, content):
+    path = _keys(tmp_path, content)
+    with pytest.raises(ValueError, match="api_keys.json"):
+        Authenticator(path)
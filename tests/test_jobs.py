@@ -0,0 +1,42 @@
+# tests/test_jobs.py
+import threading
+
+from jobs import JobQueue
+
+
+def test_stop_finishes_pending_jobs():
+    queue = JobQueue(threading.Lock())
+    queue.hold("prueba")  # Nada se despacha: todos quedan en cola
+    finished = []
+    jobs = [
+        queue.submit("invoice", lambda: "ok", 1.0, on_finish=finished.append)
+        for _ in range(3)
+    ]
+    queue.stop()
+
+    assert finished == jobs
+    assert all(job.status == "cancelled" and job.done.is_set() for job in jobs)
+
+
+def test_on_finish_runs_before_done():
+    queue = JobQueue(threading.Lock())
+    seen = []
+    job = queue.submit(
+        "invoice", lambda: "ok", 1.0, on_finish=lambda j: seen.append(j.done.is_set())
+    )
+    assert job.done.wait(5)
+    queue.stop()
+
+    assert job.status == "finished"
+    assert seen == [False]
+
+
+def test_update_prediction_moves_the_backlog():
+    queue = JobQueue(threading.Lock())
+    queue.hold("prueba")
+    job = queue.submit("session", lambda: "ok", 5.0)
+    queue.update_prediction(job, 12.0)
+
+    assert queue.backlog_seconds() == 12.0
+    assert (job.estimated_finish - job.estimated_start).total_seconds() == 12.0
+    queue.stop()
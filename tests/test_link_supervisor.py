@@ -0,0 +1,56 @@
+# tests/test_link_supervisor.py
+import threading
+import time
+
+import emulator
+import link_supervisor
+from communication import FiscalPrinter
+from jobs import JobQueue
+from link_supervisor import LinkSupervisor
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "tiempo de espera agotado"
+        time.sleep(0.01)
+
+
+def test_reconnect_only_probes_ports_that_appeared_after_the_outage():
+    port = "emu://link-a"
+    device = emulator.get_emulator(
+        port, printer_baudrate=115200, serial_number="Z1F0000001"
+    )
+    printer = FiscalPrinter(port=port, baudrate=115200, timeout=0.1, autobaud=False)
+    printer.connect()
+    printer.serial_number = "Z1F0000001"
+    # Un equipo ya conectado antes de la caída y el puerto de otro worker, que
+    # aparece después: ninguno se debe abrir.
+    other = emulator.get_emulator("emu://link-other", printer_baudrate=115200)
+    reserved = emulator.get_emulator("emu://link-reserved", printer_baudrate=115200)
+    reserved.unplug()
+    link_supervisor.reserve_ports(["emu://link-reserved"])
+
+    lock = threading.Lock()
+    queue = JobQueue(lock)
+    supervisor = LinkSupervisor(printer, lock, queue, initial_delay=0.05)
+    supervisor.start()
+    try:
+        device.unplug()
+        try:
+            printer.get_status()
+        except ConnectionError:
+            pass
+        _wait_for(lambda: supervisor.attempts > 0)
+        reserved.plug()
+        device.plug("emu://link-b")  # El adaptador vuelve con otro nombre
+
+        _wait_for(lambda: not supervisor.reconnecting)
+        assert printer.device == "emu://link-b"
+        assert supervisor.last_outage["new_device"] == "emu://link-b"
+        assert not other.frames_received
+        assert not reserved.frames_received
+    finally:
+        supervisor.stop()
+        queue.stop()
+        printer.close()
@@ -0,0 +1,35 @@
+# tests/test_sales_sampler.py
+from sales_sampler import SalesRing, _FIELDS
+
+
+def _totals(value, other=0):
+    return (value,) + (other,) * (_FIELDS - 1)
+
+
+def test_z_between_samples_resets_every_delta(tmp_path):
+    ring = SalesRing(str(tmp_path / "ventas.ring"), capacity=8)
+    ring.record(1.0, _totals(1000, 500), z_number=7)
+    ring.record(2.0, _totals(1500, 500), z_number=7)
+    # Después del Z un campo quedó por encima del valor anterior: sin el número
+    # de Z se tomaría como un delta normal de 500.
+    deltas = ring.record(3.0, _totals(2000, 100), z_number=8)
+
+    assert deltas == _totals(2000, 100)
+    assert [d for _, d in ring.samples()] == [
+        _totals(0),
+        _totals(500, 0),
+        _totals(2000, 100),
+    ]
+    ring.close()
+
+
+def test_z_number_survives_reopening(tmp_path):
+    path = str(tmp_path / "ventas.ring")
+    ring = SalesRing(path, capacity=8)
+    ring.record(1.0, _totals(1000), z_number=7)
+    ring.close()
+
+    ring = SalesRing(path, capacity=8)
+    assert ring.last_z_number == 7
+    assert ring.record(2.0, _totals(1200), z_number=7) == _totals(200)
+    ring.close()
@@ -0,0 +1,172 @@
+# tests/test_transaction.py
+# Recuperación de DocumentTransaction ante fallas de línea, contra el emulador.
+from decimal import Decimal
+
+import pytest
+
+import commands
+import emulator
+from communication import FiscalPrinter
+from commands import DocumentTransaction
+
+_ITEMS = [
+    {
+        "desc": f"Producto {i}",
+        "price": Decimal("10.00"),
+        "qty": Decimal("1"),
+        "tax_rate": "Tasa General (G)",
+    }
+    for i in range(3)
+]
+
+
+@pytest.fixture
+def printer(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Contadores y archivos de la corrida
+    port = f"emu://test-{request.node.name}"
+    emulator.get_emulator(port, printer_baudrate=115200)
+    printer = FiscalPrinter(port=port, baudrate=115200, timeout=0.1, autobaud=False)
+    printer.connect()
+    yield printer
+    printer.close()
+
+
+@pytest.fixture
+def device(printer):
+    return emulator.get_emulator(printer.port)
+
+
+def _transaction():
+    # Sin encabezados: la primera trama es el primer ítem.
+    document = commands.compile_invoice({}, _ITEMS)
+    return DocumentTransaction(document, backoff=0.01)
+
+
+def _item(transaction, index):
+    """Comando del ítem 'index' del documento, para programarle una falla."""
+    items = [f for f in transaction.document.frames if f.role == "item"]
+    return items[index].command
+
+
+def _items_in_printer(printer):
+    """Cantidad de artículos (en milésimas) del documento abierto, según el S2."""
+    return commands.get_s2_status(printer).cantidad_articulos
+
+
+def _assert_printed_once(device, transaction):
+    """El documento cerró en la impresora con cada ítem una sola vez."""
+    assert transaction.state == DocumentTransaction.COMPLETED
+    assert device.last_invoice == 1
+    assert device.sales[1] == 3000  # Base de la tasa general: 3 x 10,00
+    assert device.sts1 == b"\x60"  # De vuelta en Espera
+
+
+def test_clean_invoice(printer, device):
+    transaction = _transaction()
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+    assert transaction.recoveries == 0
+
+
+@pytest.mark.parametrize("index", [0, 1, 2])
+def test_lost_ack_on_item_is_confirmed_by_s2(printer, device, index):
+    transaction = _transaction()
+    device.inject_fault("lost_ack", command=_item(transaction, index))
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+    assert transaction.recoveries == 1
+
+
+def test_lost_ack_on_close_is_confirmed_by_status(printer, device):
+    device.inject_fault("lost_ack", command="101")
+    transaction = _transaction()
+    message = transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+    assert transaction.recoveries == 1
+    assert "enviada y cerrada" in message
+
+
+@pytest.mark.parametrize("kind", ["nak", "ignore"])
+def test_item_that_did_not_land_is_resent(printer, device, kind):
+    transaction = _transaction()
+    device.inject_fault(kind, command=_item(transaction, 1))
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+    assert transaction.recoveries == 0
+
+
+def test_lost_ack_without_status_reply_is_not_resent(printer, device):
+    # Se pierde el ACK del ítem y luego la respuesta al ENQ: solo se puede
+    # reenviar después de que el S2 confirme que el ítem no llegó.
+    transaction = _transaction()
+    device.inject_fault("lost_ack", command=_item(transaction, 1))
+    device.drop_status()
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+    assert transaction.recoveries == 1
+
+
+def test_lost_ack_without_s2_reply_is_not_resent(printer, device):
+    transaction = _transaction()
+    device.inject_fault("lost_ack", command=_item(transaction, 1))
+    device.inject_fault("ignore", command="S2")
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+    assert transaction.recoveries == 1
+
+
+@pytest.mark.parametrize("kind, landed", [("lost_ack", 2000), ("ignore", 1000)])
+def test_unverified_item_is_checked_before_resuming(printer, device, kind, landed):
+    transaction = _transaction()
+    device.inject_fault(kind, command=_item(transaction, 1))
+    device.drop_status(10)  # El enlace se da por caído: el documento se suspende
+    message = transaction.run(printer)
+
+    assert transaction.state == DocumentTransaction.SUSPENDED
+    assert message.startswith("Error:")
+    assert transaction.unverified
+    assert transaction.confirmed_item_count == 1
+
+    # Vuelve el enlace (como al reconectar el supervisor) y se retoma.
+    device.clear_faults()
+    printer.replace_connection(printer.serial_connection, printer.device)
+    assert _items_in_printer(printer) == landed
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+
+
+def test_printer_error_suspends_and_resumes(printer, device):
+    device.set_error(b"\x41")  # Sin papel: rechaza el primer ítem
+    transaction = _transaction()
+    message = transaction.run(printer)
+
+    assert transaction.state == DocumentTransaction.SUSPENDED
+    assert "Sin papel" in message
+    assert transaction.confirmed_item_count == 0
+
+    device.set_error(b"\x40")
+    transaction.run(printer)
+
+    _assert_printed_once(device, transaction)
+
+
+def test_repeated_nak_voids_the_document(printer, device):
+    # La impresora rechaza el ítem en cada reenvío, pero responde al S2.
+    transaction = _transaction()
+    device.inject_fault(
+        "nak", count=commands.FRAME_RETRIES + 1, command=_item(transaction, 1)
+    )
+    message = transaction.run(printer)
+
+    assert transaction.state == DocumentTransaction.VOIDED
+    assert "anulado" in message
+    assert device.sts1 == b"\x60"
+    assert device.last_invoice == 0
+    assert device.sales[1] == 0
@@ -0,0 +1,44 @@
+# tests/test_workers.py
+from multiprocessing import shared_memory
+
+import pytest
+
+from workers import StatusBlock, _SEQUENCE
+
+
+@pytest.fixture
+def block():
+    block = StatusBlock(slots=1)
+    yield block
+    block.close()
+    block.unlink()
+
+
+def _interrupt_write(block):
+    """Deja el contador impar, como un worker que murió a mitad de escribir."""
+    memory = shared_memory.SharedMemory(name=block.name)
+    (sequence,) = _SEQUENCE.unpack_from(memory.buf, 0)
+    _SEQUENCE.pack_into(memory.buf, 0, sequence | 1)
+    memory.close()
+
+
+def test_read_gives_up_on_a_torn_block(block):
+    block.write(0, {"connected": True, "pending_documents": 3})
+    assert block.read(0)["pending_documents"] == 3
+
+    _interrupt_write(block)
+    # Sin esperar para siempre: devuelve la última lectura consistente.
+    assert block.read(0)["pending_documents"] == 3
+    reader = StatusBlock(name=block.name)  # Sin lecturas anteriores
+    assert reader.read(0) is None
+    reader.close()
+
+
+def test_write_after_a_torn_block_is_readable(block):
+    _interrupt_write(block)
+    block.write(0, {"connected": True, "pending_documents": 5})
+    assert block.read(0)["pending_documents"] == 5
+
+    _interrupt_write(block)
+    block.clear(0)
+    assert block.read(0) is None
@@ -0,0 +1,191 @@
+# tracing.py
+# Trazas livianas de extremo a extremo: petición HTTP -> cola -> comandos -> tramas.
+# Cada span terminado se escribe como una línea JSON en TRACE_FILE desde un hilo
+# aparte, para no agregar E/S de disco al camino de impresión.
+import contextvars
+import functools
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import TRACE_SAMPLE_RATE, TRACE_FILE, TRACE_QUEUE_SIZE
+
+
+class _Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "attrs")
+
+    def __init__(self, trace_id, parent_id, name, attrs):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.attrs = attrs
+
+
+class _TraceContext:
+    __slots__ = ("trace_id", "sampled", "span")
+
+    def __init__(self, trace_id, sampled, span=None):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.span = span
+
+
+_current = contextvars.ContextVar("fiscal_trace", default=None)
+
+
+# --- Escritura asíncrona ---
+
+_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_dropped = 0
+
+
+def _writer_loop():
+    while True:
+        record = _queue.get()
+        lines = [json.dumps(record, ensure_ascii=False)]
+        # Agrupamos lo que ya esté en cola en una sola escritura.
+        while len(lines) < 500:
+            try:
+                lines.append(json.dumps(_queue.get_nowait(), ensure_ascii=False))
+            except queue.Empty:
+                break
+        try:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Error al escribir trazas en {TRACE_FILE}: {e}")
+
+
+def _emit(record):
+    global _writer, _dropped
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, daemon=True)
+                _writer.start()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        _dropped += 1  # Nunca bloqueamos el camino de impresión por las trazas
+
+
+def _finish(span, error=None):
+    record = {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "start": round(span.start, 6),
+        "duration_ms": round((time.time() - span.start) * 1000, 3),
+    }
+    if span.attrs:
+        record["attrs"] = span.attrs
+    if error is not None:
+        record["error"] = repr(error)
+    _emit(record)
+
+
+# --- API pública ---
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def start_trace(name, trace_id=None, sample_rate=None, **attrs):
+    """
+    Inicia una traza (span raíz) en el contexto actual y devuelve un handle para
+    end_trace(). El trace id existe aunque la traza no se muestree, para poder
+    devolverlo siempre al cliente.
+    """
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    trace_id = trace_id or new_trace_id()
+    sampled = random.random() < rate
+    root = _Span(trace_id, None, name, attrs) if sampled else None
+    token = _current.set(_TraceContext(trace_id, sampled, root))
+    return trace_id, root, token
+
+
+def end_trace(handle, error=None):
+    _, root, token = handle
+    _current.reset(token)
+    if root is not None:
+        _finish(root, error)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Span hijo del span actual. No hace nada si no hay traza muestreada."""
+    ctx = _current.get()
+    if ctx is None or not ctx.sampled:
+        yield None
+        return
+    parent_id = ctx.span.span_id if ctx.span else None
+    child = _Span(ctx.trace_id, parent_id, name, attrs)
+    token = _current.set(_TraceContext(ctx.trace_id, True, child))
+    error = None
+    try:
+        yield child
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        _finish(child, error)
+
+
+def traced(name):
+    """Decorador: ejecuta la función dentro de un span con el nombre indicado."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_span(name, start, end, **attrs):
+    """Registra un span ya medido (ej: la espera en cola, medida en otro hilo)."""
+    ctx = _current.get()
+    if ctx is None or not ctx.sampled:
+        return
+    record = {
+        "trace_id": ctx.trace_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": ctx.span.span_id if ctx.span else None,
+        "name": name,
+        "start": round(start, 6),
+        "duration_ms": round((end - start) * 1000, 3),
+    }
+    if attrs:
+        record["attrs"] = attrs
+    _emit(record)
+
+
+def set_attribute(key, value):
+    """Agrega un atributo al span actual (si la traza está muestreada)."""
+    ctx = _current.get()
+    if ctx is not None and ctx.sampled and ctx.span is not None:
+        ctx.span.attrs[key] = value
+
+
+def current_trace_id():
+    ctx = _current.get()
+    return ctx.trace_id if ctx else None
+
+
+def dropped_spans():
+    """Spans descartados porque la cola de escritura estaba llena."""
+    return _dropped
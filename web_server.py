@@ -1,7 +1,40 @@
 # web_server.py
+import json
+import math
+import os
 import threading
-from flask import Flask, request, jsonify
+import time
+from datetime import datetime
+from decimal import Decimal
+from flask import Flask, Response, request, jsonify, g
+from werkzeug.serving import make_server
+import auth
+import catalog
 import commands
+import counters
+import document_index
+import service_model
+import sessions
+import tracing
+import z_reprint
+from admission import AdmissionController
+from config import (
+    STATUS_POLL_INTERVAL,
+    SALES_RING_DIR,
+    Z_SCHEDULE_TIME,
+    Z_REPRINT_CHUNK,
+    SHADOW_MODE,
+    SERVER_STOP_TIMEOUT,
+    SESSION_EXPECTED_ITEMS,
+)
+from jobs import JobQueue, PRIORITY_LOW
+from link_supervisor import LinkSupervisor
+from models import Z_AMOUNT_FIELDS
+from non_fiscal import NonFiscalPrint
+from sales_sampler import SalesRing, SalesSampler, ring_path
+from shadow import ShadowPrinter
+from z_archive import ZArchive
+from z_closing import ZClosing, DailySchedule
 
 # --- Variables Globales y Mecanismos de Sincronización ---
 
@@ -11,31 +44,407 @@ g_printer_instance = None
 # Un Lock para asegurar que solo una petición a la vez acceda a la impresora.
 printer_lock = threading.Lock()
 
+# Control de admisión: rechaza documentos si la impresora está en error o la cola está llena.
+admission = AdmissionController()
+
+# Evento para detener el monitor de status cuando se desconecta la impresora.
+g_poller_stop = threading.Event()
+
+# Cola de trabajos de la impresora y modelo de tiempos de servicio (por impresora).
+# Se crean en start_server().
+g_job_queue = None
+g_service_model = None
+
+# Archivo local de Reportes Z (se abre en la primera consulta) y estado de su
+# sincronización con la memoria fiscal.
+g_z_archive = None
+g_z_sync = {"running": False, "added": None, "error": None, "finished_at": None}
+g_z_sync_lock = threading.Lock()
+
+# Muestreo periódico del Reporte X para la serie de ventas intradía.
+g_sales_sampler = None
+
+# Impresora emulada para documentos de prueba (dry_run) y el modo sombra, en el
+# que ningún documento de la API llega a la impresora real.
+g_shadow_printer = None
+g_shadow_mode = False
+
+# Cierre diario (Reporte Z) con vaciado de la cola, y su programación diaria.
+g_z_closing = None
+g_z_schedule = None
+
+# Supervisor del enlace serie: reconecta la impresora sin operador.
+g_link_supervisor = None
+
 # Creamos la aplicación Flask
 api = Flask(__name__)
 
+# --- Funciones de ayuda ---
+
+
+def _json_body():
+    """
+    Lee el JSON de la petición con los montos como Decimal, para que precios y
+    cantidades lleguen exactos a la impresora (sin pasar por float). Devuelve
+    None si el cuerpo no es un objeto JSON.
+    """
+    try:
+        data = json.loads(request.get_data(cache=True) or b"null", parse_float=Decimal)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _wants_async(data):
+    """El cliente pide respuesta inmediata (202) con ?async=1 o "async": true."""
+    return request.args.get("async") in ("1", "true") or data.get("async") is True
+
+
+def _wants_dry_run(data):
+    """Documento de prueba: ?dry_run=1 o "dry_run": true."""
+    return request.args.get("dry_run") in ("1", "true") or data.get("dry_run") is True
+
+
+def _document_queue():
+    """
+    Cola por la que pasan los documentos de la API: en modo sombra, la de la
+    impresora emulada (ver shadow.py).
+    """
+    return g_shadow_printer.queue if g_shadow_mode else g_job_queue
+
+
+def _document_printer():
+    """Impresora que atiende los documentos de la API (la emulada en modo sombra)."""
+    return g_shadow_printer.printer if g_shadow_mode else g_printer_instance
+
+
+def _dry_run_response(document):
+    """
+    Transmite el documento a la impresora emulada (sin cola ni impresora real)
+    y responde con las tramas, los bytes, el tiempo de línea a la velocidad
+    configurada y la duración que predice el modelo de la impresora real. El
+    documento consume el ritmo del cliente igual que uno real.
+    """
+    rejection = _document_rate_rejection()
+    if rejection:
+        return rejection
+    report = g_shadow_printer.run(document)
+    report["predicted_seconds"] = round(
+        g_service_model.predict(document.item_count, document.header_lines), 3
+    )
+    ok = "correctamente" in report["message"]
+    return (
+        jsonify(
+            {
+                "status": "success" if ok else "error",
+                "dry_run": True,
+                "message": report.pop("message"),
+                "document": report,
+            }
+        ),
+        200 if ok else 500,
+    )
+
+
+def _job_response(job):
+    """Construye la respuesta HTTP de un trabajo ya terminado."""
+    if job.status == "finished" and "correctamente" in job.result:
+        body = {"status": "success", "message": job.result, "job": job.to_dict()}
+        if job.document:
+            body["document"] = job.document
+        return jsonify(body)
+    return (
+        jsonify({"status": "error", "message": job.result, "job": job.to_dict()}),
+        500,
+    )
+
+
+def _invalid_document(message):
+    return (
+        jsonify({"status": "error", "message": f"Documento inválido: {message}"}),
+        400,
+    )
+
+
+def _admission_rejection(predicted):
+    """Respuesta 429/503 con Retry-After si no se puede encolar el trabajo."""
+    rejection = admission.check(_document_queue().backlog_seconds(), predicted)
+    if rejection is None:
+        return None
+    status_code, retry_after, message = rejection
+    response = jsonify(
+        {"status": "error", "message": message, "retry_after": retry_after}
+    )
+    response.headers["Retry-After"] = str(retry_after)
+    return response, status_code
+
+
+def _rate_limited(message, retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify(
+        {"status": "error", "message": message, "retry_after": retry_after}
+    )
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 429
+
+
+def _document_rate_rejection():
+    """
+    429 si el cliente superó su ritmo de documentos. Se llama con el documento
+    ya validado: un documento rechazado (400) no consume el ritmo del cliente.
+    """
+    client = g.api_client
+    wait = client.allow_document()
+    if wait:
+        return _rate_limited(
+            f"Límite de {client.documents_per_minute:g} documentos por minuto "
+            f"alcanzado para '{client.name}'.",
+            wait,
+        )
+    return None
+
+
+def _queue_stopped(error):
+    """503 si la cola rechazó el trabajo porque el servidor se está deteniendo."""
+    return jsonify({"status": "error", "message": str(error)}), 503
+
+
+def _quota_rejection():
+    """429 si el cliente ya tiene su cuota de documentos en cola."""
+    client = g.api_client
+    if client.reserve_slot():
+        return None
+    return _rate_limited(
+        f"El cliente '{client.name}' ya tiene {client.max_queued} documentos en cola.",
+        STATUS_POLL_INTERVAL,
+    )
+
+
+def _submit_document(document, run_async, after=None):
+    """
+    Aplica el control de admisión, encola el documento ya compilado con su
+    duración estimada y, si el cliente no pidió modo asíncrono, espera a que
+    termine. El trabajo en cola solo transmite las tramas. after(job) se llama
+    al terminar el trabajo, antes de responder. En modo sombra el documento
+    pasa por la cola de la impresora emulada.
+    """
+    printer = _document_printer()
+    shadow = g_shadow_mode
+    model = g_service_model
+    item_count, header_lines = document.item_count, document.header_lines
+    predicted = model.predict(item_count, header_lines)
+
+    rejection = (
+        _document_rate_rejection()
+        or _admission_rejection(predicted)
+        or _quota_rejection()
+    )
+    if rejection:
+        return rejection
+    client = g.api_client
+    issued = {}
+
+    def on_closed(transaction):
+        # Número y hora llevados en memoria: sin consultas extra a la impresora.
+        issued.update(transaction.issued or {})
+
+    def on_finish(job):
+        job.document = issued or None
+        client.release_slot()
+        if after:
+            after(job)
+        # Solo los documentos completos de la impresora real alimentan el
+        # modelo de tiempos.
+        if not shadow and job.status == "finished" and "correctamente" in job.result:
+            model.observe(item_count, header_lines, job.duration)
+
+    try:
+        job = _document_queue().submit(
+            document.kind,
+            lambda: commands.transmit_document(printer, document, on_closed),
+            predicted,
+            on_finish=on_finish,
+        )
+    except RuntimeError as e:
+        client.release_slot()
+        return _queue_stopped(e)
+    if run_async:
+        return jsonify({"status": "accepted", "job": job.to_dict()}), 202
+
+    job.done.wait()
+    return _job_response(job)
+
+
+def _status_poll_loop(printer, stop_event):
+    """
+    Consulta periódicamente STS1/STS2 (ENQ) para alimentar el control de admisión.
+    Solo consulta cuando la impresora está libre, para no interrumpir documentos.
+    """
+    while not stop_event.wait(STATUS_POLL_INTERVAL):
+        if not printer_lock.acquire(blocking=False):
+            continue  # Hay un documento en curso; se consultará en la próxima vuelta
+        try:
+            sts1_byte, sts2_byte = printer.get_status()
+        except Exception as e:
+            print(f"Error en el monitor de status: {e}")
+            sts1_byte, sts2_byte = None, None
+        finally:
+            printer_lock.release()
+        admission.update_status(sts1_byte, sts2_byte)
+
+
+# --- Trazas por petición ---
+
+# Cabecera con la que se recibe (opcional) y se devuelve el identificador de traza.
+TRACE_HEADER = "X-Trace-Id"
+
+
+@api.before_request
+def _start_request_trace():
+    incoming = request.headers.get(TRACE_HEADER, "")
+    # Solo se reutiliza un id entrante razonable (ej: el de un gateway o POS).
+    trace_id = incoming if incoming.isalnum() and len(incoming) <= 64 else None
+    g.trace_handle = tracing.start_trace(
+        f"http {request.method} {request.path}", trace_id=trace_id
+    )
+
+
+@api.after_request
+def _add_trace_header(response):
+    handle = getattr(g, "trace_handle", None)
+    if handle:
+        response.headers[TRACE_HEADER] = handle[0]
+        tracing.set_attribute("status_code", response.status_code)
+    return response
+
+
+@api.teardown_request
+def _end_request_trace(error=None):
+    handle = g.pop("trace_handle", None)
+    if handle:
+        tracing.end_trace(handle, error)
+
+
+# --- Autenticación y límites por cliente (ver auth.py) ---
+
+# Endpoints que inician trabajo de impresión: consumen el ritmo de documentos
+# después de validar el documento (ver _document_rate_rejection()).
+DOCUMENT_ENDPOINTS = {
+    "create_invoice",
+    "create_credit_note",
+    "open_session",
+    "print_non_fiscal",
+    "create_z_reprint",
+    "start_z_close",
+}
+# Continuación de una sesión ya abierta (ya se contó al abrirla): sin límite de
+# ritmo, para no frenar el escaneo línea por línea.
+SESSION_ENDPOINTS = {"add_session_items", "close_session", "cancel_session"}
+
+
+@api.before_request
+def _authenticate():
+    """
+    Identifica al cliente por su clave y aplica su límite de consultas antes
+    de cualquier trabajo con la impresora. El ritmo de documentos se aplica
+    en cada endpoint, una vez validado el documento.
+    """
+    client = auth.get_authenticator().client_for(
+        request.headers.get(auth.API_KEY_HEADER)
+    )
+    if client is None:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": f"Clave de API inválida o ausente (cabecera {auth.API_KEY_HEADER}).",
+                }
+            ),
+            401,
+        )
+    g.api_client = client
+    if request.endpoint in SESSION_ENDPOINTS or request.endpoint in DOCUMENT_ENDPOINTS:
+        return None
+    wait = client.allow_status()
+    if wait:
+        return _rate_limited(
+            f"Límite de {client.status_per_second:g} consultas por segundo "
+            f"alcanzado para '{client.name}'.",
+            wait,
+        )
+    return None
+
+
+@api.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Endpoint con el uso y los rechazos por cliente, y el estado de la cola."""
+    authenticator = auth.get_authenticator()
+    queue = admission.snapshot()
+    if g_job_queue is not None:
+        documents = _document_queue()
+        queue["pending_documents"] = documents.depth()
+        queue["backlog_seconds"] = round(documents.backlog_seconds(), 3)
+    return jsonify(
+        {
+            "status": "success",
+            "auth_enabled": authenticator.enabled,
+            "clients": authenticator.usage(),
+            "queue": queue,
+        }
+    )
+
+
 # --- Definición de los Endpoints de la API ---
 
 
 @api.route("/status", methods=["GET"])
 def get_status():
-    """Endpoint para obtener el status STS1/STS2 de la impresora."""
+    """
+    Endpoint para obtener el status STS1/STS2 de la impresora. Con ?printer=0
+    no consulta la impresora (no espera al documento en curso) y solo informa
+    la cola y la admisión; así lo usa el gateway para sus chequeos de salud.
+    """
     if g_printer_instance is None:
         return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
 
-    with printer_lock:
-        status_message = commands.read_printer_status(g_printer_instance)
+    status_message = None
+    if request.args.get("printer") != "0":
+        with printer_lock:
+            status_message = commands.read_printer_status(g_printer_instance)
 
-    return jsonify({"status": "success", "data": status_message})
+    queue = admission.snapshot()
+    documents = _document_queue()
+    queue["pending_documents"] = documents.depth()
+    queue["backlog_seconds"] = round(documents.backlog_seconds(), 3)
+    pending = commands.suspended_transaction(g_printer_instance)
+    queue["suspended_document"] = (
+        {"kind": pending.document.kind, "reason": pending.reason} if pending else None
+    )
+    queue["shadow_mode"] = g_shadow_mode
+    queue["held"] = g_job_queue.held
+    return jsonify(
+        {
+            "status": "success",
+            "data": status_message,
+            "queue": queue,
+            "counters": counters.counters_for(g_printer_instance.port).snapshot(),
+            "link": g_link_supervisor.snapshot(),
+        }
+    )
 
 
 @api.route("/invoice", methods=["POST"])
 def create_invoice():
-    """Endpoint para recibir datos de una factura en formato JSON y mandarla a imprimir."""
+    """
+    Endpoint para recibir datos de una factura en formato JSON y mandarla a
+    imprimir. Cada ítem trae 'desc', 'price', 'qty' y 'tax_rate', o solo 'sku'
+    y 'qty' si el producto está en el catálogo local.
+    """
     if g_printer_instance is None:
         return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
 
-    data = request.get_json()
+    with tracing.span("json_parse"):
+        data = _json_body()
     if not data or "customer_data" not in data or "items" not in data:
         return (
             jsonify(
@@ -47,15 +456,14 @@ def create_invoice():
             400,
         )
 
-    with printer_lock:
-        result = commands.send_full_invoice(
-            g_printer_instance, data["customer_data"], data["items"]
-        )
-
-    if "correctamente" in result:
-        return jsonify({"status": "success", "message": result})
-    else:
-        return jsonify({"status": "error", "message": result}), 500
+    # Se valida y codifica aquí, fuera del lock de la impresora.
+    try:
+        document = commands.compile_invoice(data["customer_data"], data["items"])
+    except ValueError as e:
+        return _invalid_document(e)
+    if _wants_dry_run(data):
+        return _dry_run_response(document)
+    return _submit_document(document, _wants_async(data))
 
 
 @api.route("/credit_note", methods=["POST"])
@@ -64,7 +472,10 @@ def create_credit_note():
     if g_printer_instance is None:
         return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
 
-    data = request.get_json()
+    with tracing.span("json_parse"):
+        data = _json_body()
+    if data and "invoice" in data and "affected_doc" not in data:
+        return _credit_note_for_invoice(data)
     if (
         not data
         or "affected_doc" not in data
@@ -75,43 +486,970 @@ def create_credit_note():
             jsonify(
                 {
                     "status": "error",
-                    "message": "JSON inválido. Se requieren 'affected_doc', 'customer_data' y 'items'.",
+                    "message": "JSON inválido. Se requieren 'invoice', o 'affected_doc', "
+                    "'customer_data' e 'items'.",
                 }
             ),
             400,
         )
 
-    with printer_lock:
-        result = commands.send_full_credit_note(
-            g_printer_instance,
-            data["affected_doc"],
-            data["customer_data"],
-            data["items"],
+    try:
+        document = commands.compile_credit_note(
+            data["affected_doc"], data["customer_data"], data["items"]
+        )
+    except ValueError as e:
+        return _invalid_document(e)
+    if _wants_dry_run(data):
+        return _dry_run_response(document)
+    return _submit_document(document, _wants_async(data))
+
+
+def _credit_note_for_invoice(data):
+    """
+    Nota de crédito que referencia solo el número de una factura del índice
+    local ("invoice" y, si es de otra impresora, "serial"). Los ítems son
+    opcionales: sin ellos se devuelve lo que queda de la factura. Las
+    cantidades devueltas se reservan antes de encolar y se liberan si la nota
+    no llega a imprimirse.
+    """
+    serial = data.get("serial") or g_printer_instance.serial_number
+    try:
+        number = int(data["invoice"])
+    except (TypeError, ValueError):
+        return _invalid_document("'invoice' debe ser el número de la factura.")
+    index = document_index.get_index()
+    invoice = index.get(serial, number)
+    if invoice is None:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": f"La factura {number} no está en el índice local.",
+                }
+            ),
+            404,
+        )
+    try:
+        document, returns = commands.compile_credit_note_for_invoice(
+            invoice, data.get("items"), data.get("customer_data")
+        )
+    except ValueError as e:
+        return _invalid_document(e)
+    if _wants_dry_run(data):
+        return _dry_run_response(document)
+    if g_shadow_mode:
+        # La nota no se imprime: las devoluciones del índice no se tocan.
+        return _submit_document(document, _wants_async(data))
+
+    try:
+        index.claim_returns(serial, number, returns)
+    except ValueError as e:
+        return _invalid_document(e)
+
+    def after(job):
+        # Una nota suspendida se retoma más tarde: lo reservado se mantiene.
+        printed = job.status == "finished" and (
+            "correctamente" in job.result or "suspendida" in job.result
+        )
+        if not printed:
+            index.release_returns(serial, number, returns)
+
+    response = _submit_document(document, _wants_async(data), after=after)
+    if isinstance(response, tuple) and response[1] in (429, 503):
+        index.release_returns(serial, number, returns)  # No se encoló
+    return response
+
+
+@api.route("/invoices/<int:number>", methods=["GET"])
+def get_indexed_invoice(number):
+    """Endpoint para consultar una factura del índice local y lo que queda por devolver."""
+    serial = request.args.get("serial") or (
+        g_printer_instance.serial_number if g_printer_instance else None
+    )
+    invoice = document_index.get_index().get(serial, number)
+    if invoice is None:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": f"La factura {number} no está en el índice local.",
+                }
+            ),
+            404,
+        )
+    return jsonify({"status": "success", "invoice": invoice.to_dict()})
+
+
+# --- Catálogo local de productos (ver catalog.py) ---
+
+
+@api.route("/catalog", methods=["GET"])
+def get_catalog_summary():
+    """Endpoint para consultar el estado del catálogo (productos, última carga)."""
+    return jsonify({"status": "success", "catalog": catalog.get_catalog().summary()})
+
+
+@api.route("/catalog/<sku>", methods=["GET"])
+def get_catalog_product(sku):
+    """Endpoint para consultar un producto del catálogo."""
+    entry = catalog.get_catalog().get(sku)
+    if entry is None:
+        return jsonify({"status": "error", "message": "SKU no encontrado."}), 404
+    return jsonify(
+        {
+            "status": "success",
+            "product": {
+                "sku": entry.sku,
+                "desc": entry.desc,
+                "price": str(commands.cents_to_decimal(entry.price_cents)),
+                "tax_rate": entry.tax_rate,
+            },
+        }
+    )
+
+
+@api.route("/catalog/reload", methods=["POST"])
+def reload_catalog():
+    """Endpoint para recargar el catálogo sin esperar a la revisión periódica."""
+    current = catalog.get_catalog()
+    current.reload()
+    status_code = 200 if current.error is None else 422
+    return (
+        jsonify(
+            {
+                "status": "success" if current.error is None else "error",
+                "catalog": current.summary(),
+            }
+        ),
+        status_code,
+    )
+
+
+# --- Sesiones de documento por líneas (ver sessions.py) ---
+
+
+def _session_or_404(session_id):
+    session = sessions.get(session_id)
+    if session is None:
+        return None, (
+            jsonify({"status": "error", "message": "Sesión no encontrada."}),
+            404,
+        )
+    return session, None
+
+
+def _iter_item_lines():
+    """
+    Ítems del cuerpo de la petición. Con Content-Type application/x-ndjson se
+    lee un ítem JSON por línea a medida que llegan (cuerpo en streaming);
+    si no, se espera un JSON {"items": [...]}.
+    """
+    if request.mimetype == "application/x-ndjson":
+        for raw_line in request.stream:
+            if raw_line.strip():
+                yield json.loads(raw_line, parse_float=Decimal)
+        return
+    data = _json_body()
+    if not data or not isinstance(data.get("items"), list):
+        raise ValueError("JSON inválido. Se requiere 'items'.")
+    yield from data["items"]
+
+
+@api.route("/sessions", methods=["POST"])
+def open_session():
+    """
+    Endpoint para abrir un documento que se enviará línea por línea. Recibe
+    "kind" ("invoice" o "credit_note"), "customer_data" y, para notas de
+    crédito, "affected_doc". Los encabezados se envían apenas la impresora
+    toma la sesión.
+    """
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+
+    data = _json_body()
+    if not data or data.get("kind") not in commands.DOCUMENT_NAMES:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": "JSON inválido. Se requiere 'kind' ('invoice' o 'credit_note').",
+                }
+            ),
+            400,
+        )
+    try:
+        headers = commands.compile_headers(
+            data["kind"], data.get("customer_data") or {}, data.get("affected_doc")
+        )
+    except ValueError as e:
+        return _invalid_document(e)
+
+    # La sesión ocupa la impresora hasta cerrarse: se supone un documento de
+    # SESSION_EXPECTED_ITEMS ítems y se corrige a medida que llegan líneas.
+    predicted = g_service_model.predict(SESSION_EXPECTED_ITEMS, len(headers))
+    rejection = (
+        _document_rate_rejection()
+        or _admission_rejection(predicted)
+        or _quota_rejection()
+    )
+    if rejection:
+        return rejection
+
+    # En modo sombra la sesión también se transmite a la impresora emulada.
+    printer = _document_printer()
+    client = g.api_client
+    session = sessions.DocumentSession(data["kind"], headers)
+    try:
+        session.job = _document_queue().submit(
+            "session",
+            lambda: session.run(printer),
+            predicted,
+            on_finish=lambda job: client.release_slot(),
+        )
+    except RuntimeError as e:
+        client.release_slot()
+        return _queue_stopped(e)
+    sessions.register(session)
+    return jsonify({"status": "success", "session": session.to_dict()}), 201
+
+
+@api.route("/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    """Endpoint para consultar el avance de una sesión."""
+    session, error = _session_or_404(session_id)
+    if error:
+        return error
+    return jsonify({"status": "success", "session": session.to_dict()})
+
+
+@api.route("/sessions/<session_id>/items", methods=["POST"])
+def add_session_items(session_id):
+    """
+    Endpoint para agregar líneas a una sesión abierta. Cada línea se valida y se
+    pasa a la impresora en cuanto se lee, sin esperar el resto del cuerpo.
+    """
+    session, error = _session_or_404(session_id)
+    if error:
+        return error
+
+    accepted = 0
+    try:
+        for item in _iter_item_lines():
+            session.add_items(commands.compile_items(session.kind, [item]))
+            accepted += 1
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    except ValueError as e:
+        _update_session_prediction(session)
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": f"Línea {accepted + 1} inválida: {e}",
+                    "accepted": accepted,
+                    "session": session.to_dict(),
+                }
+            ),
+            400,
         )
+    _update_session_prediction(session)
+    return jsonify(
+        {"status": "success", "accepted": accepted, "session": session.to_dict()}
+    )
+
+
+def _update_session_prediction(session):
+    """Recalcula la duración estimada de la sesión con las líneas recibidas."""
+    items = max(SESSION_EXPECTED_ITEMS, session.lines_received)
+    _document_queue().update_prediction(
+        session.job,
+        g_service_model.predict(items, session.document.header_lines),
+    )
+
+
+def _finish_session(session):
+    session.job.done.wait()
+    ok = session.state in (
+        sessions.DocumentSession.CLOSED,
+        sessions.DocumentSession.CANCELLED,
+    )
+    body = {
+        "status": "success" if ok else "error",
+        "message": session.result or session.job.result,
+        "session": session.to_dict(),
+    }
+    return jsonify(body), 200 if ok else 500
 
-    if "correctamente" in result:
-        return jsonify({"status": "success", "message": result})
+
+@api.route("/sessions/<session_id>/close", methods=["POST"])
+def close_session(session_id):
+    """Endpoint para cerrar la sesión con el pago ("payment", por defecto "01")."""
+    session, error = _session_or_404(session_id)
+    if error:
+        return error
+
+    data = _json_body() or {}
+    try:
+        session.close(commands.compile_close(data.get("payment", "01")))
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    except ValueError as e:
+        return _invalid_document(e)
+    return _finish_session(session)
+
+
+@api.route("/sessions/<session_id>", methods=["DELETE"])
+def cancel_session(session_id):
+    """Endpoint para anular una sesión abierta."""
+    session, error = _session_or_404(session_id)
+    if error:
+        return error
+    try:
+        session.cancel()
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    return _finish_session(session)
+
+
+def _iter_non_fiscal_text():
+    """
+    Texto del cuerpo de la petición. Con text/plain o application/x-ndjson
+    (un texto JSON o {"text": ...} por línea) se lee a medida que llega; si
+    no, se espera un JSON {"text": "..."} o {"lines": [...]}.
+    """
+    if request.mimetype == "text/plain":
+        for raw_line in request.stream:
+            yield raw_line.decode("utf-8")
+        return
+    if request.mimetype == "application/x-ndjson":
+        for raw_line in request.stream:
+            if not raw_line.strip():
+                continue
+            value = json.loads(raw_line)
+            if isinstance(value, dict):
+                value = value.get("text")
+            if not isinstance(value, str):
+                raise ValueError('Cada línea debe ser un texto o {"text": ...}.')
+            yield value
+        return
+    data = _json_body()
+    if isinstance(data, dict) and isinstance(data.get("text"), str):
+        yield data["text"]
+    elif isinstance(data, dict) and isinstance(data.get("lines"), list):
+        yield "\n".join(str(line) for line in data["lines"])
     else:
-        return jsonify({"status": "error", "message": result}), 500
+        raise ValueError("JSON inválido. Se requiere 'text' o 'lines'.")
 
 
-# --- Función para iniciar el servidor ---
+class _NonFiscalRejected(Exception):
+    """El cliente no puede encolar la primera parte (429/503 en 'response')."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+@api.route("/non_fiscal", methods=["POST"])
+def print_non_fiscal():
+    """
+    Endpoint para imprimir textos largos no fiscales. El texto se ajusta al
+    ancho de la impresora y se imprime en documentos de NON_FISCAL_PART_LINES
+    líneas, cada uno un trabajo de baja prioridad (ver non_fiscal.py). La
+    respuesta es NDJSON: un evento por línea con el avance de la impresión.
+    """
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+
+    client = g.api_client
+    model = g_service_model
+    printer = _document_printer()
+    reserved = []  # Se cobra al encolar la primera parte, ya validada
+
+    def submit(func, line_count, on_finish):
+        if not reserved:
+            rejection = (
+                _document_rate_rejection()
+                or _admission_rejection(0.0)
+                or _quota_rejection()
+            )
+            if rejection:
+                raise _NonFiscalRejected(rejection)
+            reserved.append(True)
+        return _document_queue().submit(
+            "non_fiscal",
+            func,
+            model.predict(line_count, 0),
+            priority=PRIORITY_LOW,
+            on_finish=on_finish,
+        )
+
+    def release():
+        if reserved:
+            client.release_slot()
+
+    printing = NonFiscalPrint(printer, submit, on_finish=release)
+    try:
+        for text in _iter_non_fiscal_text():
+            printing.add_text(text)
+        if printing.line_count:
+            printing.finish()
+    except _NonFiscalRejected as e:
+        printing.abort("documento rechazado")
+        return e.response
+    except RuntimeError as e:
+        printing.abort(str(e))
+        return _queue_stopped(e)
+    except ValueError as e:
+        printing.abort(f"texto inválido ({e})")
+        message = str(e)
+        if printing.jobs:
+            message += " Las partes ya encoladas que no empezaron no se imprimirán."
+        return _invalid_document(message)
+    if not printing.line_count:
+        printing.abort("sin texto")
+        return _invalid_document("El documento no fiscal no tiene texto.")
+    return Response(
+        (json.dumps(event) + "\n" for event in printing.events()),
+        mimetype="application/x-ndjson",
+    )
+
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Endpoint para consultar el estado, la ETA y el resultado de un trabajo."""
+    if g_job_queue is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+
+    job = g_job_queue.get(job_id) or g_shadow_printer.queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado."}), 404
+    if not job.done.is_set():
+        return jsonify({"status": "pending", "job": job.to_dict()})
+    return _job_response(job)
+
+
+@api.route("/model", methods=["GET"])
+def get_service_model():
+    """Endpoint para consultar los coeficientes actuales del modelo de tiempos."""
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+
+    return jsonify(
+        {
+            "status": "success",
+            "printer": g_printer_instance.port,
+            "coefficients": g_service_model.coefficients(),
+        }
+    )
+
+
+# --- Archivo de Reportes Z (ver z_archive.py) ---
+
+
+def _z_archive():
+    global g_z_archive
+    with g_z_sync_lock:
+        if g_z_archive is None:
+            g_z_archive = ZArchive()
+        return g_z_archive
+
+
+def _run_low_priority(func, kind="z_archive"):
+    """Ejecuta func como trabajo de baja prioridad y devuelve su resultado."""
+    outcome = {}
+
+    def job_func():
+        outcome["value"] = func()
+        return "Tramo completado correctamente."
+
+    job = g_job_queue.submit(kind, job_func, 0.0, priority=PRIORITY_LOW)
+    job.done.wait()
+    if "value" not in outcome:
+        raise RuntimeError(job.result)
+    return outcome["value"]
+
+
+def _z_sync_loop(archive, printer):
+    added, error = None, None
+    try:
+        added = archive.sync(printer, run=_run_low_priority)
+    except Exception as e:
+        error = str(e)
+        print(f"Error al sincronizar el archivo de Reportes Z: {e}")
+    with g_z_sync_lock:
+        g_z_sync.update(
+            running=False,
+            added=added,
+            error=error,
+            finished_at=datetime.now().isoformat(timespec="seconds"),
+        )
+
+
+@api.route("/z_archive/sync", methods=["POST"])
+def sync_z_archive():
+    """
+    Endpoint para descargar al archivo local los Reportes Z nuevos de la memoria
+    fiscal. La descarga corre en segundo plano con baja prioridad.
+    """
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+
+    archive = _z_archive()
+    with g_z_sync_lock:
+        if not g_z_sync["running"]:
+            g_z_sync.update(running=True, added=None, error=None)
+            threading.Thread(
+                target=_z_sync_loop, args=(archive, g_printer_instance), daemon=True
+            ).start()
+        state = dict(g_z_sync)
+    return jsonify({"status": "accepted", "sync": state}), 202
+
+
+@api.route("/z_archive", methods=["GET"])
+def get_z_archive():
+    """Endpoint para consultar qué Reportes Z hay en el archivo local."""
+    archive = _z_archive()
+    with g_z_sync_lock:
+        state = dict(g_z_sync)
+    return jsonify({"status": "success", "archive": archive.summary(), "sync": state})
+
+
+@api.route("/z_archive/totals", methods=["GET"])
+def get_z_totals():
+    """
+    Endpoint para totales por tasa del archivo local. Parámetros opcionales:
+    from y to (AAAA-MM-DD) y group (day, month o year).
+    """
+    date_from, date_to = request.args.get("from"), request.args.get("to")
+    group = request.args.get("group")
+    try:
+        for value in (date_from, date_to):
+            if value is not None:
+                datetime.strptime(value, "%Y-%m-%d")
+        archive = _z_archive()
+        if group:
+            data = archive.totals_by(group, date_from, date_to)
+        else:
+            data = archive.totals(date_from, date_to)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Los montos van como texto para no perder exactitud en JSON.
+    def as_json(row):
+        return {k: str(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+
+    data = [as_json(row) for row in data] if group else as_json(data)
+    return jsonify({"status": "success", "data": data})
+
+
+# --- Reimpresión de Reportes Z por tramos (ver z_reprint.py) ---
+
+
+def start_z_reprint(start_num, end_num, chunk=None, on_finish=None, on_progress=None):
+    """
+    Inicia en segundo plano la reimpresión de un rango de Reportes Z; cada
+    tramo se encola como trabajo de baja prioridad. Lanza ValueError si el
+    rango es inválido. on_finish(reprint) se llama al terminar.
+    """
+    options = {"chunk": chunk} if chunk else {}
+    reprint = z_reprint.ZReprint(g_printer_instance, start_num, end_num, **options)
+    z_reprint.register(reprint)
+
+    def run():
+        reprint.run(
+            run=lambda func: _run_low_priority(func, "z_reprint"),
+            on_progress=on_progress,
+        )
+        if on_finish:
+            on_finish(reprint)
+
+    threading.Thread(target=run, daemon=True).start()
+    return reprint
+
+
+@api.route("/z_reprint", methods=["POST"])
+def create_z_reprint():
+    """
+    Endpoint para reimprimir un rango de Reportes Z. Recibe "start", "end" y,
+    opcionalmente, "chunk" (Reportes Z por tramo). Responde 202 de inmediato;
+    el avance se consulta con GET /z_reprint/<id>.
+    """
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
 
+    data = _json_body() or {}
+    try:
+        start_num, end_num = int(data["start"]), int(data["end"])
+        chunk = int(data["chunk"]) if data.get("chunk") is not None else None
+    except (KeyError, TypeError, ValueError):
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": "JSON inválido. Se requieren 'start' y 'end' numéricos.",
+                }
+            ),
+            400,
+        )
+    try:
+        z_reprint.validate_range(start_num, end_num, chunk or Z_REPRINT_CHUNK)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    rejection = _document_rate_rejection()
+    if rejection:
+        return rejection
+    reprint = start_z_reprint(start_num, end_num, chunk)
+    return jsonify({"status": "accepted", "reprint": reprint.to_dict()}), 202
+
+
+def _reprint_or_404(reprint_id):
+    reprint = z_reprint.get(reprint_id)
+    if reprint is None:
+        return None, (
+            jsonify({"status": "error", "message": "Reimpresión no encontrada."}),
+            404,
+        )
+    return reprint, None
 
-def start_server(printer_object, host="0.0.0.0", port=5000):
+
+@api.route("/z_reprint/<reprint_id>", methods=["GET"])
+def get_z_reprint(reprint_id):
+    """Endpoint para consultar el avance de una reimpresión."""
+    reprint, error = _reprint_or_404(reprint_id)
+    if error:
+        return error
+    return jsonify({"status": "success", "reprint": reprint.to_dict()})
+
+
+@api.route("/z_reprint/<reprint_id>", methods=["DELETE"])
+def cancel_z_reprint(reprint_id):
+    """Endpoint para cancelar una reimpresión al terminar el tramo en curso."""
+    reprint, error = _reprint_or_404(reprint_id)
+    if error:
+        return error
+    try:
+        reprint.cancel()
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    return jsonify({"status": "accepted", "reprint": reprint.to_dict()}), 202
+
+
+# --- Serie de ventas intradía (ver sales_sampler.py) ---
+
+
+@api.route("/sales/timeseries", methods=["GET"])
+def get_sales_timeseries():
     """
-    Esta función establece la instancia de la impresora y arranca el servidor Flask.
-    Se ejecuta en un hilo separado.
+    Endpoint para la curva de ventas de la impresora. Parámetros opcionales:
+    bucket (segundos por punto, 3600 por defecto) y since/until (epoch).
     """
-    global g_printer_instance
+    sampler = g_sales_sampler
+    if sampler is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+    try:
+        bucket = float(request.args.get("bucket", 3600))
+        since = request.args.get("since", type=float)
+        until = request.args.get("until", type=float)
+        if bucket <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"status": "error", "message": "Parámetros inválidos."}), 400
+
+    points = [
+        {
+            "start": datetime.fromtimestamp(start).isoformat(timespec="seconds"),
+            **{
+                name: str(Decimal(value).scaleb(-2))
+                for name, value in zip(Z_AMOUNT_FIELDS, totals)
+            },
+        }
+        for start, totals in sampler.ring.downsample(bucket, since, until)
+    ]
+    return jsonify(
+        {
+            "status": "success",
+            "printer": g_printer_instance.port,
+            "bucket_seconds": bucket,
+            "samples": len(sampler.ring),
+            "skipped_busy": sampler.skipped,
+            "points": points,
+        }
+    )
+
+
+@api.route("/reconciliation", methods=["GET"])
+def get_reconciliation():
+    """
+    Endpoint para conciliar el diario local contra los acumulados de la
+    impresora antes del Reporte Z. Montos como texto con dos decimales.
+    """
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+
+    try:
+        with printer_lock:
+            result = commands.reconcile_with_printer(g_printer_instance)
+    except (ConnectionError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 502
+
+    for bucket in result["buckets"]:
+        for key in ("printer", "journal", "difference"):
+            bucket[key] = str(commands.cents_to_decimal(bucket[key]))
+    return jsonify({"status": "success", "data": result})
+
+
+# --- Cierre diario (ver z_closing.py) ---
+
+
+def _z_closing_state():
+    return {
+        "running": g_z_closing.running,
+        "scheduled_at": Z_SCHEDULE_TIME,
+        "history": list(g_z_closing.history),
+    }
+
+
+@api.route("/z_close", methods=["POST"])
+def start_z_close():
+    """
+    Endpoint para emitir el Reporte Z: deja de admitir documentos, espera a
+    que se vacíe la cola y emite el cierre. Corre en segundo plano; el avance
+    se consulta con GET /z_close.
+    """
+    if g_printer_instance is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+    if g_z_closing.running:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": "Ya hay un cierre diario en curso.",
+                    "closing": _z_closing_state(),
+                }
+            ),
+            409,
+        )
+    rejection = _document_rate_rejection()
+    if rejection:
+        return rejection
+    g_z_closing.start("api")
+    return jsonify({"status": "accepted", "closing": _z_closing_state()}), 202
+
+
+@api.route("/z_close", methods=["GET"])
+def get_z_close():
+    """Endpoint para consultar el cierre en curso y los cierres anteriores."""
+    if g_z_closing is None:
+        return jsonify({"status": "error", "message": "Impresora no conectada."}), 503
+    return jsonify({"status": "success", "closing": _z_closing_state()})
+
+
+# --- Función para iniciar el servidor ---
+
+
+def _attach_printer(printer_object, shadow):
+    """Prepara la cola, los muestreadores y el cierre Z de una impresora conectada."""
+    global g_printer_instance, g_job_queue, g_service_model, g_sales_sampler
+    global g_z_closing, g_z_schedule, g_shadow_printer, g_shadow_mode, g_poller_stop
+    global g_link_supervisor
+    g_service_model = service_model.model_for(printer_object.port)
+    g_job_queue = JobQueue(printer_lock)
+    g_shadow_printer = ShadowPrinter(printer_object.port, printer_object.baudrate)
+    g_shadow_mode = shadow
+    if shadow:
+        print("Modo sombra: los documentos de la API no se imprimirán.")
+    document_counters = counters.counters_for(printer_object.port)
+    with printer_lock:
+        try:
+            report = commands.read_report_x(printer_object)
+            s5 = commands.read_s5(printer_object)
+        except (ConnectionError, ValueError) as e:
+            print(f"Error al leer el Reporte X y el S5 de la impresora: {e}")
+            report, s5 = None, None
+    if s5 is not None:
+        printer_object.serial_number = s5.serial_number
+    if report is not None:
+        document_counters.seed(report)
+    os.makedirs(SALES_RING_DIR, exist_ok=True)
+    queue = g_job_queue
+    g_sales_sampler = SalesSampler(
+        printer_object,
+        printer_lock,
+        lambda: queue.depth() > 0,
+        SalesRing(ring_path(printer_object.port)),
+        on_report=document_counters.verify,
+    )
+    g_sales_sampler.start()
+    g_z_closing = ZClosing(
+        printer_object, printer_lock, g_job_queue, admission, g_service_model
+    )
+    if Z_SCHEDULE_TIME:
+        g_z_schedule = DailySchedule(g_z_closing, Z_SCHEDULE_TIME)
+        g_z_schedule.start()
+    g_link_supervisor = LinkSupervisor(
+        printer_object, printer_lock, g_job_queue, on_restored=admission.update_status
+    )
+    g_link_supervisor.start()
     g_printer_instance = printer_object
-    print(f"Servidor HTTP iniciado en http://{host}:{port}. Escuchando peticiones...")
-    # '0.0.0.0' hace que el servidor sea accesible desde otras máquinas en la red.
-    api.run(host=host, port=port)
+    # Un evento nuevo por conexión: el monitor anterior puede seguir despertando.
+    g_poller_stop = threading.Event()
+    threading.Thread(
+        target=_status_poll_loop,
+        args=(printer_object, g_poller_stop),
+        daemon=True,
+    ).start()
+
+
+def _drain(deadline):
+    """
+    Espera a que la cola de la impresora se vacíe hasta 'deadline' (monotonic).
+    Las sesiones que siguen abiertas al vencer el plazo se anulan, porque sin
+    el cliente nunca llegarían a cerrarse. Devuelve True si la cola se vació.
+    """
+    queues = (g_job_queue, g_shadow_printer.queue)
+    while any(q.depth() for q in queues) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if not any(q.depth() for q in queues):
+        return True
+    cancelled = sessions.cancel_open()
+    if cancelled:
+        print(
+            f"Plazo de detención vencido: anulando {cancelled} sesión(es) abierta(s)."
+        )
+    return False
 
 
-def stop_server():
-    """Actualiza la instancia de la impresora a None cuando se desconecta."""
-    global g_printer_instance
+def _detach_printer():
+    """
+    Detiene los hilos asociados a la impresora y espera a que termine el
+    trabajo en curso (el lock de la impresora): un documento que ya empezó a
+    imprimirse nunca se interrumpe.
+    """
+    global g_printer_instance, g_sales_sampler, g_z_schedule
     g_printer_instance = None
-    print("Servidor HTTP detenido (ya no aceptará nuevas impresiones).")
+    g_poller_stop.set()
+    if g_link_supervisor is not None:
+        g_link_supervisor.stop()
+    if g_z_schedule is not None:
+        g_z_schedule.stop()
+        g_z_schedule = None
+    if g_sales_sampler is not None:
+        g_sales_sampler.stop()
+        g_sales_sampler = None
+    if g_job_queue is not None:
+        g_job_queue.stop()
+    if g_shadow_printer is not None:
+        g_shadow_printer.close()
+    with printer_lock:
+        pass
+
+
+class ServerManager:
+    """
+    Ciclo de vida del servidor HTTP: iniciar, detener y reiniciar.
+
+    El servidor corre en un hilo propio (werkzeug), de modo que start() no
+    bloquea y stop() libera el puerto HTTP: una reconexión vuelve a enlazarlo
+    sin esperas. Al detener se rechazan documentos nuevos (503), se espera a
+    los que están en cola hasta SERVER_STOP_TIMEOUT y recién entonces se
+    cierra el puerto; el puerto serie queda libre para que quien llamó lo cierre.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._settings = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self, printer_object, host="0.0.0.0", port=5000, shadow=SHADOW_MODE):
+        """
+        Establece la instancia de la impresora y arranca el servidor en un hilo.
+        Con shadow=True ningún documento de la API se imprime: todos se
+        atienden con la impresora emulada (ver shadow.py). Lanza ValueError
+        si el archivo de claves de la API no es válido.
+        """
+        with self._lock:
+            if self._server is not None:
+                raise RuntimeError("El servidor HTTP ya está iniciado.")
+            auth.get_authenticator()  # Un archivo de claves inválido no inicia la API
+            _attach_printer(printer_object, shadow)
+            try:
+                # '0.0.0.0' hace que el servidor sea accesible desde otras máquinas.
+                server = make_server(host, port, api, threaded=True)
+            except (OSError, SystemExit) as e:
+                _detach_printer()
+                raise OSError(f"No se pudo abrir el puerto HTTP {port}: {e}") from e
+            self._server = server
+            self._settings = (printer_object, host, port, shadow)
+            self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+            self._thread.start()
+        print(
+            f"Servidor HTTP iniciado en http://{host}:{port}. Escuchando peticiones..."
+        )
+
+    def wait(self):
+        """Bloquea hasta que el servidor se detenga."""
+        thread = self._thread
+        while thread is not None and thread.is_alive():
+            thread.join(0.5)
+
+    def stop(self, timeout=SERVER_STOP_TIMEOUT):
+        """
+        Detiene el servidor con drenaje: rechaza documentos nuevos, espera a
+        los que están en cola hasta 'timeout' segundos y cierra el puerto HTTP.
+        Devuelve True si todos los documentos terminaron dentro del plazo.
+        """
+        with self._lock:
+            if self._server is None:
+                return True
+            print("Deteniendo el servidor HTTP: esperando los documentos en curso...")
+            # Pausa propia: un cierre Z que termine mientras tanto no la quita.
+            admission.pause("server_stop", "El servidor se está deteniendo.")
+            try:
+                drained = _drain(time.monotonic() + timeout)
+                self._server.shutdown()
+                self._server.server_close()
+                _detach_printer()
+            finally:
+                self._server = None
+                admission.resume("server_stop")
+        print(
+            "Servidor HTTP detenido."
+            if drained
+            else "Servidor HTTP detenido: algunos documentos no terminaron en el plazo."
+        )
+        return drained
+
+    def restart(self, printer_object=None, timeout=SERVER_STOP_TIMEOUT, **settings):
+        """
+        Detiene y vuelve a iniciar el servidor, con la misma configuración salvo
+        lo indicado (otra impresora, host, port o shadow).
+        """
+        if self._settings is None:
+            raise RuntimeError("El servidor HTTP nunca se inició.")
+        previous_printer, host, port, shadow = self._settings
+        self.stop(timeout)
+        self.start(
+            printer_object or previous_printer,
+            host=settings.get("host", host),
+            port=settings.get("port", port),
+            shadow=settings.get("shadow", shadow),
+        )
+
+
+server_manager = ServerManager()
+
+
+def start_server(printer_object, host="0.0.0.0", port=5000, shadow=SHADOW_MODE):
+    """Arranca el servidor y bloquea hasta que se detenga (modo nodo)."""
+    server_manager.start(printer_object, host=host, port=port, shadow=shadow)
+    server_manager.wait()
+
+
+def stop_server(timeout=SERVER_STOP_TIMEOUT):
+    """Detiene el servidor esperando los documentos en curso (ver ServerManager)."""
+    return server_manager.stop(timeout)
@@ -0,0 +1,426 @@
+# workers.py
+import multiprocessing
+import os
+import signal
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import commands
+import counters
+from config import (
+    SHADOW_MODE,
+    SERVER_STOP_TIMEOUT,
+    WORKER_BASE_PORT,
+    WORKER_STATUS_INTERVAL,
+    WORKER_HEARTBEAT_TIMEOUT,
+    WORKER_IO_TIMEOUT,
+    WORKER_RESTART_INITIAL,
+    WORKER_RESTART_MAX,
+)
+
+# Bloque de status de cada worker en la memoria compartida. La secuencia va
+# aparte: impar mientras el worker escribe (ver StatusBlock.read()).
+_MESSAGE_SIZE = 96
+_SEQUENCE = struct.Struct("<Q")
+_STATUS = struct.Struct(
+    "<d"  # Última publicación (time.time())
+    "i"  # PID del worker
+    "????"  # Impresora conectada, admitiendo, enlace sano, cola retenida
+    "cc"  # Último STS1 y STS2 (\x00 si no se leyó)
+    "id"  # Documentos pendientes y segundos de trabajo en cola
+    "d"  # Segundos sin avanzar de la operación serie en curso (0: ninguna)
+    "qqq"  # Última factura, nota de crédito y documento no fiscal (-1: no se sabe)
+    "i"  # Correcciones de los contadores con el Reporte X
+    f"{_MESSAGE_SIZE}s"  # Mensaje: error de la impresora, pausa o caída del enlace
+)
+_SLOT_SIZE = _SEQUENCE.size + _STATUS.size
+# Lecturas seguidas de un bloque en escritura antes de rendirse (ver read()).
+_READ_RETRIES = 100
+_COUNTER_KINDS = ("invoice", "credit_note", "non_fiscal")
+
+
+class StatusBlock:
+    """
+    Memoria compartida con un bloque de status por impresora.
+
+    Cada worker escribe solo su bloque y el proceso de la API lo lee sin
+    consultarlo (ni por HTTP ni por la impresora). La escritura usa un
+    contador de secuencia: el lector repite la lectura si el contador era
+    impar (escritura en curso) o cambió mientras leía. Un worker que muere a
+    mitad de una escritura deja el contador impar: el lector se rinde tras
+    _READ_RETRIES intentos y la próxima escritura lo vuelve a dejar par.
+    """
+
+    def __init__(self, name=None, slots=0):
+        if name is None:
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=max(1, slots) * _SLOT_SIZE
+            )
+            self._memory.buf[:] = bytes(self._memory.size)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.name = self._memory.name
+        self._last = {}  # Última lectura consistente de cada bloque
+
+    def _offset(self, slot):
+        return slot * _SLOT_SIZE
+
+    def _publish(self, slot, payload):
+        # El contador queda impar durante la copia y par al terminar, sin
+        # importar en qué estado lo dejó una escritura anterior interrumpida.
+        offset = self._offset(slot)
+        buf = self._memory.buf
+        (sequence,) = _SEQUENCE.unpack_from(buf, offset)
+        writing = sequence | 1
+        _SEQUENCE.pack_into(buf, offset, writing)
+        buf[offset + _SEQUENCE.size : offset + _SLOT_SIZE] = payload
+        _SEQUENCE.pack_into(buf, offset, writing + 1)
+
+    def write(self, slot, status):
+        last = status.get("last", {})
+        payload = _STATUS.pack(
+            time.time(),
+            os.getpid(),
+            status.get("connected", False),
+            status.get("accepting", False),
+            status.get("link_up", False),
+            status.get("held", False),
+            status.get("sts1") or b"\x00",
+            status.get("sts2") or b"\x00",
+            status.get("pending_documents", 0),
+            status.get("backlog_seconds", 0.0),
+            status.get("io_stalled_seconds", 0.0),
+            *(-1 if last.get(kind) is None else last[kind] for kind in _COUNTER_KINDS),
+            status.get("corrections", 0),
+            (status.get("message") or "").encode("utf-8")[:_MESSAGE_SIZE],
+        )
+        self._publish(slot, payload)
+
+    def clear(self, slot):
+        """Borra el bloque (worker caído): se lee como None hasta que publique."""
+        self._last.pop(slot, None)
+        self._publish(slot, bytes(_STATUS.size))
+
+    def read(self, slot):
+        """
+        Status publicado por el worker, o None si no publicó desde que arrancó.
+        Si el bloque sigue en escritura tras _READ_RETRIES intentos, devuelve la
+        última lectura consistente (su age_seconds sigue creciendo) o None.
+        """
+        offset = self._offset(slot)
+        buf = self._memory.buf
+        for _ in range(_READ_RETRIES):
+            (before,) = _SEQUENCE.unpack_from(buf, offset)
+            values = _STATUS.unpack_from(buf, offset + _SEQUENCE.size)
+            (after,) = _SEQUENCE.unpack_from(buf, offset)
+            if before == after and not before % 2:
+                self._last[slot] = values
+                break
+            time.sleep(0)
+        else:
+            values = self._last.get(slot)
+            if values is None:
+                return None
+        heartbeat, pid, connected, accepting, link_up, held, sts1, sts2 = values[:8]
+        pending, backlog, io_stalled = values[8:11]
+        last = values[11:14]
+        corrections, message = values[14:]
+        if not pid:
+            return None
+
+        def describe(table, byte):
+            if byte == b"\x00":
+                return None
+            return table.get(byte, f"Desconocido ({byte.hex()})")
+
+        return {
+            "pid": pid,
+            "age_seconds": round(time.time() - heartbeat, 3),
+            "connected": connected,
+            "accepting": accepting,
+            "link_up": link_up,
+            "held": held,
+            "sts1": describe(commands.STS1_MAP, sts1),
+            "sts2": describe(commands.STS2_MAP, sts2),
+            "pending_documents": pending,
+            "backlog_seconds": round(backlog, 3),
+            "io_stalled_seconds": round(io_stalled, 3),
+            "counters": {
+                kind: (None if number < 0 else number)
+                for kind, number in zip(_COUNTER_KINDS, last)
+            },
+            "corrections": corrections,
+            "message": message.rstrip(b"\x00").decode("utf-8", errors="ignore") or None,
+        }
+
+    def close(self):
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+# --- Proceso de cada impresora ---
+
+
+def _collect_status(web_server):
+    """Status del nodo de este proceso para la memoria compartida."""
+    printer = web_server.g_printer_instance
+    if printer is None:
+        return {"connected": False}
+    queue = web_server.g_job_queue
+    admission = web_server.admission.snapshot()
+    sts1, sts2 = web_server.admission.last_status
+    snapshot = counters.counters_for(printer.port).snapshot()
+    return {
+        "connected": True,
+        "accepting": admission["accepting"],
+        "link_up": not printer.link_lost.is_set(),
+        "held": queue.held is not None,
+        "sts1": sts1,
+        "sts2": sts2,
+        "pending_documents": queue.depth(),
+        "backlog_seconds": queue.backlog_seconds(),
+        "io_stalled_seconds": printer.io_stalled_seconds(),
+        "last": snapshot["last"],
+        "corrections": snapshot["corrections"],
+        "message": printer.link_error
+        or admission["printer_error"]
+        or admission["paused"],
+    }
+
+
+def _publish_loop(block, slot, web_server):
+    while True:
+        try:
+            block.write(slot, _collect_status(web_server))
+        except Exception as e:
+            print(f"Error al publicar el status del worker: {e}")
+        time.sleep(WORKER_STATUS_INTERVAL)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(0)
+
+
+def run_worker(port, http_port, block_name, slot, shadow, stop, other_ports=()):
+    """
+    Proceso de una impresora: conecta 'port' y atiende su API en 127.0.0.1
+    (el canal de trabajos con el proceso de la API), publicando su status
+    en la memoria compartida. Se detiene con drenaje cuando el proceso de la
+    API activa 'stop' (un multiprocessing.Event: en Windows terminate() no
+    da al worker la oportunidad de terminar sus documentos) o cuando ese
+    proceso ya no existe. SIGTERM y Ctrl+C también drenan. Al reconectar, el
+    supervisor del enlace no prueba 'other_ports' (los de los demás workers).
+    """
+    import link_supervisor
+    import web_server
+    from communication import FiscalPrinter
+
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    link_supervisor.reserve_ports(other_ports)
+    block = StatusBlock(name=block_name)
+    threading.Thread(
+        target=_publish_loop, args=(block, slot, web_server), daemon=True
+    ).start()
+    parent = multiprocessing.parent_process()
+    printer = FiscalPrinter(port=port)
+    printer.connect()
+    try:
+        web_server.server_manager.start(
+            printer, host="127.0.0.1", port=http_port, shadow=shadow
+        )
+        while not stop.wait(WORKER_STATUS_INTERVAL):
+            if parent is not None and not parent.is_alive():
+                # Sin el proceso de la API nadie reparte documentos: se libera
+                # el puerto serie para el próximo arranque.
+                break
+    finally:
+        web_server.stop_server()
+        printer.close()
+
+
+# --- Proceso de la API ---
+
+
+class Worker:
+    """Un proceso de impresora y su historial de reinicios."""
+
+    def __init__(self, slot, port, http_port):
+        self.slot = slot
+        self.port = port
+        self.http_port = http_port
+        self.process = None
+        self.restarts = 0
+        self.last_exit_code = None
+        self.restart_delay = WORKER_RESTART_INITIAL
+        self.restart_at = None  # Hora (monotonic) del próximo reinicio, si terminó
+        self.started_at = None
+        self.stop = None  # multiprocessing.Event que pide al proceso detenerse
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.http_port}"
+
+
+class WorkerPool:
+    """
+    Un proceso por impresora, con su status en memoria compartida.
+
+    Cada impresora corre en su propio proceso (run_worker): su puerto serie,
+    su cola y sus hilos no compiten por el GIL con los de las demás ni con el
+    proceso de la API, y una llamada al driver serie que se cuelga solo
+    detiene a esa impresora. Los documentos llegan al worker por su API en
+    127.0.0.1 (ver start_workers()). Un worker que termina se reinicia con
+    esperas crecientes desde WORKER_RESTART_INITIAL hasta WORKER_RESTART_MAX
+    segundos. Un worker se da por colgado, se mata y se reinicia si deja de
+    publicar su status por WORKER_HEARTBEAT_TIMEOUT segundos o si una
+    operación con su puerto serie no avanza en WORKER_IO_TIMEOUT segundos
+    (una llamada al driver colgada libera el GIL: el status se sigue
+    publicando, pero la impresora ya no responde).
+    """
+
+    def __init__(self, ports, base_port=WORKER_BASE_PORT, shadow=SHADOW_MODE):
+        if not ports:
+            raise ValueError("Se necesita al menos un puerto de impresora.")
+        self.shadow = shadow
+        self.block = StatusBlock(slots=len(ports))
+        self.workers = [
+            Worker(slot, port, base_port + slot) for slot, port in enumerate(ports)
+        ]
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = threading.Event()
+
+    @property
+    def urls(self):
+        return [worker.url for worker in self.workers]
+
+    def start(self):
+        for worker in self.workers:
+            self._spawn(worker)
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _spawn(self, worker):
+        self.block.clear(worker.slot)
+        worker.stop = self._context.Event()
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(
+                worker.port,
+                worker.http_port,
+                self.block.name,
+                worker.slot,
+                self.shadow,
+                worker.stop,
+                [w.port for w in self.workers if w is not worker],
+            ),
+            name=f"impresora-{worker.slot}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        print(
+            f"Worker de {worker.port} iniciado (PID {worker.process.pid}, {worker.url})."
+        )
+
+    def _monitor(self):
+        while not self._stop.wait(WORKER_STATUS_INTERVAL):
+            for worker in self.workers:
+                self._check(worker)
+
+    def _check(self, worker):
+        now = time.monotonic()
+        if worker.process.is_alive():
+            status = self.block.read(worker.slot)
+            if status is not None and status["connected"]:
+                worker.restart_delay = WORKER_RESTART_INITIAL
+            stale = (
+                status["age_seconds"] if status is not None else now - worker.started_at
+            )
+            if stale > WORKER_HEARTBEAT_TIMEOUT:
+                reason = f"no publica su status hace {stale:.0f} s"
+            elif (
+                status is not None and status["io_stalled_seconds"] > WORKER_IO_TIMEOUT
+            ):
+                reason = (
+                    f"su puerto serie no responde hace "
+                    f"{status['io_stalled_seconds']:.0f} s"
+                )
+            else:
+                return
+            print(f"El worker de {worker.port} {reason}: se reinicia.")
+            worker.process.kill()
+            worker.process.join(1)
+            return
+
+        if worker.restart_at is None:
+            worker.last_exit_code = worker.process.exitcode
+            self.block.clear(worker.slot)
+            worker.restart_at = now + worker.restart_delay
+            print(
+                f"El worker de {worker.port} terminó (código "
+                f"{worker.last_exit_code}); se reinicia en {worker.restart_delay:.0f} s."
+            )
+            worker.restart_delay = min(worker.restart_delay * 2, WORKER_RESTART_MAX)
+        elif now >= worker.restart_at and not self._stop.is_set():
+            worker.restarts += 1
+            self._spawn(worker)
+
+    def status(self, slot):
+        """Status del worker leído de la memoria compartida, con sus reinicios."""
+        worker = self.workers[slot]
+        status = self.block.read(slot) or {"connected": False, "message": None}
+        status.update(
+            {
+                "port": worker.port,
+                "restarts": worker.restarts,
+                "last_exit_code": worker.last_exit_code,
+            }
+        )
+        return status
+
+    def status_readers(self):
+        """{URL del worker: función que lee su status}, para el gateway."""
+        return {
+            worker.url: (lambda slot=worker.slot: self.status(slot))
+            for worker in self.workers
+        }
+
+    def stop(self, timeout=SERVER_STOP_TIMEOUT):
+        """Detiene los workers (cada uno espera sus documentos) y libera la memoria."""
+        self._stop.set()
+        for worker in self.workers:
+            worker.stop.set()
+        for worker in self.workers:
+            worker.process.join(timeout + 5)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self.block.close()
+        self.block.unlink()
+
+
+def start_workers(ports, host="0.0.0.0", port=5000, shadow=SHADOW_MODE):
+    """
+    Arranca un worker por impresora y, delante, el gateway que les reparte
+    los documentos leyendo su status de la memoria compartida (bloquea).
+    """
+    import gateway
+
+    # Con SIGTERM (ej: al detener el servicio) también se detienen los
+    # workers y se libera la memoria compartida.
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    pool = WorkerPool(ports, shadow=shadow)
+    pool.start()
+    try:
+        gateway.start_gateway(
+            pool.urls,
+            host=host,
+            port=port,
+            status_readers=pool.status_readers(),
+            health_interval=WORKER_STATUS_INTERVAL,
+        )
+    finally:
+        pool.stop()
@@ -0,0 +1,199 @@
+# z_archive.py
+import bisect
+import sqlite3
+import threading
+from array import array
+from decimal import Decimal
+
+import commands
+from config import Z_ARCHIVE_FILE, Z_ARCHIVE_CHUNK
+from models import Z_AMOUNT_FIELDS
+
+# Agrupaciones soportadas por totals_by(): cantidad de dígitos de la clave
+# AAAAMMDD que se conservan (mes: AAAAMM, año: AAAA).
+_GROUP_DIVISORS = {"day": 1, "month": 100, "year": 10000}
+
+
+def _date_key(iso_date):
+    """'2024-03-15' -> 20240315 (entero ordenable)."""
+    return int(iso_date.replace("-", ""))
+
+
+def _format_key(key, group):
+    text = str(key)
+    if group == "year":
+        return text
+    if group == "month":
+        return f"{text[:4]}-{text[4:6]}"
+    return f"{text[:4]}-{text[4:6]}-{text[6:8]}"
+
+
+class ZArchive:
+    """
+    Archivo local de los Reportes Z descargados de la memoria fiscal.
+
+    Los registros se guardan en SQLite (un Z por fila, montos en céntimos) y
+    se mantienen además en memoria como columnas array('q') ordenadas por
+    fecha, de modo que los totales por tasa, rango de fechas o mes se calculan
+    con búsquedas binarias y sumas sobre cortes de arreglos, sin recorrer
+    filas en Python ni consultar la impresora.
+    """
+
+    def __init__(self, path=Z_ARCHIVE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        amount_columns = ", ".join(
+            f"{name} INTEGER NOT NULL" for name in Z_AMOUNT_FIELDS
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS z_reports ("
+            "numero INTEGER PRIMARY KEY, fecha TEXT NOT NULL, hora TEXT NOT NULL, "
+            "numero_ultima_factura INTEGER NOT NULL, numero_ultima_nc INTEGER NOT NULL, "
+            f"{amount_columns})"
+        )
+        self._db.commit()
+        self._load_columns()
+
+    # --- Columnas en memoria ---
+
+    def _load_columns(self):
+        self._numbers = array("q")
+        self._dates = array("q")
+        self._columns = {name: array("q") for name in Z_AMOUNT_FIELDS}
+        rows = self._db.execute(
+            f"SELECT numero, fecha, {', '.join(Z_AMOUNT_FIELDS)} "
+            "FROM z_reports ORDER BY fecha, numero"
+        )
+        for row in rows:
+            self._append_row(row[0], row[1], row[2:])
+
+    def _append_row(self, number, iso_date, amounts):
+        self._numbers.append(number)
+        self._dates.append(_date_key(iso_date))
+        for name, amount in zip(Z_AMOUNT_FIELDS, amounts):
+            self._columns[name].append(amount)
+
+    # --- Escritura ---
+
+    def last_number(self):
+        """Número del último Z archivado (0 si el archivo está vacío)."""
+        with self._lock:
+            row = self._db.execute("SELECT MAX(numero) FROM z_reports").fetchone()
+        return row[0] or 0
+
+    def store(self, records):
+        """Guarda registros ZRecord. Los que ya estaban archivados se ignoran."""
+        placeholders = ", ".join("?" * (5 + len(Z_AMOUNT_FIELDS)))
+        with self._lock:
+            before = self._db.total_changes
+            with self._db:
+                self._db.executemany(
+                    f"INSERT OR IGNORE INTO z_reports VALUES ({placeholders})",
+                    [
+                        (
+                            r.numero,
+                            r.fecha,
+                            r.hora,
+                            r.numero_ultima_factura,
+                            r.numero_ultima_nc,
+                            *r.montos,
+                        )
+                        for r in records
+                    ],
+                )
+            added = self._db.total_changes - before
+            if added:
+                # Lo normal es que los Z nuevos sean posteriores a los archivados;
+                # si no, se reconstruyen las columnas para mantener el orden.
+                new = sorted(records, key=lambda r: (r.fecha, r.numero))
+                known = set(self._numbers)
+                if self._dates and _date_key(new[0].fecha) < self._dates[-1]:
+                    self._load_columns()
+                else:
+                    for r in new:
+                        if r.numero not in known:
+                            self._append_row(r.numero, r.fecha, r.montos)
+        return added
+
+    def sync(self, printer, run=lambda func: func()):
+        """
+        Descarga de la impresora solo los Reportes Z que aún no están archivados,
+        en tramos de Z_ARCHIVE_CHUNK. run(func) ejecuta func con la impresora
+        tomada; la web lo usa para encolar cada tramo como trabajo de baja
+        prioridad, de modo que los documentos se atienden entre tramos.
+        Devuelve la cantidad de Reportes Z agregados.
+        """
+        last_z = run(lambda: commands.get_last_z_number(printer))
+        added = 0
+        start = self.last_number() + 1
+        while start <= last_z:
+            end = min(start + Z_ARCHIVE_CHUNK - 1, last_z)
+            records = run(
+                lambda start=start, end=end: commands.get_z_records(printer, start, end)
+            )
+            added += self.store(records)
+            print(f"Archivo Z: descargados los Reportes Z {start} a {end}.")
+            start = end + 1
+        return added
+
+    # --- Consultas ---
+
+    def _range(self, date_from=None, date_to=None):
+        lo = (
+            0
+            if date_from is None
+            else bisect.bisect_left(self._dates, _date_key(date_from))
+        )
+        hi = (
+            len(self._dates)
+            if date_to is None
+            else bisect.bisect_right(self._dates, _date_key(date_to))
+        )
+        return lo, hi
+
+    def _sum_slice(self, lo, hi):
+        return {
+            name: Decimal(sum(column[lo:hi])).scaleb(-2)
+            for name, column in self._columns.items()
+        }
+
+    def totals(self, date_from=None, date_to=None):
+        """Totales por tasa (Decimal) de los Z entre las fechas 'AAAA-MM-DD' dadas."""
+        with self._lock:
+            lo, hi = self._range(date_from, date_to)
+            result = self._sum_slice(lo, hi)
+            result["reportes_z"] = hi - lo
+        return result
+
+    def totals_by(self, group="month", date_from=None, date_to=None):
+        """Totales por día, mes o año dentro del rango de fechas dado."""
+        divisor = _GROUP_DIVISORS.get(group)
+        if divisor is None:
+            raise ValueError(f"Agrupación desconocida '{group}'.")
+        results = []
+        with self._lock:
+            lo, hi = self._range(date_from, date_to)
+            while lo < hi:
+                key = self._dates[lo] // divisor
+                # Primer índice del grupo siguiente (las fechas están ordenadas).
+                end = min(bisect.bisect_left(self._dates, (key + 1) * divisor, lo), hi)
+                row = {"periodo": _format_key(key, group), "reportes_z": end - lo}
+                row.update(self._sum_slice(lo, end))
+                results.append(row)
+                lo = end
+        return results
+
+    def summary(self):
+        with self._lock:
+            return {
+                "reportes_z": len(self._numbers),
+                "primer_z": min(self._numbers) if self._numbers else None,
+                "ultimo_z": max(self._numbers) if self._numbers else None,
+                "desde": _format_key(self._dates[0], "day") if self._dates else None,
+                "hasta": _format_key(self._dates[-1], "day") if self._dates else None,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,131 @@
+# z_closing.py
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import commands
+import tracing
+from config import Z_DRAIN_TIMEOUT, Z_IDLE_TIMEOUT, Z_SCHEDULE_TIME
+
+
+class ZClosing:
+    """
+    Cierre diario ordenado de una impresora:
+
+    1. Suspende la admisión de documentos nuevos en la API.
+    2. Espera a que la cola de trabajos se vacíe (documentos y sesiones en curso).
+    3. Con la impresora tomada, espera a que el ENQ indique Espera.
+    4. Envía I0Z y consulta STS1 hasta que la impresora vuelve a Espera.
+    5. Reanuda la admisión, aunque el cierre haya fallado.
+
+    La duración del Reporte Z (desde I0Z hasta volver a Espera) alimenta el
+    modelo de tiempos de servicio y queda en el historial de cierres.
+    """
+
+    def __init__(
+        self,
+        printer,
+        lock,
+        job_queue,
+        admission,
+        model,
+        drain_timeout=Z_DRAIN_TIMEOUT,
+        idle_timeout=Z_IDLE_TIMEOUT,
+    ):
+        self.printer = printer
+        self.lock = lock
+        self.job_queue = job_queue
+        self.admission = admission
+        self.model = model
+        self.drain_timeout = drain_timeout
+        self.idle_timeout = idle_timeout
+        self.history = deque(maxlen=100)  # Un dict por cierre, el último al final
+        self._running = threading.Lock()
+
+    @property
+    def running(self):
+        return self._running.locked()
+
+    def run(self, trigger="manual"):
+        """
+        Ejecuta el cierre completo y devuelve el mensaje resultante. 'trigger'
+        indica quién lo pidió (gui, api o schedule) para el historial.
+        """
+        if not self._running.acquire(blocking=False):
+            return "Error: ya hay un cierre diario (Reporte Z) en curso."
+        record = {
+            "trigger": trigger,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "drain_seconds": None,
+            "z_report_seconds": None,
+            "result": None,
+        }
+        try:
+            with tracing.span("z_close", trigger=trigger):
+                record["result"] = self._close(record)
+        finally:
+            self.admission.resume("z_closing")
+            self.history.append(record)
+            self._running.release()
+        print(record["result"])
+        return record["result"]
+
+    def _close(self, record):
+        self.admission.pause("z_closing", "Cierre diario (Reporte Z) en curso.")
+
+        start = time.monotonic()
+        deadline = start + self.drain_timeout
+        while self.job_queue.depth() > 0:
+            if time.monotonic() >= deadline:
+                return (
+                    f"Error: la cola no se vació en {self.drain_timeout:.0f} s "
+                    f"({self.job_queue.depth()} trabajos pendientes). Reporte Z no emitido."
+                )
+            time.sleep(0.2)
+        record["drain_seconds"] = round(time.monotonic() - start, 3)
+
+        with self.lock:
+            if self.printer.await_completion(self.idle_timeout) is None:
+                return "Error: la impresora no quedó en Espera. Reporte Z no emitido."
+
+            start = time.monotonic()
+            result = commands.print_z_report(self.printer, self.idle_timeout)
+            duration = time.monotonic() - start
+        if "completado" not in result:
+            return result
+
+        record["z_report_seconds"] = round(duration, 3)
+        self.model.observe_z(duration)
+        return result
+
+    def start(self, trigger="manual"):
+        """Ejecuta run() en un hilo aparte y devuelve el hilo."""
+        thread = threading.Thread(target=self.run, args=(trigger,), daemon=True)
+        thread.start()
+        return thread
+
+
+class DailySchedule:
+    """Dispara el cierre diario todos los días a la hora 'HH:MM' indicada."""
+
+    def __init__(self, closing, at=Z_SCHEDULE_TIME):
+        self.closing = closing
+        self.at = datetime.strptime(at, "%H:%M").time()
+        self._stop = threading.Event()
+
+    def next_run(self, now=None):
+        now = now or datetime.now()
+        candidate = datetime.combine(now.date(), self.at)
+        return candidate if candidate > now else candidate + timedelta(days=1)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        print(f"Cierre diario programado a las {self.at:%H:%M}.")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait((self.next_run() - datetime.now()).total_seconds()):
+            self.closing.run("schedule")
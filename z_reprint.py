@@ -0,0 +1,153 @@
+# z_reprint.py
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import commands
+from config import Z_REPRINT_CHUNK, JOB_HISTORY_SIZE
+
+
+def validate_range(start_num, end_num, chunk=Z_REPRINT_CHUNK):
+    """Lanza ValueError si el rango o el tamaño del tramo no son válidos."""
+    if start_num <= 0 or end_num < start_num:
+        raise ValueError(
+            "Los números deben ser positivos y el inicial no puede ser mayor que el final."
+        )
+    if chunk <= 0:
+        raise ValueError("El tamaño del tramo debe ser positivo.")
+
+
+class ZReprint:
+    """
+    Reimpresión de un rango de Reportes Z en tramos de Z_REPRINT_CHUNK.
+
+    Cada tramo es un comando RZ que se espera hasta que la impresora vuelve a
+    Espera. Entre tramos la impresora queda libre, de modo que los documentos
+    de venta se atienden sin esperar a todo el rango. cancel() detiene la
+    reimpresión al terminar el tramo en curso (un RZ ya aceptado no se puede
+    interrumpir).
+    """
+
+    RUNNING = "running"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    def __init__(self, printer, start_num, end_num, chunk=Z_REPRINT_CHUNK):
+        validate_range(start_num, end_num, chunk)
+        self.id = uuid.uuid4().hex[:12]
+        self.printer = printer
+        self.start_num = start_num
+        self.end_num = end_num
+        self.chunk = chunk
+        self.state = self.RUNNING
+        self.printed_through = start_num - 1  # Último Z ya reimpreso
+        self.result = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    @property
+    def total(self):
+        return self.end_num - self.start_num + 1
+
+    @property
+    def printed(self):
+        return self.printed_through - self.start_num + 1
+
+    def cancel(self):
+        """Pide detener la reimpresión después del tramo en curso."""
+        if self.state != self.RUNNING:
+            raise RuntimeError(f"La reimpresión {self.id} ya terminó ({self.state}).")
+        self._cancel.set()
+
+    def run(self, run=lambda func: func(), on_progress=None):
+        """
+        Reimprime el rango tramo por tramo. run(func) ejecuta func con la
+        impresora tomada; la web lo usa para encolar cada tramo como trabajo
+        de baja prioridad. on_progress(reprint) se llama después de cada tramo.
+        Devuelve el mensaje final.
+        """
+        start = self.start_num
+        while start <= self.end_num:
+            if self._cancel.is_set():
+                return self._finish(
+                    self.CANCELLED,
+                    f"Reimpresión cancelada: se reimprimieron {self.printed} de "
+                    f"{self.total} Reportes Z.",
+                )
+            end = min(start + self.chunk - 1, self.end_num)
+            try:
+                result = run(
+                    lambda start=start, end=end: commands.reprint_z_by_number(
+                        self.printer, start, end
+                    )
+                )
+            except RuntimeError as e:  # El trabajo no se ejecutó (cola detenida)
+                result = f"Error: {e}"
+            if "completado" not in result:
+                return self._finish(
+                    self.FAILED,
+                    f"{result} Se reimprimieron {self.printed} de {self.total} "
+                    f"Reportes Z.",
+                )
+            self.printed_through = end
+            print(f"Reimpresión: Reportes Z {start} a {end} reimpresos.")
+            if on_progress:
+                on_progress(self)
+            start = end + 1
+        return self._finish(
+            self.COMPLETED,
+            f"Reimpresión completada: Reportes Z {self.start_num} a {self.end_num}.",
+        )
+
+    def _finish(self, state, message):
+        self.state, self.result = state, message
+        self.finished_at = datetime.now()
+        return message
+
+    def to_dict(self):
+        def iso(value):
+            return value.isoformat(timespec="seconds") if value else None
+
+        return {
+            "id": self.id,
+            "start": self.start_num,
+            "end": self.end_num,
+            "chunk": self.chunk,
+            "state": self.state,
+            "printed": self.printed,
+            "total": self.total,
+            "progress": round(self.printed / self.total, 3),
+            "cancel_requested": self._cancel.is_set(),
+            "created_at": iso(self.created_at),
+            "finished_at": iso(self.finished_at),
+            "result": self.result,
+        }
+
+
+# Reimpresiones conocidas (en curso y terminadas recientemente), por id.
+_reprints = OrderedDict()
+_reprints_lock = threading.Lock()
+
+
+def register(reprint):
+    with _reprints_lock:
+        _reprints[reprint.id] = reprint
+        while len(_reprints) > JOB_HISTORY_SIZE:
+            oldest_id, oldest = next(iter(_reprints.items()))
+            if oldest.state == ZReprint.RUNNING:
+                break
+            del _reprints[oldest_id]
+
+
+def get(reprint_id):
+    with _reprints_lock:
+        return _reprints.get(reprint_id)
+
+
+def running():
+    """Reimpresiones en curso."""
+    with _reprints_lock:
+        return [r for r in _reprints.values() if r.state == ZReprint.RUNNING]